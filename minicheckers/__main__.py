@@ -1,17 +1,86 @@
 #!/usr/bin/env python3
-import game, square, tree
-import tkinter
+import bitboard, game, lazysmp, mcts, square, tree
+import argparse, functools, tkinter
 
-print("Mini-Checkers Game by David Tsai")
-print("CS 4613 Artificial Intelligence")
-print("Prof. Edward Wong")
-print("April 2018\n")
-root = tkinter.Tk()
-root.title("Mini-Checkers")
-root.resizable(width=False, height=False)
-square.load_images()
-application = game.Game(master=root)
-application.pack()
-root.bind("<F2>", lambda event: application.print_move_history())
-print("Press F2 in the game window for a list of moves so far in the game.\n")
-root.mainloop()
+# The processes of the Lazy SMP and MCTS searches import this module again
+# when they are spawned, so only start the game in the process that the user
+# started.
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mini-Checkers Game")
+    parser.add_argument(
+        "--board-size",
+        type=int,
+        default=game.BOARD_SIZE,
+        help="the number of squares in a row or column (default: 6)"
+    )
+    parser.add_argument(
+        "--starting-rows",
+        type=int,
+        default=None,
+        help="the number of rows of each player's pieces at the start "
+            "(default: 2 on a 6x6 board and all but the middle two rows "
+            "otherwise)"
+    )
+    parser.add_argument(
+        "--bitboard",
+        action="store_true",
+        help="use the bitboard engine, which is always used on other board "
+            "sizes"
+    )
+    parser.add_argument(
+        "--lazy-smp",
+        action="store_true",
+        help="search with the bitboard engine in one process per CPU"
+    )
+    parser.add_argument(
+        "--mcts",
+        action="store_true",
+        help="use Monte Carlo tree search with rollouts in one process per CPU"
+    )
+    arguments = parser.parse_args()
+    if arguments.starting_rows is None:
+        arguments.starting_rows = (arguments.board_size - 2) // 2
+    # The tree engine is too slow for bigger boards.
+    if arguments.mcts:
+        search_function = mcts.alpha_beta_search
+    elif arguments.lazy_smp:
+        search_function = lazysmp.alpha_beta_search
+    elif arguments.bitboard or arguments.board_size != game.BOARD_SIZE:
+        search_function = bitboard.alpha_beta_search
+    else:
+        search_function = tree.alpha_beta_search
+    # The bitboard engines evaluate states for the number of starting rows.
+    if search_function is not tree.alpha_beta_search:
+        search_function = functools.partial(
+            search_function,
+            starting_rows=arguments.starting_rows
+        )
+    
+    print("Mini-Checkers Game by David Tsai")
+    print("CS 4613 Artificial Intelligence")
+    print("Prof. Edward Wong")
+    print("April 2018\n")
+    root = tkinter.Tk()
+    root.title("Mini-Checkers")
+    root.resizable(width=False, height=False)
+    square.load_images()
+    application = game.Game(
+        master=root,
+        board_size=arguments.board_size,
+        starting_rows=arguments.starting_rows,
+        search_function=search_function
+    )
+    application.pack()
+    root.bind("<F2>", lambda event: application.print_move_history())
+    root.bind("<F3>", lambda event: application.save_game_record())
+    root.bind("<F4>", lambda event: application.print_latencies())
+    print(
+        "Press F2 in the game window for a list of moves so far in the game."
+    )
+    print(
+        "Press F3 in the game window to save the game to",
+        game.GAME_RECORD_FILE
+    )
+    print("Press F4 in the game window for the latencies of the game window.")
+    print()
+    root.mainloop()
@@ -0,0 +1,842 @@
+#!/usr/bin/env python3
+'''
+Measures the search engine on a fixed set of positions. Run this file from the
+command line with --help for a list of the benchmarks.
+'''
+import bitboard, distributed, host, lazysmp, mcts, model, tree
+import argparse, atexit, math, multiprocessing.pool, threading, time
+# Do not overwrite the saved caches with the results of the benchmarks.
+atexit.unregister(tree._cache_save)
+
+def parse_state(rows):
+    '''
+    Converts a picture of the board to a tree.State. Each string is one row.
+    "r" is a red piece, "b" is a black piece, and anything else is empty.
+    '''
+    return tree.State(
+        positions_red=frozenset(
+            tree.Place(row, column)
+            for row, line in enumerate(rows)
+            for column, c in enumerate(line)
+            if c == "r"
+        ),
+        positions_black=frozenset(
+            tree.Place(row, column)
+            for row, line in enumerate(rows)
+            for column, c in enumerate(line)
+            if c == "b"
+        )
+    )
+# Each position is a name, the board size, a State, and whether it is the red
+# player's turn.
+BENCHMARK_POSITIONS = (
+    (
+        "opening",
+        6,
+        parse_state((
+            ".r.r.r",
+            "r.r.r.",
+            "......",
+            "......",
+            ".b.b.b",
+            "b.b.b."
+        )),
+        False
+    ),
+    (
+        "middle game",
+        6,
+        parse_state((
+            ".r.r.r",
+            "..r...",
+            "...r..",
+            "..b.b.",
+            ".b...b",
+            "b.b..."
+        )),
+        True
+    ),
+    (
+        "end game",
+        6,
+        parse_state((
+            "......",
+            "....r.",
+            "...r..",
+            "b.....",
+            "...b..",
+            "....b."
+        )),
+        False
+    )
+)
+
+def time_to_depth(
+    driver,
+    board_size,
+    state,
+    turn_red,
+    max_depth,
+    keep_features=False
+):
+    '''
+    Runs one search driver at every even cutoff depth up to max_depth, starting
+    with empty caches, like alpha_beta_gradual_depth does. Yields a tuple of
+    the cutoff depth, the seconds and nodes so far, the value, and the move.
+    The nodes are only counted if tree.minimax_value.statistics is not
+    tree.StatisticsLevel.OFF. If keep_features is True, the cache of
+    tree.state_features is not emptied.
+    '''
+    features = dict(tree.state_features._cache) if keep_features else {}
+    tree.clear_caches()
+    tree.state_features._cache.update(features)
+    stop = tree.SearchToken()
+    guess = 0.0
+    start_time = time.perf_counter()
+    for cutoff_depth in range(2, max_depth + 1, 2):
+        if driver == tree.SearchDriver.MTDF:
+            v, v_move, max_depth = tree.mtdf_value(
+                cutoff_depth,
+                stop,
+                turn_red,
+                0,
+                board_size,
+                state,
+                guess
+            )
+            guess = v
+        else:
+            v, v_move, max_depth = tree.minimax_value(
+                cutoff_depth,
+                stop,
+                turn_red,
+                0,
+                board_size,
+                state,
+                tree.UTILITY_VALUES_TERMINAL[tree.GameEnd.WIN_BLACK],
+                tree.UTILITY_VALUES_TERMINAL[tree.GameEnd.WIN_RED]
+            )
+        yield (
+            cutoff_depth,
+            time.perf_counter() - start_time,
+            stop.statistics().nodes,
+            v,
+            v_move
+        )
+def benchmark_distributed(max_depth):
+    '''
+    Reports the time to each cutoff depth of a distributed search with
+    different numbers of local worker processes on the loopback interface,
+    and the speedup over the serial search. Each search starts with empty
+    caches in the coordinator and in new workers.
+    '''
+    for name, board_size, state, turn_red in BENCHMARK_POSITIONS:
+        print("Position:", name)
+        serial = {
+            cutoff_depth: seconds
+            for cutoff_depth, seconds, *_ in time_to_depth(
+                tree.SearchDriver.ALPHA_BETA,
+                board_size,
+                state,
+                turn_red,
+                max_depth
+            )
+        }
+        for workers in DISTRIBUTED_WORKERS:
+            tree.clear_caches()
+            coordinator = distributed.Coordinator()
+            processes = distributed.start_local_workers(
+                coordinator.address,
+                workers
+            )
+            coordinator.wait_for_workers(workers)
+            for cutoff_depth, seconds, v, v_move, nodes in \
+                distributed.distributed_search(
+                    coordinator,
+                    board_size,
+                    state,
+                    turn_red,
+                    max_depth
+                ):
+                print(
+                    "{:>2} workers depth {:>2}: {:>8.3f} seconds, "
+                    "{:>8} nodes, speedup = {:>5.2f}, value = {:>7.3f}".format(
+                        workers,
+                        cutoff_depth,
+                        seconds,
+                        nodes,
+                        serial[cutoff_depth] / seconds,
+                        v
+                    )
+                )
+            coordinator.close()
+            for process in processes:
+                process.join()
+def benchmark_drivers(max_depth):
+    '''
+    Compares the nodes and the time to each depth of the search drivers.
+    '''
+    for name, board_size, state, turn_red in BENCHMARK_POSITIONS:
+        print("Position:", name)
+        for driver in tree.SearchDriver:
+            for cutoff_depth, seconds, nodes, v, v_move in time_to_depth(
+                driver,
+                board_size,
+                state,
+                turn_red,
+                max_depth
+            ):
+                print(
+                    "{:>10} depth {:>2}: {:>8.3f} seconds, {:>8} nodes, "
+                    "value = {:>7.3f}, move = {}".format(
+                        driver.name,
+                        cutoff_depth,
+                        seconds,
+                        nodes,
+                        v,
+                        v_move
+                    )
+                )
+def bitboard_time_to_depth(board_size, state, turn_red, max_depth):
+    '''
+    This is time_to_depth for the bitboard engine.
+    '''
+    config = bitboard.get_config(board_size)
+    red, black = config.from_state(state)
+    nodes = 0
+    start_time = time.perf_counter()
+    for cutoff_depth in range(2, max_depth + 1, 2):
+        counter = [0]
+        v, v_move = config.search(
+            red,
+            black,
+            turn_red,
+            0,
+            cutoff_depth,
+            -math.inf,
+            math.inf,
+            tree.evaluate_state.weights,
+            counter
+        )
+        nodes += counter[0]
+        yield (
+            cutoff_depth,
+            time.perf_counter() - start_time,
+            nodes,
+            v,
+            v_move and config.to_move(v_move)
+        )
+def benchmark_sizes(max_depth):
+    '''
+    Compares how the nodes per second and the time to each depth of the tree
+    engine and the bitboard engine change with the size of the board. Each
+    search starts from the starting position with black to move.
+    '''
+    for board_size in BOARD_SIZES:
+        config = bitboard.get_config(board_size)
+        state = config.to_state(*config.starting_position())
+        print("Board size:", board_size)
+        for name, results in (
+            (
+                "tree",
+                time_to_depth(
+                    tree.SearchDriver.ALPHA_BETA,
+                    board_size,
+                    state,
+                    False,
+                    max_depth
+                )
+            ),
+            (
+                "bitboard",
+                bitboard_time_to_depth(board_size, state, False, max_depth)
+            )
+        ):
+            for cutoff_depth, seconds, nodes, v, v_move in results:
+                print(
+                    "{:>10} depth {:>2}: {:>8.3f} seconds, {:>8} nodes, "
+                    "{:>8.0f} nodes/second".format(
+                        name,
+                        cutoff_depth,
+                        seconds,
+                        nodes,
+                        nodes / seconds if seconds else math.inf
+                    )
+                )
+def rotate_state(board_size, state):
+    '''
+    Turns the board around and swaps the colors of the pieces. The result is
+    just as good for the other player as the state was for the current player.
+    '''
+    def rotate(positions):
+        return frozenset(
+            tree.transform_place(board_size, place, True, True)
+            for place in positions
+        )
+    return tree.State(
+        positions_red=rotate(state.positions_black),
+        positions_black=rotate(state.positions_red)
+    )
+def benchmark_symmetry(max_depth):
+    '''
+    Searches each position and then the same position turned around with the
+    colors swapped, with and without symmetric cache keys, in the same way as
+    alpha_beta_search. Reports the time of each search and the number of
+    entries in the caches.
+    '''
+    tree.alpha_beta_gradual_depth.cutoff_depth_start = 2
+    tree.alpha_beta_gradual_depth.cutoff_depth_stop = max_depth + 1
+    for name, board_size, state, turn_red in BENCHMARK_POSITIONS:
+        print("Position:", name)
+        for symmetry in (False, True):
+            tree.minimax_value.symmetry = symmetry
+            tree.clear_caches()
+            seconds = []
+            for s, t in (
+                (state, turn_red),
+                (rotate_state(board_size, state), not turn_red)
+            ):
+                start_time = time.perf_counter()
+                tree.alpha_beta_gradual_depth(
+                    [],
+                    threading.Condition(),
+                    tree.SearchToken(),
+                    threading.Event(),
+                    t,
+                    0,
+                    board_size,
+                    s,
+                    tree.UTILITY_VALUES_TERMINAL[tree.GameEnd.WIN_BLACK],
+                    tree.UTILITY_VALUES_TERMINAL[tree.GameEnd.WIN_RED]
+                )
+                seconds.append(time.perf_counter() - start_time)
+            print(
+                "{:>10}: {:>8.3f} seconds, then {:>8.3f} seconds for the "
+                "rotated position, {:>7} + {:>3} cache entries".format(
+                    "symmetric" if symmetry else "plain",
+                    seconds[0],
+                    seconds[1],
+                    len(tree.minimax_value._cache),
+                    len(tree.alpha_beta_gradual_depth._cache)
+                )
+            )
+def benchmark_features(max_depth):
+    '''
+    Searches each position with every difficulty in turn, as a tournament
+    between the difficulties would, and compares the times when the cache of
+    tree.state_features is emptied before each search and when it is shared
+    by the difficulties.
+    '''
+    weights_default = tree.evaluate_state.weights
+    for name, board_size, state, turn_red in BENCHMARK_POSITIONS:
+        print("Position:", name)
+        for keep_features in (False, True):
+            total = 0.0
+            for difficulty in tree.AIDifficulty:
+                tree.set_difficulty(difficulty)
+                *_, (cutoff_depth, seconds, nodes, v, v_move) = time_to_depth(
+                    tree.SearchDriver.ALPHA_BETA,
+                    board_size,
+                    state,
+                    turn_red,
+                    max_depth,
+                    keep_features
+                )
+                total += seconds
+                print(
+                    "{:>6} features {:>6} depth {:>2}: {:>8.3f} seconds, "
+                    "value = {:>7.3f}".format(
+                        "shared" if keep_features else "fresh",
+                        difficulty.name,
+                        cutoff_depth,
+                        seconds,
+                        v
+                    )
+                )
+            print(
+                "{:>6} features total: {:>8.3f} seconds".format(
+                    "shared" if keep_features else "fresh",
+                    total
+                )
+            )
+    tree.evaluate_state.weights = weights_default
+def benchmark_host(max_depth):
+    '''
+    Runs searches for several games at once on an EngineHost with different
+    numbers of worker threads, and reports the moves and nodes per second
+    across all of the games. Each search is limited to one second, so more
+    moves per second only means that more searches ran at once; the nodes per
+    second show whether they ran in parallel. max_depth is not used.
+    '''
+    for workers in HOST_WORKERS:
+        tree.clear_caches()
+        engine_host = host.EngineHost(workers, time_limit=1.0)
+        sessions = [engine_host.open_session() for i in range(HOST_SESSIONS)]
+        start_time = time.perf_counter()
+        futures = [
+            session.search(board_size, state, turn_red)
+            for session in sessions
+            for name, board_size, state, turn_red in BENCHMARK_POSITIONS
+        ]
+        for future in futures:
+            future.result()
+        seconds = time.perf_counter() - start_time
+        engine_host.shutdown()
+        print(
+            "{:>2} workers: {:>6.2f} moves/second, {:>8.0f} nodes/second "
+            "across {} games".format(
+                workers,
+                sum(s.statistics.moves for s in sessions) / seconds,
+                sum(s.statistics.nodes for s in sessions) / seconds,
+                len(sessions)
+            )
+        )
+def benchmark_statistics(max_depth):
+    '''
+    Compares the time to max_depth at each level of statistics. Each search is
+    repeated STATISTICS_REPEATS times, and the fastest time is reported.
+    '''
+    level_default = tree.minimax_value.statistics
+    for name, board_size, state, turn_red in BENCHMARK_POSITIONS:
+        print("Position:", name)
+        for level in tree.StatisticsLevel:
+            tree.minimax_value.statistics = level
+            seconds = math.inf
+            for i in range(STATISTICS_REPEATS):
+                *_, (cutoff_depth, s, nodes, v, v_move) = time_to_depth(
+                    tree.SearchDriver.ALPHA_BETA,
+                    board_size,
+                    state,
+                    turn_red,
+                    max_depth
+                )
+                seconds = min(seconds, s)
+            print(
+                "{:>10} depth {:>2}: {:>8.3f} seconds, {:>8} nodes counted, "
+                "value = {:>7.3f}".format(
+                    level.name,
+                    cutoff_depth,
+                    seconds,
+                    nodes,
+                    v
+                )
+            )
+    tree.minimax_value.statistics = level_default
+def benchmark_parallel(max_depth):
+    '''
+    Compares the time to max_depth of the Young Brothers Wait search with
+    different numbers of helper threads, in the normal and the deterministic
+    mode, and without splitting.
+    '''
+    split_depth_default = tree.younger_brothers_value.split_depth
+    helpers_default = tree.younger_brothers_value.helpers
+    pool_default = tree.younger_brothers_value.pool
+    deterministic_default = tree.younger_brothers_value.deterministic
+    for name, board_size, state, turn_red in BENCHMARK_POSITIONS:
+        print("Position:", name)
+        for helpers, deterministic in ((0, False),) + tuple(
+            (helpers, deterministic)
+            for deterministic in (False, True)
+            for helpers in PARALLEL_HELPERS
+        ):
+            tree.younger_brothers_value.deterministic = deterministic
+            if helpers:
+                tree.younger_brothers_value.split_depth = split_depth_default
+                tree.younger_brothers_value.helpers = helpers
+                tree.younger_brothers_value.pool = \
+                    multiprocessing.pool.ThreadPool(helpers)
+            else:
+                tree.younger_brothers_value.split_depth = 0
+            *_, (cutoff_depth, seconds, nodes, v, v_move) = time_to_depth(
+                tree.SearchDriver.ALPHA_BETA,
+                board_size,
+                state,
+                turn_red,
+                max_depth
+            )
+            if helpers:
+                tree.younger_brothers_value.pool.terminate()
+            print(
+                "{:>24} depth {:>2}: {:>8.3f} seconds, {:>8} nodes, "
+                "value = {:>7.3f}, move = {}".format(
+                    "{} threads{}".format(
+                        helpers,
+                        ", deterministic" if deterministic else ""
+                    ) if helpers else "serial",
+                    cutoff_depth,
+                    seconds,
+                    nodes,
+                    v,
+                    v_move
+                )
+            )
+    tree.younger_brothers_value.split_depth = split_depth_default
+    tree.younger_brothers_value.helpers = helpers_default
+    tree.younger_brothers_value.pool = pool_default
+    tree.younger_brothers_value.deterministic = deterministic_default
+def benchmark_threads(max_depth):
+    '''
+    Reports the time to max_depth of the Young Brothers Wait search with
+    different numbers of helper threads, with dictionaries and with sharded
+    caches, and the speedup over one thread with dictionaries. Threads only
+    run at the same time on a free-threaded build of Python; on other builds,
+    this shows what the shards cost.
+    '''
+    print(
+        "This build of Python is {}.".format(
+            "free-threaded" if tree.free_threaded() else
+                "not free-threaded"
+        )
+    )
+    shards_default = tree.CacheShards
+    helpers_default = tree.younger_brothers_value.helpers
+    pool_default = tree.younger_brothers_value.pool
+    try:
+        for name, board_size, state, turn_red in BENCHMARK_POSITIONS:
+            print("Position:", name)
+            times = {}
+            for shards in THREAD_CACHE_SHARDS:
+                tree.set_cache_shards(shards)
+                for helpers in PARALLEL_HELPERS:
+                    tree.younger_brothers_value.helpers = helpers
+                    tree.younger_brothers_value.pool = \
+                        multiprocessing.pool.ThreadPool(helpers)
+                    *_, (cutoff_depth, seconds, nodes, v, v_move) = \
+                        time_to_depth(
+                            tree.SearchDriver.ALPHA_BETA,
+                            board_size,
+                            state,
+                            turn_red,
+                            max_depth
+                        )
+                    tree.younger_brothers_value.pool.terminate()
+                    times[shards, helpers] = seconds
+                    print(
+                        "{:>13}, {} threads depth {:>2}: {:>8.3f} seconds, "
+                        "{:>8} nodes, speedup = {:>5.2f}".format(
+                            "{} shards".format(shards) if shards else
+                                "dictionaries",
+                            helpers,
+                            cutoff_depth,
+                            seconds,
+                            nodes,
+                            times.get(
+                                (THREAD_CACHE_SHARDS[0], PARALLEL_HELPERS[0]),
+                                math.nan
+                            ) / seconds
+                        )
+                    )
+    finally:
+        tree.set_cache_shards(shards_default)
+        tree.younger_brothers_value.helpers = helpers_default
+        tree.younger_brothers_value.pool = pool_default
+def benchmark_lazysmp(max_depth):
+    '''
+    Reports the time until any Lazy SMP worker finishes each cutoff depth with
+    different numbers of processes, and the speedup over one process. The
+    times include starting the processes.
+    '''
+    for name, board_size, state, turn_red in BENCHMARK_POSITIONS:
+        print("Position:", name)
+        times = {}
+        for processes in LAZY_SMP_PROCESSES:
+            results = lazysmp.lazy_smp_search(
+                board_size,
+                state,
+                turn_red,
+                processes,
+                max_depth=max_depth
+            )
+            for r in sorted(results, key=lambda r: r.seconds):
+                times.setdefault((processes, r.cutoff_depth), r.seconds)
+            for cutoff_depth in range(2, max_depth + 1, 2):
+                if (processes, cutoff_depth) not in times:
+                    continue
+                seconds = times[processes, cutoff_depth]
+                print(
+                    "{:>2} processes depth {:>2}: {:>8.3f} seconds, "
+                    "speedup = {:>5.2f}".format(
+                        processes,
+                        cutoff_depth,
+                        seconds,
+                        times.get((1, cutoff_depth), math.nan) / seconds
+                    )
+                )
+def lazysmp_move(processes, seconds):
+    '''
+    Returns a function that picks a move for play_game with Lazy SMP.
+    '''
+    def choose(board_size, state, turn_red, legal_moves):
+        results = lazysmp.lazy_smp_search(
+            board_size,
+            state,
+            turn_red,
+            processes,
+            seconds
+        )
+        if not results:
+            return legal_moves[0]
+        config = bitboard.get_config(board_size)
+        return config.to_move(
+            max(results, key=lambda r: r.cutoff_depth).move
+        )
+    return choose
+def mcts_move(processes, seconds):
+    '''
+    Returns a function that picks a move for play_game with Monte Carlo tree
+    search.
+    '''
+    def choose(board_size, state, turn_red, legal_moves):
+        move = mcts.mcts_search(
+            board_size,
+            state,
+            turn_red,
+            processes,
+            seconds
+        ).move
+        return legal_moves[0] if move is None else move
+    return choose
+def alpha_beta_move(seconds):
+    '''
+    Returns a function that picks a move for play_game with
+    tree.alpha_beta_search and a time limit of seconds.
+    '''
+    def choose(board_size, state, turn_red, legal_moves):
+        time_limit = tree.SearchTimeLimit
+        tree.SearchTimeLimit = seconds
+        try:
+            move = tree.alpha_beta_search(board_size, state, turn_red)[1]
+        finally:
+            tree.SearchTimeLimit = time_limit
+        return legal_moves[0] if move is None else move
+    return choose
+def play_game(board_size, starting_rows, choose_red, choose_black):
+    '''
+    Plays one game from the starting position, with black moving first.
+    
+    Arguments:
+        board_size:
+            the number of squares in a row or column on the board
+        starting_rows:
+            the number of rows of each player's pieces at the start
+        choose_red, choose_black:
+            functions that take the board size, the tree.State, whether it is
+            the red player's turn, and a tuple of the legal moves, and return
+            the tree.Move to make
+    
+    Returns:
+        A member of the tree.GameEnd enum
+    '''
+    game = model.GameModel(board_size, starting_rows)
+    while game.game_ended() == tree.GameEnd.NOT_ENDED:
+        legal_moves = tuple(
+            move
+            for moves_from_place in game.legal_moves.values()
+            for move in moves_from_place
+        )
+        if not legal_moves:
+            game.pass_turn()
+        elif len(legal_moves) == 1:
+            game.apply_move(legal_moves[0])
+        else:
+            choose = choose_red if game.turn_red else choose_black
+            game.apply_move(
+                choose(board_size, game.state, game.turn_red, legal_moves)
+            )
+    return game.game_ended()
+def benchmark_mcts(max_depth):
+    '''
+    Plays Monte Carlo tree search against alpha-beta search with the same
+    number of processes and the same time for each move, once with each color,
+    and reports the score of Monte Carlo tree search. With one process, the
+    opponent is tree.alpha_beta_search; with more, it is Lazy SMP, which is
+    the alpha-beta search that uses more than one process. The depth is not
+    used because both engines search until the time is up.
+    '''
+    for processes in MCTS_PROCESSES:
+        if processes == 1:
+            opponent = "alpha-beta search"
+            opponent_move = alpha_beta_move(MCTS_MOVE_SECONDS)
+        else:
+            opponent = "Lazy SMP"
+            opponent_move = lazysmp_move(processes, MCTS_MOVE_SECONDS)
+        score = 0.0
+        try:
+            for mcts_red in (True, False):
+                players = (
+                    mcts_move(processes, MCTS_MOVE_SECONDS),
+                    opponent_move
+                )
+                result = play_game(
+                    6,
+                    2,
+                    *(players if mcts_red else reversed(players))
+                )
+                reward_red = mcts.REWARDS_RED[result]
+                score += reward_red if mcts_red else 1.0 - reward_red
+                print(
+                    "{:>2} processes, MCTS plays {}: {}".format(
+                        processes,
+                        "red" if mcts_red else "black",
+                        result.name
+                    )
+                )
+        finally:
+            mcts.close_pools()
+        print(
+            "{:>2} processes: MCTS scored {} of 2 against {}".format(
+                processes,
+                score,
+                opponent
+            )
+        )
+def tree_move(seconds, late_move_reductions, futility_pruning, depths):
+    '''
+    Returns a function that picks a move for play_game with tree.search_result
+    and the given switches of tree.minimax_value. Each function keeps its own
+    cache of tree.alpha_beta_gradual_depth because the results depend on the
+    switches. The cutoff depth of each move is appended to depths.
+    '''
+    cache = tree.new_cache()
+    def choose(board_size, state, turn_red, legal_moves):
+        tree.minimax_value.late_move_reductions = late_move_reductions
+        tree.minimax_value.futility_pruning = futility_pruning
+        tree.alpha_beta_gradual_depth._cache = cache
+        result = tree.search_result(
+            board_size,
+            state,
+            turn_red,
+            tree.SearchToken(),
+            time_limit=seconds
+        )
+        if result is None or result[1][1] is None:
+            return legal_moves[0]
+        depths.append(result[0])
+        return result[1][1]
+    return choose
+def benchmark_selective(max_depth):
+    '''
+    Compares the time to max_depth with late move reductions and futility
+    pruning turned on and off. Then each selective search plays the full
+    search from the same time for each move, once with each color, and the
+    score and the average cutoff depth of each side are reported.
+    '''
+    switches = (
+        tree.minimax_value.late_move_reductions,
+        tree.minimax_value.futility_pruning
+    )
+    try:
+        for name, board_size, state, turn_red in BENCHMARK_POSITIONS:
+            print("Position:", name)
+            for late_move_reductions, futility_pruning in SELECTIVE_SWITCHES:
+                tree.minimax_value.late_move_reductions = late_move_reductions
+                tree.minimax_value.futility_pruning = futility_pruning
+                for cutoff_depth, seconds, nodes, v, v_move in time_to_depth(
+                    tree.SearchDriver.ALPHA_BETA,
+                    board_size,
+                    state,
+                    turn_red,
+                    max_depth
+                ):
+                    pass
+                print(
+                    "LMR {:>3}, futility {:>3}: depth {:>2} in {:>8.3f} "
+                    "seconds, {:>8} nodes, value = {:>7.3f}, move = {}".format(
+                        "on" if late_move_reductions else "off",
+                        "on" if futility_pruning else "off",
+                        cutoff_depth,
+                        seconds,
+                        nodes,
+                        v,
+                        v_move
+                    )
+                )
+        for late_move_reductions, futility_pruning in SELECTIVE_SWITCHES[1:]:
+            score = 0.0
+            depths_selective = []
+            depths_full = []
+            for selective_red in (True, False):
+                tree.clear_caches()
+                players = (
+                    tree_move(
+                        SELECTIVE_MOVE_SECONDS,
+                        late_move_reductions,
+                        futility_pruning,
+                        depths_selective
+                    ),
+                    tree_move(
+                        SELECTIVE_MOVE_SECONDS,
+                        False,
+                        False,
+                        depths_full
+                    )
+                )
+                result = play_game(
+                    6,
+                    2,
+                    *(players if selective_red else reversed(players))
+                )
+                reward_red = mcts.REWARDS_RED[result]
+                score += reward_red if selective_red else 1.0 - reward_red
+            print(
+                "LMR {:>3}, futility {:>3}: scored {} of 2 against the full "
+                "search, average depth {:>5.2f} against {:>5.2f}".format(
+                    "on" if late_move_reductions else "off",
+                    "on" if futility_pruning else "off",
+                    score,
+                    sum(depths_selective) / max(1, len(depths_selective)),
+                    sum(depths_full) / max(1, len(depths_full))
+                )
+            )
+    finally:
+        (
+            tree.minimax_value.late_move_reductions,
+            tree.minimax_value.futility_pruning
+        ) = switches
+        tree.clear_caches()
+BOARD_SIZES = (6, 8, 10)
+DISTRIBUTED_WORKERS = (1, 2, 4)
+HOST_WORKERS = (1, 2, 4)
+HOST_SESSIONS = 4
+LAZY_SMP_PROCESSES = (1, 2, 4)
+MCTS_MOVE_SECONDS = 0.5
+MCTS_PROCESSES = (1, 4, 16)
+PARALLEL_HELPERS = (1, 2, 4)
+SELECTIVE_MOVE_SECONDS = 1.0
+# Each pair is whether late move reductions and futility pruning are on. The
+# first pair is the full search.
+SELECTIVE_SWITCHES = (
+    (False, False),
+    (True, False),
+    (False, True),
+    (True, True)
+)
+STATISTICS_REPEATS = 3
+# None is dictionaries.
+THREAD_CACHE_SHARDS = (None, 64)
+BENCHMARKS = {
+    "distributed": benchmark_distributed,
+    "drivers": benchmark_drivers,
+    "features": benchmark_features,
+    "host": benchmark_host,
+    "lazysmp": benchmark_lazysmp,
+    "mcts": benchmark_mcts,
+    "parallel": benchmark_parallel,
+    "selective": benchmark_selective,
+    "sizes": benchmark_sizes,
+    "statistics": benchmark_statistics,
+    "symmetry": benchmark_symmetry,
+    "threads": benchmark_threads
+}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("benchmark", choices=sorted(BENCHMARKS))
+    parser.add_argument(
+        "--depth",
+        type=int,
+        default=8,
+        help="the deepest cutoff depth to search (default: 8)"
+    )
+    arguments = parser.parse_args()
+    BENCHMARKS[arguments.benchmark](arguments.depth)
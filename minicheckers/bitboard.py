@@ -0,0 +1,523 @@
+#!/usr/bin/env python3
+'''
+This module is a faster version of the search engine in tree. It works on any
+board size. The positions of each player's pieces are stored in one int, in
+which bit (row * board_size + column) is set if there is a piece there. Python
+ints can be as wide as needed, so the same code handles 6x6, 8x8, and 10x10
+boards. Everything that depends on the board size is computed once by
+BitboardConfig.
+'''
+import tree
+import math, threading, time
+
+def popcount(bits):
+    '''
+    Returns the number of bits that are set in a non-negative int.
+    '''
+    return bin(bits).count("1")
+def shift(bits, amount):
+    '''
+    Shifts bits to the left if amount is positive and to the right if it is
+    negative.
+    '''
+    return bits << amount if amount > 0 else bits >> -amount
+def iterate_bits(bits):
+    '''
+    Generates the index of every bit that is set in a non-negative int, from
+    the lowest to the highest.
+    '''
+    while bits:
+        low = bits & -bits
+        yield low.bit_length() - 1
+        bits ^= low
+
+class BitboardConfig:
+    '''
+    This class holds the tables for one board size and number of starting
+    rows. A position is a pair of ints, red and black. A move is a tuple of the
+    index of the origin, the index of the destination, and the index of the
+    captured piece (or None).
+    '''
+    def __init__(self, board_size, starting_rows=None):
+        '''
+        Arguments:
+            board_size:
+                the number of squares in a row or column on the board
+            starting_rows:
+                the number of rows that are filled with one player's pieces at
+                the start of the game (by default, all but the middle two rows)
+        '''
+        if starting_rows is None:
+            starting_rows = (board_size - 2) // 2
+        if not 0 < starting_rows <= board_size // 2:
+            raise ValueError("Each player is limited to half the board.")
+        n = board_size
+        self.board_size = n
+        self.starting_rows = starting_rows
+        self.full = (1 << (n * n)) - 1
+        self.row_masks = tuple(
+            ((1 << n) - 1) << (row * n) for row in range(n)
+        )
+        self.column_masks = tuple(
+            sum(1 << (row * n + column) for row in range(n))
+            for column in range(n)
+        )
+        not_left = self.full & ~self.column_masks[0]
+        not_right = self.full & ~self.column_masks[-1]
+        not_left_2 = not_left & ~self.column_masks[min(1, n - 1)]
+        not_right_2 = not_right & ~self.column_masks[max(n - 2, 0)]
+        # Each direction is the shift to the adjacent square, the pieces that
+        # can step that way, and the pieces that can jump that way.
+        self.directions_red = (
+            (n - 1, not_left, not_left_2),
+            (n + 1, not_right, not_right_2)
+        )
+        self.directions_black = (
+            (-n - 1, not_left, not_left_2),
+            (-n + 1, not_right, not_right_2)
+        )
+        # These are used to count the pieces that cannot be captured because
+        # the spaces behind them are occupied or not on the board. Each entry
+        # is the pieces whose space behind is off the board, the shift from
+        # the space behind to the piece, and the spaces behind that can be on
+        # the board.
+        top = self.row_masks[0]
+        bottom = self.row_masks[-1]
+        self.behind_red = (
+            (top | self.column_masks[0], n + 1, not_right),
+            (top | self.column_masks[-1], n - 1, not_left)
+        )
+        self.behind_black = (
+            (bottom | self.column_masks[0], -(n - 1), not_right),
+            (bottom | self.column_masks[-1], -(n + 1), not_left)
+        )
+        # These are the same constants as in tree.evaluate_state.
+        self.limit = (n // 2) ** 2 + math.ceil(n / 2) ** 2
+        self.middle = (n - 1) / 2.0
+        self.column_values = tuple(
+            self.middle - abs(column - self.middle) for column in range(n)
+        )
+        # The weights were chosen for a 6x6 board with 6 pieces per player.
+        # The heuristics that add something up for every piece are scaled so
+        # that they have the same range on bigger boards.
+        pieces = popcount(self.starting_position()[0])
+        self.normalization = 6 / pieces
+    def starting_position(self):
+        '''
+        Returns the red and black ints at the start of a game.
+        '''
+        n = self.board_size
+        red = 0
+        black = 0
+        for row in range(self.starting_rows):
+            for column in range((row + 1) % 2, n, 2):
+                red |= 1 << (row * n + column)
+        for row in range(n - self.starting_rows, n):
+            for column in range((row + 1) % 2, n, 2):
+                black |= 1 << (row * n + column)
+        return red, black
+    def from_state(self, state):
+        '''
+        Converts a tree.State to a pair of red and black ints.
+        '''
+        n = self.board_size
+        return (
+            sum(1 << (p.row * n + p.column) for p in state.positions_red),
+            sum(1 << (p.row * n + p.column) for p in state.positions_black)
+        )
+    def to_place(self, index):
+        return tree.Place(*divmod(index, self.board_size))
+    def to_state(self, red, black):
+        '''
+        Converts a pair of red and black ints to a tree.State.
+        '''
+        return tree.State(
+            positions_red=frozenset(map(self.to_place, iterate_bits(red))),
+            positions_black=frozenset(map(self.to_place, iterate_bits(black)))
+        )
+    def from_move(self, move):
+        '''
+        Converts a tree.Move to a move tuple.
+        '''
+        n = self.board_size
+        return (
+            move.place_from.row * n + move.place_from.column,
+            move.place_to.row * n + move.place_to.column,
+            None if move.place_capture is None else
+                move.place_capture.row * n + move.place_capture.column
+        )
+    def to_move(self, move):
+        '''
+        Converts a move tuple to a tree.Move.
+        '''
+        index_from, index_to, index_capture = move
+        return tree.Move(
+            self.to_place(index_from),
+            self.to_place(index_to),
+            None if index_capture is None else self.to_place(index_capture)
+        )
+    def moves(self, red, black, turn_red):
+        '''
+        Returns a tuple of the legal moves for the current player. Like
+        tree.legal_moves, if any capture is possible, only captures are
+        returned.
+        '''
+        empty = self.full & ~(red | black)
+        if turn_red:
+            own, other, directions = red, black, self.directions_red
+        else:
+            own, other, directions = black, red, self.directions_black
+        result = []
+        for amount, _, can_jump in directions:
+            landings = \
+                shift(shift(own & can_jump, amount) & other, amount) & empty
+            for index_to in iterate_bits(landings):
+                result.append(
+                    (index_to - 2 * amount, index_to, index_to - amount)
+                )
+        if result:
+            return tuple(result)
+        for amount, can_step, _ in directions:
+            for index_to in iterate_bits(shift(own & can_step, amount) & empty):
+                result.append((index_to - amount, index_to, None))
+        return tuple(result)
+    def move_counts(self, red, black, turn_red):
+        '''
+        Returns the number of legal moves for a player and the number of them
+        that are captures, without making a list of the moves.
+        '''
+        empty = self.full & ~(red | black)
+        if turn_red:
+            own, other, directions = red, black, self.directions_red
+        else:
+            own, other, directions = black, red, self.directions_black
+        captures = 0
+        for amount, _, can_jump in directions:
+            captures += popcount(
+                shift(shift(own & can_jump, amount) & other, amount) & empty
+            )
+        if captures:
+            return captures, captures
+        return sum(
+            popcount(shift(own & can_step, amount) & empty)
+            for amount, can_step, _ in directions
+        ), 0
+    def apply(self, red, black, move):
+        '''
+        Applies a move and returns the new red and black ints.
+        '''
+        index_from, index_to, index_capture = move
+        bit_from = 1 << index_from
+        bit_to = 1 << index_to
+        if red & bit_from:
+            red = red ^ bit_from | bit_to
+            if index_capture is not None:
+                black &= ~(1 << index_capture)
+        else:
+            black = black ^ bit_from | bit_to
+            if index_capture is not None:
+                red &= ~(1 << index_capture)
+        return red, black
+    def game_ended(self, red, black):
+        '''
+        Returns a member of the tree.GameEnd enum, like tree.game_ended.
+        '''
+        if not black:
+            return tree.GameEnd.WIN_RED
+        if not red:
+            return tree.GameEnd.WIN_BLACK
+        if not self.move_counts(red, black, False)[0] and \
+            not self.move_counts(red, black, True)[0]:
+            num_red = popcount(red)
+            num_black = popcount(black)
+            if num_black > num_red:
+                return tree.GameEnd.WIN_BLACK
+            if num_black < num_red:
+                return tree.GameEnd.WIN_RED
+            return tree.GameEnd.DRAW
+        return tree.GameEnd.NOT_ENDED
+    def features(self, red, black):
+        '''
+        Returns the six heuristics of tree.evaluate_state, before they are
+        multiplied by the weights.
+        '''
+        occupied = red | black
+        limit = self.limit
+        middle = self.middle
+        num_moves_red, num_captures_red = self.move_counts(red, black, True)
+        num_moves_black, num_captures_black = \
+            self.move_counts(red, black, False)
+        num_friends_red = 0
+        for off_board, amount, can_be_on_board in self.behind_red:
+            num_friends_red += popcount(red & off_board) + popcount(
+                shift(occupied & can_be_on_board, amount) & red & ~off_board
+            )
+        num_friends_black = 0
+        for off_board, amount, can_be_on_board in self.behind_black:
+            num_friends_black += popcount(black & off_board) + popcount(
+                shift(occupied & can_be_on_board, amount) & black & ~off_board
+            )
+        rows = 0
+        pieces = 0
+        for row, mask in enumerate(self.row_masks):
+            count = popcount(occupied & mask)
+            rows += row * count
+            pieces += count
+        columns = 0.0
+        for value, mask in zip(self.column_values, self.column_masks):
+            columns += value * (popcount(red & mask) - popcount(black & mask))
+        return (
+            tree.log_fraction_safe(
+                popcount(red),
+                popcount(black),
+                -limit,
+                limit
+            ),
+            tree.log_fraction_safe(
+                num_friends_red,
+                num_friends_black,
+                -limit,
+                limit
+            ),
+            tree.log_fraction_safe(
+                num_captures_red,
+                num_captures_black,
+                -limit,
+                limit
+            ),
+            tree.log_fraction_safe(
+                num_moves_red,
+                num_moves_black,
+                -limit,
+                limit
+            ),
+            (pieces * middle - rows) / middle * self.normalization,
+            columns / middle * self.normalization
+        )
+    def evaluate(self, red, black, weights):
+        '''
+        Returns the heuristic value of a position for the given weights.
+        Higher values favor the red player.
+        '''
+        return sum(
+            feature * weight
+            for feature, weight in zip(self.features(red, black), weights)
+        )
+    def quiescence(self, red, black, turn_red, alpha, beta, weights, counter):
+        '''
+        This is tree.quiescence_value for bitboards. Only the value is
+        returned. counter is a list whose first item is the number of nodes.
+        '''
+        counter[0] += 1
+        if not black:
+            return math.inf
+        if not red:
+            return -math.inf
+        moves = self.moves(red, black, turn_red)
+        if not moves:
+            if self.game_ended(red, black) != tree.GameEnd.NOT_ENDED:
+                return tree.UTILITY_VALUES_TERMINAL[
+                    self.game_ended(red, black)
+                ]
+            return self.evaluate(red, black, weights)
+        if moves[0][2] is None:
+            return self.evaluate(red, black, weights)
+        v = -math.inf if turn_red else math.inf
+        for move in moves:
+            v_new = self.quiescence(
+                *self.apply(red, black, move),
+                not turn_red,
+                alpha,
+                beta,
+                weights,
+                counter
+            )
+            if turn_red:
+                v = max(v, v_new)
+                if v >= beta:
+                    break
+                alpha = max(alpha, v)
+            else:
+                v = min(v, v_new)
+                if v <= alpha:
+                    break
+                beta = min(beta, v)
+        return v
+    def search(
+        self,
+        red,
+        black,
+        turn_red,
+        depth,
+        cutoff_depth,
+        alpha,
+        beta,
+        weights,
+        counter,
+        stop=None
+    ):
+        '''
+        This is tree.minimax_value for bitboards, without the caches. It
+        returns the value and the best move (None if no move was made).
+        counter is a list whose first item is the number of nodes. If stop is
+        a threading.Event and it is set, the return values are not valid.
+        '''
+        if stop is not None and stop.is_set():
+            return 0.0, None
+        if not black:
+            counter[0] += 1
+            return math.inf, None
+        if not red:
+            counter[0] += 1
+            return -math.inf, None
+        moves = self.moves(red, black, turn_red)
+        if not moves:
+            terminal = self.game_ended(red, black)
+            if terminal != tree.GameEnd.NOT_ENDED:
+                counter[0] += 1
+                return tree.UTILITY_VALUES_TERMINAL[terminal], None
+        if depth >= cutoff_depth:
+            return self.quiescence(
+                red,
+                black,
+                turn_red,
+                alpha,
+                beta,
+                weights,
+                counter
+            ), None
+        counter[0] += 1
+        # If no actions are possible, this turn is forfeited.
+        if not moves:
+            return self.search(
+                red,
+                black,
+                not turn_red,
+                depth + 1,
+                cutoff_depth,
+                alpha,
+                beta,
+                weights,
+                counter,
+                stop
+            )[0], None
+        v = -math.inf if turn_red else math.inf
+        v_move = moves[0]
+        for move in moves:
+            v_new, _ = self.search(
+                *self.apply(red, black, move),
+                not turn_red,
+                depth + 1,
+                cutoff_depth,
+                alpha,
+                beta,
+                weights,
+                counter,
+                stop
+            )
+            if turn_red:
+                if v_new > v:
+                    v = v_new
+                    v_move = move
+                if v >= beta:
+                    break
+                alpha = max(alpha, v)
+            else:
+                if v_new < v:
+                    v = v_new
+                    v_move = move
+                if v <= alpha:
+                    break
+                beta = min(beta, v)
+        return v, v_move
+
+configs = {}
+def get_config(board_size, starting_rows=None):
+    '''
+    Returns the BitboardConfig for a board size, creating it the first time.
+    '''
+    try:
+        return configs[board_size, starting_rows]
+    except KeyError:
+        result = configs[board_size, starting_rows] = \
+            BitboardConfig(board_size, starting_rows)
+        return result
+def alpha_beta_search(
+    board_size,
+    state,
+    turn_red,
+    job_id=None,
+    starting_rows=None
+):
+    '''
+    This is tree.alpha_beta_search using bitboards. The cutoff depth is
+    increased until the time limit in tree.SearchTimeLimit runs out. The
+    search is stopped by tree.stop_all. starting_rows is the number of rows
+    of each player's pieces at the start of the game (see BitboardConfig).
+    '''
+    tree.wait_for_stopped_searches()
+    start_time = time.perf_counter()
+    config = get_config(board_size, starting_rows)
+    red, black = config.from_state(state)
+    moves = config.moves(red, black, turn_red)
+    if len(moves) == 1:
+        return job_id, config.to_move(moves[0])
+    results = []
+    stop = tree.SearchToken()
+    def deepen():
+        try:
+            for cutoff_depth in range(
+                tree.alpha_beta_gradual_depth.cutoff_depth_start,
+                tree.alpha_beta_gradual_depth.cutoff_depth_stop,
+                2
+            ):
+                counter = [0]
+                v, v_move = config.search(
+                    red,
+                    black,
+                    turn_red,
+                    0,
+                    cutoff_depth,
+                    -math.inf,
+                    math.inf,
+                    tree.evaluate_state.weights,
+                    counter,
+                    stop
+                )
+                if stop.is_set():
+                    break
+                results.append((cutoff_depth, v, v_move, counter[0]))
+                # A proven win or loss will not change with more depth.
+                if math.isinf(v):
+                    break
+        finally:
+            stop.leave()
+    p = threading.Thread(
+        name="Bitboard Gradual Deepening #" + str(job_id),
+        target=deepen
+    )
+    tree.stops.append(stop)
+    stop.enter()
+    p.start()
+    p.join(tree.SearchTimeLimit)
+    cancelled = stop.is_set()
+    stop.set()
+    p.join()
+    tree.stops.remove(stop)
+    if cancelled:
+        return job_id, None
+    if not results:
+        # Not even the first depth finished, so just make any move.
+        return job_id, config.to_move(moves[0])
+    cutoff_depth, v, v_move, nodes = results[-1]
+    print(
+        "Got {}'s move in {:>7.4f} seconds: {:>3} levels, {:>8} nodes: "
+        "final utility value = {:>7.3f}".format(
+            "R" if turn_red else "B",
+            time.perf_counter() - start_time,
+            cutoff_depth,
+            nodes,
+            v
+        )
+    )
+    return job_id, config.to_move(v_move)
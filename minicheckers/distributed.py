@@ -0,0 +1,798 @@
+#!/usr/bin/env python3
+'''
+This module spreads a search over worker processes that connect to a
+coordinator over TCP, so that a deep search can use several machines. The
+coordinator splits the root of minimax_value the way younger_brothers_value
+does: the first move is searched first, and then the other moves are searched
+by the workers at the same time with the bounds so far. Each job is one move
+from the root. The worker searches the moves of the node after it one at a
+time with tree.minimax_value. When a result improves the bounds at the root,
+the coordinator sends the new bounds to the jobs that are running, and each
+worker uses them from its next move on, so a job that can no longer change
+the result stops early.
+
+The workers ask for nothing. When a worker is idle, the coordinator sends it
+the next move with the newest bounds. When there are no moves left, an idle
+worker steals a copy of the job that has been running the longest, and the
+first result wins. When a result causes a cutoff, the other jobs are
+cancelled. If a worker disconnects, its job is put back in line, and if there
+are no workers at all, the coordinator searches the job itself.
+
+Each message is a MESSAGE_HEADER (the type and the length of the rest),
+followed by the message. A State is two little-endian ints with one bit for
+each square, and a Move is three bytes: the indices of the squares that it is
+from, to, and captures (NO_SQUARE if there is no capture).
+
+To try it on one machine, run this file from the command line with --help.
+'''
+import snapshot, tree
+import argparse, atexit, collections, enum, multiprocessing, \
+    multiprocessing.pool, queue, socket, struct, threading, time
+
+MessageType = enum.Enum("MessageType", "JOB RESULT CANCEL BOUNDS")
+WorkerEvent = enum.Enum("WorkerEvent", "JOINED RESULT LOST")
+MESSAGE_HEADER = struct.Struct("<BI")
+# The job ID, the cutoff depth, the depth of the node, the board size, whether
+# it is the red player's turn, alpha, beta, and the weights of the evaluation
+# function, followed by the State of the node and the Move to search
+JOB = struct.Struct("<IHHB?dd6d")
+# The job ID, whether the job was stopped, the value, the deepest depth, and
+# the number of nodes
+RESULT = struct.Struct("<I?dHQ")
+# The job ID
+CANCEL = struct.Struct("<I")
+# The job ID, alpha, and beta
+BOUNDS = struct.Struct("<Idd")
+MOVE = struct.Struct("<BBB")
+NO_SQUARE = 0xFF
+
+def encode_state(board_size, state):
+    '''
+    Returns the bytes of a tree.State.
+    '''
+    length = (board_size * board_size + 7) // 8
+    return b"".join(
+        sum(
+            1 << (place.row * board_size + place.column)
+            for place in positions
+        ).to_bytes(length, "little")
+        for positions in state
+    )
+def decode_state(board_size, data):
+    '''
+    Returns the tree.State from the bytes that encode_state returned.
+    '''
+    length = (board_size * board_size + 7) // 8
+    return tree.State(*(
+        frozenset(
+            tree.Place(*divmod(index, board_size))
+            for index in range(board_size * board_size)
+            if bits >> index & 1
+        )
+        for bits in (
+            int.from_bytes(data[:length], "little"),
+            int.from_bytes(data[length:2 * length], "little")
+        )
+    ))
+def encode_move(board_size, move):
+    '''
+    Returns the bytes of a tree.Move, or of None.
+    '''
+    if move is None:
+        return MOVE.pack(NO_SQUARE, NO_SQUARE, NO_SQUARE)
+    return MOVE.pack(*(
+        NO_SQUARE if place is None else place.row * board_size + place.column
+        for place in move
+    ))
+def decode_move(board_size, data):
+    '''
+    Returns the tree.Move, or None, from the bytes that encode_move returned.
+    '''
+    indices = MOVE.unpack(data[:MOVE.size])
+    if indices[0] == NO_SQUARE:
+        return None
+    return tree.Move(*(
+        None if index == NO_SQUARE else tree.Place(*divmod(index, board_size))
+        for index in indices
+    ))
+def send_message(sock, message_type, payload):
+    '''
+    Sends a message of a MessageType.
+    '''
+    sock.sendall(
+        MESSAGE_HEADER.pack(message_type.value, len(payload)) + payload
+    )
+def _receive_exactly(sock, size):
+    # Returns None if the connection is closed first.
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return bytes(data)
+def receive_message(sock):
+    '''
+    Returns a tuple of the MessageType and the payload of the next message,
+    or None if the connection was closed.
+    '''
+    header = _receive_exactly(sock, MESSAGE_HEADER.size)
+    if header is None:
+        return None
+    message_type, length = MESSAGE_HEADER.unpack(header)
+    payload = _receive_exactly(sock, length)
+    if payload is None:
+        return None
+    return MessageType(message_type), payload
+def _job_value(cutoff_depth, stop, turn_red, depth, board_size, state, window):
+    # Searches the node of a job like tree.minimax_value, but reads the bounds
+    # from window, which run_worker updates, before each move. Returns the
+    # value and the deepest depth.
+    alpha, beta = window
+    analysis = tree.analyze_position(board_size, state)
+    moves = analysis.moves_red if turn_red else analysis.moves_black
+    if len(moves) < 2 or depth + 1 >= cutoff_depth:
+        # The bounds cannot change between the moves.
+        v, _, max_depth = tree.minimax_value(
+            cutoff_depth,
+            stop,
+            turn_red,
+            depth,
+            board_size,
+            state,
+            alpha,
+            beta
+        )
+        return v, max_depth
+    counters = tree.node_counters(stop, depth)
+    captures = analysis.captures_red if turn_red else analysis.captures_black
+    v = tree.UTILITY_VALUES_TERMINAL[
+        tree.GameEnd.WIN_BLACK if turn_red else tree.GameEnd.WIN_RED
+    ]
+    max_depth = depth
+    for index, move in enumerate(moves):
+        alpha = max(alpha, window[0])
+        beta = min(beta, window[1])
+        v_new, _, max_depth_new = tree.reduced_value(
+            tree.late_move_reduction(cutoff_depth, depth, index, captures),
+            cutoff_depth,
+            stop,
+            turn_red,
+            depth,
+            board_size,
+            state,
+            move,
+            alpha,
+            beta
+        )
+        if stop.stopped:
+            break
+        max_depth = max(max_depth, max_depth_new)
+        # The newest bounds are checked too, so the job stops as soon as the
+        # root does not need it.
+        if turn_red:
+            v = max(v, v_new)
+            if v >= min(beta, window[1]):
+                if counters is not None:
+                    counters.prunes_in_max += 1
+                break
+            alpha = max(alpha, v)
+        else:
+            v = min(v, v_new)
+            if v <= max(alpha, window[0]):
+                if counters is not None:
+                    counters.prunes_in_min += 1
+                break
+            beta = min(beta, v)
+    return v, max_depth
+def _search_job(sock, send_lock, payload, stop, window):
+    # Searches one job in a worker and sends the result.
+    (
+        job_id,
+        cutoff_depth,
+        depth,
+        board_size,
+        turn_red,
+        _,
+        _,
+        *weights
+    ) = JOB.unpack_from(payload)
+    length = (board_size * board_size + 7) // 8
+    state = decode_state(board_size, payload[JOB.size:])
+    move = decode_move(board_size, payload[JOB.size + 2 * length:])
+    tree.evaluate_state.weights = tuple(weights)
+    v, max_depth = _job_value(
+        cutoff_depth,
+        stop,
+        not turn_red,
+        depth + 1,
+        board_size,
+        tree.move_result(state, move),
+        window
+    )
+    try:
+        with send_lock:
+            send_message(
+                sock,
+                MessageType.RESULT,
+                RESULT.pack(
+                    job_id,
+                    stop.is_set(),
+                    v,
+                    max_depth,
+                    stop.statistics().nodes
+                )
+            )
+    except OSError:
+        # The coordinator is gone, and run_worker will notice.
+        pass
+def run_worker(host, port):
+    '''
+    Connects to a coordinator and searches the jobs that it sends until the
+    connection is closed.
+    '''
+    # Only the process that the user started saves the caches.
+    atexit.unregister(tree._cache_save)
+    # A forked process does not have the threads of the parent's pool.
+    tree.younger_brothers_value.pool = multiprocessing.pool.ThreadPool(
+        tree.younger_brothers_value.helpers
+    )
+    # Look up the saved results in the snapshot that all of the workers on
+    # this computer share instead of in a copy of the caches.
+    snapshot.use_snapshot()
+    sock = socket.create_connection((host, port))
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    send_lock = threading.Lock()
+    job_id = None
+    stop = None
+    # The bounds of the job, which the coordinator can narrow while it runs
+    window = None
+    try:
+        while True:
+            message = receive_message(sock)
+            if message is None:
+                break
+            message_type, payload = message
+            if message_type == MessageType.JOB:
+                # The coordinator only sends a job after the last one is done.
+                job_id = JOB.unpack_from(payload)[0]
+                stop = tree.SearchToken()
+                window = list(JOB.unpack_from(payload)[5:7])
+                threading.Thread(
+                    name="Distributed Job #" + str(job_id),
+                    target=_search_job,
+                    args=(sock, send_lock, payload, stop, window),
+                    daemon=True
+                ).start()
+            elif message_type == MessageType.CANCEL:
+                if CANCEL.unpack(payload)[0] == job_id:
+                    stop.set()
+            elif message_type == MessageType.BOUNDS:
+                bounds_job_id, alpha, beta = BOUNDS.unpack(payload)
+                if bounds_job_id == job_id:
+                    window[:] = max(alpha, window[0]), min(beta, window[1])
+    except OSError:
+        pass
+    finally:
+        if stop is not None:
+            stop.set()
+        sock.close()
+def start_local_workers(address, count):
+    '''
+    Starts worker processes on this machine that connect to a coordinator.
+    
+    Arguments:
+        address: the (host, port) of the coordinator
+        count: the number of workers
+    
+    Returns:
+        A list of the multiprocessing.Process objects
+    '''
+    workers = [
+        multiprocessing.Process(
+            name="Distributed Worker #" + str(i),
+            target=run_worker,
+            args=address,
+            daemon=True
+        ) for i in range(count)
+    ]
+    for worker in workers:
+        worker.start()
+    return workers
+class WorkerConnection:
+    '''
+    This class is the coordinator's end of the connection to one worker.
+    '''
+    def __init__(self, sock, address):
+        self.socket = sock
+        self.address = address
+        # The ID of the job that the worker is searching, or None if it is
+        # idle
+        self.job_id = None
+    def send(self, message_type, payload):
+        '''
+        Sends a message. Returns False if the connection is broken.
+        '''
+        try:
+            send_message(self.socket, message_type, payload)
+        except OSError:
+            return False
+        return True
+class Job:
+    '''
+    This class is one move from the root that is being searched by one or
+    more workers.
+    '''
+    def __init__(self, job_id, move):
+        self.job_id = job_id
+        self.move = move
+        self.start_time = time.perf_counter()
+        self.workers = set()
+class Coordinator:
+    '''
+    This class accepts connections from workers and hands out the moves of a
+    search to them.
+    '''
+    def __init__(self, host="127.0.0.1", port=0):
+        '''
+        Arguments:
+            host: the address to listen on
+            port: the port to listen on, or 0 for any free port
+        '''
+        self._listener = socket.create_server((host, port))
+        self.address = self._listener.getsockname()[:2]
+        self._events = queue.Queue()
+        self._workers = set()
+        self._next_job_id = 0
+        # Let idle workers take copies of the jobs that are running.
+        self.steal = True
+        threading.Thread(
+            name="Distributed Coordinator",
+            target=self._accept,
+            daemon=True
+        ).start()
+    @property
+    def workers(self):
+        '''
+        Returns the number of workers that are connected.
+        '''
+        return len(self._workers)
+    def wait_for_workers(self, count, timeout=None):
+        '''
+        Waits until at least count workers are connected.
+        
+        Returns:
+            True if they are, or False if the timeout passed first
+        '''
+        end_time = None if timeout is None else time.perf_counter() + timeout
+        while self.workers < count:
+            if end_time is not None and time.perf_counter() >= end_time:
+                return False
+            self._handle_events({}, collections.deque(), True, None)
+        return True
+    def close(self):
+        '''
+        Stops listening and disconnects all workers, which makes them exit.
+        '''
+        self._listener.close()
+        for connection in tuple(self._workers):
+            try:
+                connection.socket.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+    def _accept(self):
+        while True:
+            try:
+                sock, address = self._listener.accept()
+            except OSError:
+                return
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            connection = WorkerConnection(sock, address)
+            self._events.put((WorkerEvent.JOINED, connection, None))
+            threading.Thread(
+                name="Distributed Connection " + str(address),
+                target=self._read,
+                args=(connection,),
+                daemon=True
+            ).start()
+    def _read(self, connection):
+        try:
+            while True:
+                message = receive_message(connection.socket)
+                if message is None:
+                    break
+                message_type, payload = message
+                if message_type == MessageType.RESULT:
+                    self._events.put((
+                        WorkerEvent.RESULT,
+                        connection,
+                        RESULT.unpack(payload)
+                    ))
+        except OSError:
+            pass
+        connection.socket.close()
+        self._events.put((WorkerEvent.LOST, connection, None))
+    def search(
+        self,
+        cutoff_depth,
+        stop,
+        turn_red,
+        depth,
+        board_size,
+        state,
+        alpha,
+        beta
+    ):
+        '''
+        Searches a node with the workers. The arguments and the return value
+        are the same as those of tree.minimax_value. The nodes that the
+        workers searched are counted in stop.
+        '''
+        if stop.is_set():
+            return 0.0, None, depth
+        counters = tree.node_counters(stop, depth)
+        analysis = tree.analyze_position(board_size, state)
+        v = tree.cutoff_test(
+            cutoff_depth,
+            board_size,
+            state,
+            turn_red,
+            depth,
+            analysis,
+            stop.weights
+        )
+        if v is not None:
+            return v, None, depth
+        moves = analysis.moves_red if turn_red else analysis.moves_black
+        if len(moves) < 2:
+            # There is nothing to split.
+            return tree.minimax_value(
+                cutoff_depth,
+                stop,
+                turn_red,
+                depth,
+                board_size,
+                state,
+                alpha,
+                beta
+            )
+        v = tree.UTILITY_VALUES_TERMINAL[
+            tree.GameEnd.WIN_BLACK if turn_red else tree.GameEnd.WIN_RED
+        ]
+        v_move = None
+        max_depth = depth
+        pending = collections.deque(moves)
+        running = {}
+        # The bounds that the running jobs were last told about
+        bounds = alpha, beta
+        # The younger brothers wait until the eldest brother has a value.
+        eldest = True
+        while pending or running:
+            if stop.is_set():
+                for job in running.values():
+                    self._cancel(job)
+                return 0.0, None, depth
+            results = self._handle_events(running, pending, False, counters)
+            if not results:
+                results = self._dispatch(
+                    running,
+                    pending,
+                    eldest,
+                    counters,
+                    cutoff_depth,
+                    stop,
+                    turn_red,
+                    depth,
+                    board_size,
+                    state,
+                    alpha,
+                    beta
+                )
+            for move, v_new, max_depth_new in results:
+                if stop.is_set():
+                    break
+                eldest = False
+                max_depth = max(max_depth, max_depth_new)
+                if turn_red:
+                    if v_new >= v:
+                        v = v_new
+                        v_move = move
+                    if v >= beta:
+                        if counters is not None:
+                            counters.prunes_in_max += 1
+                        break
+                    alpha = max(alpha, v)
+                else:
+                    if v_new <= v:
+                        v = v_new
+                        v_move = move
+                    if v <= alpha:
+                        if counters is not None:
+                            counters.prunes_in_min += 1
+                        break
+                    beta = min(beta, v)
+            else:
+                if (alpha, beta) != bounds:
+                    bounds = alpha, beta
+                    self._send_bounds(running, alpha, beta)
+                continue
+            # There was a cutoff, so the other moves are not needed.
+            for job in running.values():
+                self._cancel(job)
+            break
+        return v, v_move, max_depth
+    def _dispatch(
+        self,
+        running,
+        pending,
+        eldest,
+        counters,
+        cutoff_depth,
+        stop,
+        turn_red,
+        depth,
+        board_size,
+        state,
+        alpha,
+        beta
+    ):
+        # Gives work to the idle workers and waits for results. Returns a list
+        # like _handle_events does.
+        idle = [c for c in self._workers if c.job_id is None]
+        # Hand out the moves that are waiting.
+        while pending and idle and not (eldest and running):
+            job = Job(self._next_job_id, pending.popleft())
+            self._next_job_id += 1
+            running[job.job_id] = job
+            self._send_job(
+                idle.pop(),
+                job,
+                cutoff_depth,
+                depth,
+                board_size,
+                turn_red,
+                alpha,
+                beta,
+                state
+            )
+        # Let the idle workers steal copies of the oldest jobs.
+        if self.steal and not pending:
+            for job in sorted(
+                running.values(),
+                key=lambda job: job.start_time
+            ):
+                if not idle:
+                    break
+                if len(job.workers) == 1:
+                    self._send_job(
+                        idle.pop(),
+                        job,
+                        cutoff_depth,
+                        depth,
+                        board_size,
+                        turn_red,
+                        alpha,
+                        beta,
+                        state
+                    )
+        if pending and not running and not self._workers:
+            # There are no workers, so search the next move here.
+            move = pending.popleft()
+            v_new, _, max_depth_new = tree.minimax_value(
+                cutoff_depth,
+                stop,
+                not turn_red,
+                depth + 1,
+                board_size,
+                tree.move_result(state, move),
+                alpha,
+                beta
+            )
+            results = [(move, v_new, max_depth_new)]
+        else:
+            results = self._handle_events(running, pending, True, counters)
+        return results
+    def _send_job(
+        self,
+        connection,
+        job,
+        cutoff_depth,
+        depth,
+        board_size,
+        turn_red,
+        alpha,
+        beta,
+        state
+    ):
+        connection.job_id = job.job_id
+        job.workers.add(connection)
+        connection.send(
+            MessageType.JOB,
+            JOB.pack(
+                job.job_id,
+                cutoff_depth,
+                depth,
+                board_size,
+                turn_red,
+                alpha,
+                beta,
+                *tree.evaluate_state.weights
+            ) + encode_state(board_size, state) +
+                encode_move(board_size, job.move)
+        )
+    def _send_bounds(self, running, alpha, beta):
+        # Narrows the bounds of the jobs that are running.
+        for job in running.values():
+            for connection in job.workers:
+                connection.send(
+                    MessageType.BOUNDS,
+                    BOUNDS.pack(job.job_id, alpha, beta)
+                )
+    def _cancel(self, job):
+        for connection in job.workers:
+            connection.send(MessageType.CANCEL, CANCEL.pack(job.job_id))
+    def _handle_events(self, running, pending, block, counters):
+        # Handles the events from the workers, waiting up to a short time for
+        # one if block is True. Returns a list of the move, the value, and the
+        # deepest depth of each job that finished. The nodes of every job are
+        # added to counters unless it is None.
+        results = []
+        timeout = 0.05 if block else 0
+        while True:
+            try:
+                event, connection, data = self._events.get(
+                    block=timeout > 0,
+                    timeout=timeout or None
+                )
+            except queue.Empty:
+                return results
+            timeout = 0
+            if event == WorkerEvent.JOINED:
+                self._workers.add(connection)
+            elif event == WorkerEvent.LOST:
+                self._workers.discard(connection)
+                job = running.get(connection.job_id)
+                if job is not None:
+                    job.workers.discard(connection)
+                    if not job.workers:
+                        # Nobody else is searching it, so search it again.
+                        del running[job.job_id]
+                        pending.appendleft(job.move)
+            else:
+                job_id, stopped, v, max_depth, nodes = data
+                connection.job_id = None
+                if counters is not None:
+                    counters.nodes += nodes
+                job = running.get(job_id)
+                if job is None or stopped:
+                    # The job was cancelled, or another worker finished it.
+                    continue
+                del running[job_id]
+                job.workers.discard(connection)
+                self._cancel(job)
+                results.append((job.move, v, max_depth))
+def distributed_search(
+    coordinator,
+    board_size,
+    state,
+    turn_red,
+    max_depth,
+    stop=None
+):
+    '''
+    Runs Coordinator.search at every even cutoff depth up to max_depth, like
+    tree.alpha_beta_gradual_depth. Generates a tuple of the cutoff depth, the
+    seconds so far, the value, the move, and the nodes that the workers
+    searched for that depth.
+    '''
+    if stop is None:
+        stop = tree.SearchToken()
+    start_time = time.perf_counter()
+    for cutoff_depth in range(2, max_depth + 1, 2):
+        nodes = stop.statistics().nodes
+        v, v_move, _ = coordinator.search(
+            cutoff_depth,
+            stop,
+            turn_red,
+            0,
+            board_size,
+            state,
+            tree.UTILITY_VALUES_TERMINAL[tree.GameEnd.WIN_BLACK],
+            tree.UTILITY_VALUES_TERMINAL[tree.GameEnd.WIN_RED]
+        )
+        if stop.is_set():
+            return
+        yield (
+            cutoff_depth,
+            time.perf_counter() - start_time,
+            v,
+            v_move,
+            stop.statistics().nodes - nodes
+        )
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    worker_parser = subparsers.add_parser(
+        "worker",
+        help="connect to a coordinator and search for it"
+    )
+    worker_parser.add_argument("host", help="the address of the coordinator")
+    worker_parser.add_argument(
+        "port",
+        type=int,
+        help="the port of the coordinator"
+    )
+    search_parser = subparsers.add_parser(
+        "search",
+        help="search the starting position with workers"
+    )
+    search_parser.add_argument(
+        "--host",
+        default="127.0.0.1",
+        help="the address to listen on (default: 127.0.0.1)"
+    )
+    search_parser.add_argument(
+        "--port",
+        type=int,
+        default=0,
+        help="the port to listen on (default: any free port)"
+    )
+    search_parser.add_argument(
+        "--local-workers",
+        type=int,
+        default=2,
+        help="the number of workers to start on this machine (default: 2)"
+    )
+    search_parser.add_argument(
+        "--wait-for",
+        type=int,
+        default=0,
+        help="the number of workers to wait for before searching, including "
+            "the local ones (default: the number of local workers)"
+    )
+    search_parser.add_argument(
+        "--board-size",
+        type=int,
+        default=6,
+        help="the number of squares in a row or column (default: 6)"
+    )
+    search_parser.add_argument(
+        "--depth",
+        type=int,
+        default=10,
+        help="the deepest cutoff depth to search (default: 10)"
+    )
+    arguments = parser.parse_args()
+    if arguments.command == "worker":
+        run_worker(arguments.host, arguments.port)
+    else:
+        import model
+        atexit.unregister(tree._cache_save)
+        coordinator = Coordinator(arguments.host, arguments.port)
+        print("Listening on {}:{}".format(*coordinator.address))
+        start_local_workers(coordinator.address, arguments.local_workers)
+        coordinator.wait_for_workers(
+            max(arguments.wait_for, arguments.local_workers)
+        )
+        for cutoff_depth, seconds, v, v_move, nodes in distributed_search(
+            coordinator,
+            arguments.board_size,
+            model.starting_state(
+                arguments.board_size,
+                (arguments.board_size - 2) // 2
+            ),
+            False,
+            arguments.depth
+        ):
+            print(
+                "Depth {:>2}: {:>8.3f} seconds, {:>8} nodes, "
+                "value = {:>7.3f}, move = {}".format(
+                    cutoff_depth,
+                    seconds,
+                    nodes,
+                    v,
+                    v_move
+                )
+            )
+        coordinator.close()
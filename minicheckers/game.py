@@ -1,7 +1,17 @@
 #!/usr/bin/env python3
-import board, common, tree
-import threading, tkinter, tkinter.messagebox
+import board, common, model, record, tree
+import collections, queue, statistics, threading, time, tkinter, \
+    tkinter.messagebox
 BOARD_SIZE = 6
+STARTING_ROWS = 2
+GAME_RECORD_FILE = "games.mcgr"
+# The number of milliseconds between checks for work from other threads
+UI_QUEUE_INTERVAL = 10
+# The number of the latest latencies of each kind to keep
+LATENCY_SAMPLES = 1000
+# The kinds of latencies that are measured
+LATENCY_CLICK = "click to highlight"
+LATENCY_ENGINE = "engine move to paint"
 
 def radio_boolean(master, variable, false_text, true_text, heading=None):
     '''
@@ -41,11 +51,83 @@ def radio_boolean(master, variable, false_text, true_text, heading=None):
 def alert(title, text):
     tkinter.messagebox.showinfo(title, text)
 
+class LatencyStatistics:
+    '''
+    This class keeps the latest latencies of each kind in seconds.
+    '''
+    def __init__(self, samples=LATENCY_SAMPLES):
+        self._samples = collections.defaultdict(
+            lambda: collections.deque(maxlen=samples)
+        )
+    def record(self, kind, seconds):
+        '''
+        Adds a latency of the given kind.
+        '''
+        self._samples[kind].append(seconds)
+    def summary(self, kind):
+        '''
+        Returns a tuple of the number of latencies of the given kind, the
+        median, the 95th percentile, and the maximum, or None if there are no
+        latencies of that kind.
+        '''
+        samples = sorted(self._samples.get(kind, ()))
+        if not samples:
+            return None
+        return (
+            len(samples),
+            statistics.median(samples),
+            samples[min(len(samples) - 1, len(samples) * 95 // 100)],
+            samples[-1]
+        )
+    def __repr__(self):
+        lines = []
+        for kind in sorted(self._samples):
+            summary = self.summary(kind)
+            if summary is not None:
+                lines.append(
+                    "{}: {} times, median {:.1f} ms, 95th percentile "
+                    "{:.1f} ms, maximum {:.1f} ms".format(
+                        kind,
+                        summary[0],
+                        *(seconds * 1000 for seconds in summary[1:])
+                    )
+                )
+        return "\n".join(lines) or "No latencies yet"
+
 class Game(tkinter.Frame):
-    def __init__(self, master=None):
+    def __init__(
+        self,
+        master=None,
+        board_size=BOARD_SIZE,
+        starting_rows=STARTING_ROWS,
+        search_function=tree.alpha_beta_search
+    ):
+        '''
+        Arguments:
+            master:
+                the tkinter master of this game
+            board_size:
+                the number of squares in a row or column on the board
+            starting_rows:
+                the number of rows that are filled with one player's pieces
+                at the start of the game
+            search_function:
+                the function that picks the computer's moves, which takes the
+                same arguments as tree.alpha_beta_search
+        '''
         super().__init__(master, padx=5, pady=5)
+        self._starting_rows = starting_rows
+        self._search_function = search_function
         self._move_to = {}
-        self._legal_moves = {}
+        # Other threads never touch the widgets. Instead, they put functions
+        # in this queue, and they are called on the tkinter thread.
+        self._ui_queue = queue.SimpleQueue()
+        self._ui_queue_job = None
+        # The turn is checked in another thread. This counts the checks so
+        # that the result of an old one can be ignored.
+        self._analysis_id = 0
+        self._analysis_ready = False
+        self.latencies = LatencyStatistics()
         # These sets and locks manage simultaneous ongoing alpha-beta searches.
         self._cpu_next_id = 0
         self._cpu_lock = threading.RLock()
@@ -57,8 +139,9 @@ class Game(tkinter.Frame):
         # This lock will be used to prevent simultaneous inputs from the user
         # and from the AI.
         self._lock_input = threading.RLock()
-        # Create the game board.
-        self._board = board.Board(self, BOARD_SIZE, self.square_command)
+        # Create the game and the board that shows it.
+        self._model = model.GameModel(board_size, starting_rows)
+        self._board = board.Board(self, self._model, self.square_command)
         self._board.grid(row=0, column=0)
         # Create the control panel.
         self._controls = tkinter.Frame(self, padx=5, pady=5)
@@ -146,9 +229,38 @@ class Game(tkinter.Frame):
             anchor="w"
         )
         self._label_status.pack(fill="both")
+        self._drain_ui_queue()
     def destroy(self, *args, **kwargs):
+        if self._ui_queue_job is not None:
+            self.after_cancel(self._ui_queue_job)
+            self._ui_queue_job = None
         super().destroy(*args, **kwargs)
         self.cpu_ignore_running()
+    def post(self, function, *args):
+        '''
+        Calls a function on the tkinter thread soon. This can be called from
+        any thread.
+        
+        Arguments:
+            function:
+                the callable
+            *args:
+                the arguments to pass to it
+        '''
+        self._ui_queue.put((function, args))
+    def _drain_ui_queue(self):
+        # Call the functions that other threads have posted, and then check
+        # again later.
+        try:
+            while True:
+                try:
+                    function, args = self._ui_queue.get_nowait()
+                except queue.Empty:
+                    break
+                function(*args)
+        finally:
+            self._ui_queue_job = \
+                self.after(UI_QUEUE_INTERVAL, self._drain_ui_queue)
     @property
     def turn_black(self):
         '''
@@ -196,7 +308,8 @@ class Game(tkinter.Frame):
                 "Black" if self.turn_black else "Red", "moves first."
             )
             self._game_over = False
-            self._board.reset_squares(2)
+            self._model.reset(self._starting_rows, not self.turn_black)
+            self._board.show_model()
             self.handle_turn_change()
     def take_turn(self):
         '''
@@ -207,69 +320,95 @@ class Game(tkinter.Frame):
         '''
         self.turn_black = not self.turn_black
     def refresh_legal_moves(self):
-            current_state = self._board.to_tree_state()
-            self._legal_moves = tree.legal_moves(
-                BOARD_SIZE,
-                current_state,
-                not self.turn_black
-            )
-            return current_state
+        # The model only forgets the legal moves if the player changed.
+        self._model.turn_red = not self.turn_black
+        return self._model.state
     def handle_turn_change(self, *args):
         # This is the callback for when the current player changes or a player
         # is switched from being a computer to being a human or back.
         if not self._game_over:
             # Stop the AI.
             self.cpu_ignore_running()
-            # Refresh the legal moves for the current player.
             current_state = self.refresh_legal_moves()
-            # Check whether the game is over.
-            game_ended = tree.game_ended(BOARD_SIZE, current_state)
-            if game_ended == tree.GameEnd.NOT_ENDED:
-                # Make sure that there are legal moves for the current player.
-                # If there are not, then this player forfeits his or her turn.
-                if not self._legal_moves:
-                    self.take_turn()
-                    # This function is not automatically triggered in this
-                    # case, so we just call it explicitly.
-                    current_state = self.refresh_legal_moves()
-                # If the current player is the computer, do the AI stuff.
-                if self.turn_cpu:
-                    self.cpu_start(current_state)
-            elif game_ended == tree.GameEnd.WIN_RED:
-                self._game_over = True
-                print("Game over: red victory")
-                alert("Game Over", "Red wins!")
-            elif game_ended == tree.GameEnd.WIN_BLACK:
-                self._game_over = True
-                print("Game over: black victory")
-                alert("Game Over", "Black wins!")
-            else:
-                self._game_over = True
-                print("Game over: draw")
-                alert("Game Over", "Draw.")
-            # Update the text in the status label below the New Game button.
-            self._label_status.config(
-                text="Game over" if self._game_over else (
-                    "Thinking" if self.turn_cpu else "Ready"
-                )
+            # Find the legal moves and whether the game is over in another
+            # thread. handle_analysis continues when they are ready.
+            self._analysis_id += 1
+            self._analysis_ready = False
+            threading.Thread(
+                target=self._analyze,
+                name="Turn Check #" + str(self._analysis_id),
+                args=(
+                    self._analysis_id,
+                    self._model.board_size,
+                    current_state,
+                    not self.turn_black
+                ),
+                daemon=True
+            ).start()
+    def _analyze(self, analysis_id, board_size, state, turn_red):
+        # This runs in another thread. The results are cached in tree, so the
+        # model only has to look them up on the tkinter thread.
+        tree.game_ended(board_size, state)
+        tree.legal_moves(board_size, state, turn_red)
+        self.post(self.handle_analysis, analysis_id)
+    def handle_analysis(self, analysis_id):
+        # This is called on the tkinter thread when the turn has been checked.
+        if analysis_id != self._analysis_id or self._game_over:
+            # The turn changed again, or the game is over.
+            return
+        self._analysis_ready = True
+        current_state = self._model.state
+        # Check whether the game is over.
+        game_ended = self._model.game_ended()
+        if game_ended == tree.GameEnd.NOT_ENDED:
+            # Make sure that there are legal moves for the current player.
+            # If there are not, then this player forfeits his or her turn.
+            if not self._model.legal_moves:
+                # The turn change is checked again.
+                self.take_turn()
+                return
+            # If the current player is the computer, do the AI stuff.
+            if self.turn_cpu:
+                self.cpu_start(current_state)
+        elif game_ended == tree.GameEnd.WIN_RED:
+            self._game_over = True
+            print("Game over: red victory")
+            alert("Game Over", "Red wins!")
+        elif game_ended == tree.GameEnd.WIN_BLACK:
+            self._game_over = True
+            print("Game over: black victory")
+            alert("Game Over", "Black wins!")
+        else:
+            self._game_over = True
+            print("Game over: draw")
+            alert("Game Over", "Draw.")
+        # Update the text in the status label below the New Game button.
+        self._label_status.config(
+            text="Game over" if self._game_over else (
+                "Thinking" if self.turn_cpu else "Ready"
             )
-            # Disable the difficulty controls if the computer is playing.
-            state = \
-                "disabled" \
-                if self.turn_cpu and not self._game_over else \
-                "normal"
-            for w in self._difficulty_controls:
-                w.config(state=state)
+        )
+        # Disable the difficulty controls if the computer is playing.
+        state = \
+            "disabled" \
+            if self.turn_cpu and not self._game_over else \
+            "normal"
+        for w in self._difficulty_controls:
+            w.config(state=state)
     def handle_difficulty_change(self, *args):
         # This is the callback for when the user changes the AI difficulty.
         tree.set_difficulty(tree.AIDifficulty[self._difficulty.get()])
     def do_move(self, move):
         # Move the pieces on the board.
-        if move is not None:
-            self._board.display_move(move)
-        # Change whose turn it is. This checks whether the game is over because
-        # the refresh function that is bound to the turn change checks it.
-        self.take_turn()
+        if move is None:
+            self._model.pass_turn()
+        else:
+            self._model.apply_move(move)
+            self._board.show_model()
+        # Change whose turn it is to match the model. This checks whether the
+        # game is over because the refresh function that is bound to the turn
+        # change checks it.
+        self.turn_black = not self._model.turn_red
     def cpu_start(self, current_state):
         # Get the next job ID number.
         with self._cpu_lock:
@@ -282,9 +421,9 @@ class Game(tkinter.Frame):
             target=common.return_passer,
             name="Alpha-Beta Search #" + str(job_id),
             args=(
-                tree.alpha_beta_search,
+                self._search_function,
                 self.cpu_callback,
-                BOARD_SIZE,
+                self._model.board_size,
                 current_state,
                 not self.turn_black,
                 job_id
@@ -303,7 +442,12 @@ class Game(tkinter.Frame):
                 # Stop the AI.
                 tree.stop_all()
     def cpu_callback(self, result):
-        # This is the callback function for the AI making its move.
+        # This is the callback function for the AI making its move. It is
+        # called on the thread of the search, so the move is made on the
+        # tkinter thread.
+        self.post(self.cpu_finish, result, time.perf_counter())
+    def cpu_finish(self, result, found_time):
+        # This makes the move of the AI on the tkinter thread.
         job_id, move = result
         with self._lock_input:
             # Check whether this job's results should be ignored.
@@ -319,9 +463,19 @@ class Game(tkinter.Frame):
                     return
             # This job's results should not be ignored.
             self.do_move(move)
+            self._board.when_rendered(
+                lambda: self.latencies.record(
+                    LATENCY_ENGINE,
+                    time.perf_counter() - found_time
+                )
+            )
     def square_command(self, place_from):
         # This is the callback function for the user clicking on a square.
+        click_time = time.perf_counter()
         with self._lock_input:
+            if not self._analysis_ready and not self._game_over:
+                # The turn is still being checked, and the game may be over.
+                return
             if self._game_over:
                 alert("Game Over", "Click the New Game button to play.")
             else:
@@ -336,9 +490,15 @@ class Game(tkinter.Frame):
                     if move is None:
                         # This is not the destination of a move.
                         # Look for legal moves from here.
-                        moves = self._legal_moves.get(place_from, ())
+                        moves = self._model.legal_moves.get(place_from, ())
                         # Display them for the user.
                         self._board.activate_choices(moves)
+                        self._board.when_rendered(
+                            lambda: self.latencies.record(
+                                LATENCY_CLICK,
+                                time.perf_counter() - click_time
+                            )
+                        )
                         # Remember the destinations of the moves from here.
                         for move in moves:
                             self._move_to[move.place_to] = move
@@ -346,4 +506,18 @@ class Game(tkinter.Frame):
                         # This is the destination of a move.
                         self.do_move(move)
     def print_move_history(self):
-        self._board.print_move_history()
+        self._model.print_move_history()
+    def print_latencies(self):
+        print(self.latencies)
+    def save_game_record(self):
+        '''
+        Appends the moves so far to the game record file.
+        '''
+        filename = common.resource(GAME_RECORD_FILE)
+        try:
+            with open(filename, "ab") as f:
+                self._model.write_record(record.RecordWriter(f))
+        except OSError as e:
+            print("Warning: unable to save", repr(filename), "-", e)
+        else:
+            print("The game was saved to", repr(filename))
@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+'''
+This module lets one process play many games at once. An EngineHost has a
+fixed number of worker threads that run searches for any number of
+SearchSession objects, one for each game. All sessions share the search caches
+in tree, so a position that one game has searched is cached for the others.
+Each session has its own weights of tree.evaluate_state, which are passed to
+its searches in their stop tokens instead of being set in tree. The weights
+are part of the cache keys, so sessions with different difficulties share the
+caches without mixing up their results. Each session also has its own
+statistics, so stopping one game does not affect the others.
+
+The workers are threads, so with the global interpreter lock, more workers
+let more games search at once but do not search more nodes per second.
+'''
+import tree
+import collections, concurrent.futures, threading, time
+
+class SessionStatistics:
+    '''
+    This class keeps track of the searches of one SearchSession.
+    '''
+    def __init__(self):
+        # The number of searches that returned a move
+        self.moves = 0
+        # The number of searches that were stopped
+        self.stopped = 0
+        # The total number of nodes in the searches that returned a move
+        self.nodes = 0
+        # The total number of seconds spent searching
+        self.seconds = 0.0
+        # The longest time in seconds from stopping a running search to its
+        # threads being idle
+        self.stop_latency = 0.0
+    def __repr__(self):
+        return "SessionStatistics(moves={}, stopped={}, nodes={}, " \
+            "seconds={:.3f}, stop_latency={:.4f})".format(
+                self.moves,
+                self.stopped,
+                self.nodes,
+                self.seconds,
+                self.stop_latency
+            )
+
+class SearchSession:
+    '''
+    This class represents one game that is played by an EngineHost. Do not
+    instantiate this class directly. Instead, call EngineHost.open_session.
+    '''
+    def __init__(self, host, name, weights):
+        self.name = name
+        # The weights of tree.evaluate_state for the searches of this session
+        self.weights = weights
+        self.statistics = SessionStatistics()
+        self._host = host
+        # These are tuples of a Future and the arguments to tree.search_result
+        # that are waiting for a worker.
+        self._pending = collections.deque()
+        # This is the stop token of the search that is running, if any.
+        self._stop = None
+        self._closed = False
+    def search(self, board_size, state, turn_red):
+        '''
+        Asks the host to find a move for the current player. The searches of
+        one session are run one at a time, in the order that they were asked
+        for.
+        
+        Returns:
+            A concurrent.futures.Future whose result will be the Move that was
+            picked, or None if the search was stopped
+        '''
+        future = concurrent.futures.Future()
+        with self._host._lock:
+            if self._closed:
+                raise ValueError("The session is closed.")
+            self._pending.append((future, (board_size, state, turn_red)))
+            self._host._schedule(self)
+        return future
+    def stop(self):
+        '''
+        Stops the running search of this session and cancels the searches that
+        have not started. Their results will be None. Other sessions are not
+        affected. The next search of this session starts after the threads of
+        the stopped search are idle.
+        '''
+        with self._host._lock:
+            if self._stop is not None:
+                self._stop.set()
+            if self in self._host._ready:
+                self._host._ready.remove(self)
+            while self._pending:
+                future, _ = self._pending.popleft()
+                self.statistics.stopped += 1
+                future.set_result(None)
+    def close(self):
+        '''
+        Stops this session and removes it from the host.
+        '''
+        self.stop()
+        with self._host._lock:
+            self._closed = True
+            self._host._sessions.discard(self)
+
+class EngineHost:
+    '''
+    This class runs the searches of many SearchSession objects on a fixed
+    number of worker threads. Sessions take turns: after a worker runs a search
+    for one session, the other sessions that are waiting go first.
+    '''
+    def __init__(
+        self,
+        workers=4,
+        time_limit=None,
+        driver=tree.SearchDriver.ALPHA_BETA
+    ):
+        '''
+        Arguments:
+            workers:
+                the number of searches that can run at the same time
+            time_limit:
+                the number of seconds for each search (tree.SearchTimeLimit by
+                default)
+            driver:
+                a member of the tree.SearchDriver enum
+        '''
+        self.time_limit = time_limit
+        self.driver = driver
+        self._lock = threading.Condition()
+        self._sessions = set()
+        # These are the sessions that have searches waiting, in the order in
+        # which they will be served. A session is in here at most once.
+        self._ready = collections.deque()
+        self._next_id = 0
+        self._shutdown = False
+        self._workers = [
+            threading.Thread(
+                name="Engine Host Worker #" + str(i),
+                target=self._work,
+                daemon=True
+            ) for i in range(workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+    def open_session(self, name=None, difficulty=None):
+        '''
+        Returns a new SearchSession for one game.
+        
+        Arguments:
+            name:
+                the name of the session
+            difficulty:
+                a member of the tree.AIDifficulty enum, or None for the weights
+                that tree.evaluate_state has now
+        '''
+        if difficulty is None:
+            weights = tree.evaluate_state.weights
+        else:
+            weights = tree.HEURISTIC_WEIGHTS[difficulty]
+        with self._lock:
+            if self._shutdown:
+                raise ValueError("The host has been shut down.")
+            if name is None:
+                name = "Session #" + str(self._next_id)
+            self._next_id += 1
+            session = SearchSession(self, name, weights)
+            self._sessions.add(session)
+            return session
+    @property
+    def sessions(self):
+        with self._lock:
+            return tuple(self._sessions)
+    def cache_sizes(self):
+        '''
+        Returns a dictionary that maps the name of each shared search cache to
+        the number of entries in it.
+        '''
+        return {
+            function.__name__: len(function._cache)
+            for function in (
+                tree.minimax_value,
+                tree.memory_value,
+                tree.alpha_beta_gradual_depth
+            )
+        }
+    def shutdown(self):
+        '''
+        Stops all sessions and waits for the workers to finish.
+        '''
+        for session in self.sessions:
+            session.close()
+        with self._lock:
+            self._shutdown = True
+            self._lock.notify_all()
+        for worker in self._workers:
+            worker.join()
+    def _schedule(self, session):
+        # The caller must hold self._lock.
+        if session not in self._ready and session._stop is None:
+            self._ready.append(session)
+            self._lock.notify()
+    def _work(self):
+        while True:
+            with self._lock:
+                while not self._ready and not self._shutdown:
+                    self._lock.wait()
+                if self._shutdown:
+                    return
+                session = self._ready.popleft()
+                future, arguments = session._pending.popleft()
+                stop = session._stop = \
+                    tree.SearchToken(weights=session.weights)
+            if future.set_running_or_notify_cancel():
+                start_time = time.perf_counter()
+                try:
+                    result = tree.search_result(
+                        *arguments,
+                        stop,
+                        session.name,
+                        self.driver,
+                        self.time_limit
+                    )
+                except BaseException as e:
+                    future.set_exception(e)
+                else:
+                    with self._lock:
+                        session.statistics.seconds += \
+                            time.perf_counter() - start_time
+                        if stop.stop_latency is not None:
+                            session.statistics.stop_latency = max(
+                                session.statistics.stop_latency,
+                                stop.stop_latency
+                            )
+                        if result is None:
+                            session.statistics.stopped += 1
+                            future.set_result(None)
+                        else:
+                            cutoff_depth, (v, v_move, statistics) = result
+                            session.statistics.moves += 1
+                            session.statistics.nodes += statistics.nodes
+                            future.set_result(v_move)
+            with self._lock:
+                session._stop = None
+                # Go to the back of the line if there is more to do.
+                if session._pending:
+                    self._schedule(session)
@@ -0,0 +1,524 @@
+#!/usr/bin/env python3
+'''
+This module searches with several processes at once in the Lazy SMP style.
+Every process runs the same iterative deepening search as
+tree.alpha_beta_gradual_depth on bitboards. The processes do not split the
+work. Instead, they share one transposition table in shared memory, so each
+process finds many positions that another process has already searched. To
+keep them from doing exactly the same work, the processes start at different
+depths and try the moves in different orders.
+
+Each entry in the table is three 64-bit words: the key of the position XORed
+with the other two words, the value, and the data. The value is the bits of a
+64-bit float, so it is the same value that the search found. The data is
+ENTRY_DATA: the remaining depth, a flag that says whether the value is exact
+or a bound, and the index of the best move plus one (0 if there is none). The
+table is not locked. If two processes write the same entry at the same time,
+the words will not match the key when the entry is read, so the entry is
+ignored.
+'''
+import bitboard, tree
+import atexit, collections, math, multiprocessing, \
+    multiprocessing.shared_memory, queue, random, struct, threading, time
+
+ENTRY_VALUE = struct.Struct("<d")
+ENTRY_DATA = struct.Struct("<BBH4x")
+ENTRY_WORDS = 3
+# The number of entries in the table must be a power of two.
+TABLE_ENTRIES = 1 << 20
+# A value is exact, a lower bound (the search failed high), or an upper bound
+# (the search failed low).
+FLAG_EXACT = 0
+FLAG_LOWER = 1
+FLAG_UPPER = 2
+# Check whether to stop after this many nodes, counting the nodes of the
+# quiescence search. Reading a multiprocessing.Event is much slower than
+# counting.
+STOP_CHECK_NODES = 1024
+LazySMPResult = collections.namedtuple(
+    "LazySMPResult",
+    ("seconds", "worker", "cutoff_depth", "v", "move", "nodes")
+)
+
+def zobrist_keys(board_size):
+    '''
+    Returns a random 64-bit key for each square with a red piece, a random key
+    for each square with a black piece, and a key for red's turn. The keys are
+    the same in every process.
+    '''
+    generator = random.Random(board_size)
+    squares = board_size * board_size
+    return (
+        tuple(generator.getrandbits(64) for i in range(squares)),
+        tuple(generator.getrandbits(64) for i in range(squares)),
+        generator.getrandbits(64)
+    )
+def zobrist_hash(keys, red, black, turn_red):
+    '''
+    Returns the key of a position. It is the XOR of the keys of the pieces and
+    the key of red's turn if it is red's turn.
+    '''
+    keys_red, keys_black, key_turn = keys
+    result = key_turn if turn_red else 0
+    for index in bitboard.iterate_bits(red):
+        result ^= keys_red[index]
+    for index in bitboard.iterate_bits(black):
+        result ^= keys_black[index]
+    return result
+
+class SharedTable:
+    '''
+    This class is a transposition table in a
+    multiprocessing.shared_memory.SharedMemory buffer. It is created by one
+    process and opened by name in the others.
+    '''
+    def __init__(self, entries=TABLE_ENTRIES, name=None):
+        '''
+        Arguments:
+            entries:
+                the number of entries, which must be a power of two (ignored
+                if name is given)
+            name:
+                the name of an existing table to open, or None to create one
+        '''
+        if name is None:
+            if entries & (entries - 1):
+                raise ValueError("The number of entries must be a power of 2.")
+            self._memory = multiprocessing.shared_memory.SharedMemory(
+                create=True,
+                size=entries * ENTRY_WORDS * 8
+            )
+            self._memory.buf[:] = bytes(entries * ENTRY_WORDS * 8)
+        else:
+            self._memory = \
+                multiprocessing.shared_memory.SharedMemory(name=name)
+        # The shared memory can be bigger than what was asked for.
+        size = len(self._memory.buf) // 8 * 8
+        self._words = self._memory.buf[:size].cast("Q")
+        # The number of entries is the biggest power of two that fits.
+        entries = len(self._words) // ENTRY_WORDS
+        self._mask = (1 << entries.bit_length() - 1) - 1
+    @property
+    def name(self):
+        return self._memory.name
+    def probe(self, key):
+        '''
+        Returns the value, the remaining depth, the flag, and the move index
+        that were stored for a key, or None if there are none.
+        '''
+        i = (key & self._mask) * ENTRY_WORDS
+        check = self._words[i]
+        value = self._words[i + 1]
+        data = self._words[i + 2]
+        if not data or check ^ value ^ data != key:
+            return None
+        return ENTRY_VALUE.unpack(value.to_bytes(8, "little")) + \
+            ENTRY_DATA.unpack(data.to_bytes(8, "little"))
+    def store(self, key, v, draft, flag, move_index):
+        '''
+        Stores a result for a key. An entry for the same key is only replaced
+        by a result that is at least as deep.
+        '''
+        i = (key & self._mask) * ENTRY_WORDS
+        check = self._words[i]
+        value = self._words[i + 1]
+        data = self._words[i + 2]
+        if data and check ^ value ^ data == key and \
+            ENTRY_DATA.unpack(data.to_bytes(8, "little"))[0] > draft:
+            return
+        value = int.from_bytes(ENTRY_VALUE.pack(v), "little")
+        data = int.from_bytes(
+            ENTRY_DATA.pack(min(draft, 255), flag, move_index),
+            "little"
+        )
+        self._words[i] = key ^ value ^ data
+        self._words[i + 1] = value
+        self._words[i + 2] = data
+    def close(self):
+        '''
+        Closes the table in this process.
+        '''
+        self._words.release()
+        self._memory.close()
+    def unlink(self):
+        '''
+        Frees the shared memory. Only the process that created the table should
+        call this.
+        '''
+        self._memory.unlink()
+
+class Worker:
+    '''
+    This class is the search that runs in one process.
+    '''
+    def __init__(self, config, table, weights, worker_id, stop):
+        self.config = config
+        self.table = table
+        self.weights = weights
+        self.worker_id = worker_id
+        self.stop = stop
+        self.stopped = False
+        self.keys = zobrist_keys(config.board_size)
+        # This is a list like the counter of bitboard.BitboardConfig.search.
+        self.counter = [0]
+        # Check whether to stop once the counter reaches this. The quiescence
+        # search counts nodes without checking, so the counter can pass any
+        # one number without search seeing it.
+        self.next_stop_check = STOP_CHECK_NODES
+    def child_key(self, key, red, move):
+        '''
+        Returns the key of the position after a move, given the key before it.
+        red is True if the piece that moves is red.
+        '''
+        keys_red, keys_black, key_turn = self.keys
+        index_from, index_to, index_capture = move
+        own, other = (keys_red, keys_black) if red else (keys_black, keys_red)
+        key ^= key_turn ^ own[index_from] ^ own[index_to]
+        if index_capture is not None:
+            key ^= other[index_capture]
+        return key
+    def search(
+        self,
+        red,
+        black,
+        turn_red,
+        key,
+        depth,
+        cutoff_depth,
+        alpha,
+        beta
+    ):
+        '''
+        This is bitboard.BitboardConfig.search with the shared table. It
+        returns the value and the best move (None if no move was made).
+        '''
+        if self.stopped:
+            return 0.0, None
+        if self.counter[0] >= self.next_stop_check:
+            self.next_stop_check = self.counter[0] + STOP_CHECK_NODES
+            if self.stop.is_set():
+                self.stopped = True
+                return 0.0, None
+        config = self.config
+        if not black:
+            self.counter[0] += 1
+            return math.inf, None
+        if not red:
+            self.counter[0] += 1
+            return -math.inf, None
+        moves = config.moves(red, black, turn_red)
+        if not moves:
+            terminal = config.game_ended(red, black)
+            if terminal != tree.GameEnd.NOT_ENDED:
+                self.counter[0] += 1
+                return tree.UTILITY_VALUES_TERMINAL[terminal], None
+        if depth >= cutoff_depth:
+            return config.quiescence(
+                red,
+                black,
+                turn_red,
+                alpha,
+                beta,
+                self.weights,
+                self.counter
+            ), None
+        self.counter[0] += 1
+        # If no actions are possible, this turn is forfeited.
+        if not moves:
+            return self.search(
+                red,
+                black,
+                not turn_red,
+                key ^ self.keys[2],
+                depth + 1,
+                cutoff_depth,
+                alpha,
+                beta
+            )[0], None
+        # Look for a result from a search that was at least as deep.
+        draft = cutoff_depth - depth
+        entry = self.table.probe(key)
+        move_first = None
+        if entry is not None:
+            v, draft_entry, flag, move_index = entry
+            if 0 < move_index <= len(moves):
+                move_first = moves[move_index - 1]
+            if draft_entry >= draft and (
+                flag == FLAG_EXACT or
+                flag == FLAG_LOWER and v >= beta or
+                flag == FLAG_UPPER and v <= alpha
+            ):
+                return v, move_first
+        # Try the best move from the table first. Each worker tries the other
+        # moves in a different order.
+        order = list(moves)
+        if move_first is not None:
+            order.remove(move_first)
+        if order:
+            rotation = self.worker_id % len(order)
+            order = order[rotation:] + order[:rotation]
+        if move_first is not None:
+            order.insert(0, move_first)
+        alpha_start = alpha
+        beta_start = beta
+        v = -math.inf if turn_red else math.inf
+        v_move = order[0]
+        for move in order:
+            v_new, _ = self.search(
+                *config.apply(red, black, move),
+                not turn_red,
+                self.child_key(key, turn_red, move),
+                depth + 1,
+                cutoff_depth,
+                alpha,
+                beta
+            )
+            if self.stopped:
+                return 0.0, None
+            if turn_red:
+                if v_new > v:
+                    v = v_new
+                    v_move = move
+                if v >= beta:
+                    break
+                alpha = max(alpha, v)
+            else:
+                if v_new < v:
+                    v = v_new
+                    v_move = move
+                if v <= alpha:
+                    break
+                beta = min(beta, v)
+        if v <= alpha_start:
+            flag = FLAG_UPPER
+        elif v >= beta_start:
+            flag = FLAG_LOWER
+        else:
+            flag = FLAG_EXACT
+        self.table.store(key, v, draft, flag, moves.index(v_move) + 1)
+        return v, v_move
+    def deepen(self, red, black, turn_red, max_depth, results, start_time):
+        '''
+        Searches with increasing cutoff depths and puts a LazySMPResult in the
+        results queue after each one. Odd-numbered workers start two plies
+        deeper than the others.
+        '''
+        key = zobrist_hash(self.keys, red, black, turn_red)
+        for cutoff_depth in range(
+            2 + 2 * (self.worker_id % 2),
+            max_depth + 1,
+            2
+        ):
+            v, v_move = self.search(
+                red,
+                black,
+                turn_red,
+                key,
+                0,
+                cutoff_depth,
+                -math.inf,
+                math.inf
+            )
+            if self.stopped:
+                break
+            results.put(LazySMPResult(
+                time.perf_counter() - start_time,
+                self.worker_id,
+                cutoff_depth,
+                v,
+                v_move,
+                self.counter[0]
+            ))
+            # A proven win or loss will not change with more depth.
+            if math.isinf(v):
+                break
+def _work(
+    table_name,
+    board_size,
+    red,
+    black,
+    turn_red,
+    weights,
+    worker_id,
+    max_depth,
+    stop,
+    results,
+    start_time,
+    starting_rows
+):
+    # This is the target of each worker process.
+    atexit.unregister(tree._cache_save)
+    table = SharedTable(name=table_name)
+    try:
+        Worker(
+            bitboard.get_config(board_size, starting_rows),
+            table,
+            weights,
+            worker_id,
+            stop
+        ).deepen(red, black, turn_red, max_depth, results, start_time)
+    finally:
+        table.close()
+def lazy_smp_search(
+    board_size,
+    state,
+    turn_red,
+    processes=None,
+    time_limit=None,
+    max_depth=None,
+    stop=None,
+    entries=TABLE_ENTRIES,
+    starting_rows=None
+):
+    '''
+    Searches a position with several processes that share one table.
+    
+    Arguments:
+        board_size:
+            the number of squares in a row or column on the board
+        state:
+            a tree.State from which the move should be made
+        turn_red:
+            True if it is the red player's turn
+        processes:
+            the number of worker processes (the number of CPUs by default)
+        time_limit:
+            the number of seconds to search, or None for no limit
+        max_depth:
+            the deepest cutoff depth to search, or None for no limit
+        stop:
+            a threading.Event that stops the search when it is set
+        entries:
+            the number of entries in the shared table
+        starting_rows:
+            the number of rows of each player's pieces at the start of the
+            game (see bitboard.BitboardConfig)
+    
+    Returns:
+        A list of LazySMPResult objects, one for each cutoff depth that each
+        worker finished, in the order that they were finished
+    '''
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    if max_depth is None:
+        max_depth = tree.alpha_beta_gradual_depth.cutoff_depth_stop - 1
+    if stop is None:
+        stop = threading.Event()
+    config = bitboard.get_config(board_size, starting_rows)
+    red, black = config.from_state(state)
+    table = SharedTable(entries)
+    stop_workers = multiprocessing.Event()
+    results = multiprocessing.Queue()
+    start_time = time.perf_counter()
+    workers = [
+        multiprocessing.Process(
+            name="Lazy SMP Worker #" + str(worker_id),
+            target=_work,
+            args=(
+                table.name,
+                board_size,
+                red,
+                black,
+                turn_red,
+                tree.evaluate_state.weights,
+                worker_id,
+                max_depth,
+                stop_workers,
+                results,
+                start_time,
+                starting_rows
+            ),
+            daemon=True
+        ) for worker_id in range(processes)
+    ]
+    for worker in workers:
+        worker.start()
+    result = []
+    try:
+        # Wait until the time is up or a worker finishes the deepest search.
+        while not stop.is_set():
+            if time_limit is not None and \
+                time.perf_counter() - start_time >= time_limit:
+                break
+            try:
+                r = results.get(timeout=0.05)
+            except queue.Empty:
+                if not any(worker.is_alive() for worker in workers):
+                    break
+                continue
+            result.append(r)
+            if r.cutoff_depth >= max_depth - 1 or math.isinf(r.v):
+                break
+    finally:
+        stop_workers.set()
+        # Keep reading the results while the workers are stopping. A process
+        # that has put something in a queue does not end until it is read.
+        while any(worker.is_alive() for worker in workers):
+            try:
+                result.append(results.get(timeout=0.05))
+            except queue.Empty:
+                pass
+        for worker in workers:
+            worker.join()
+        while True:
+            try:
+                result.append(results.get(timeout=0.05))
+            except queue.Empty:
+                break
+        table.close()
+        table.unlink()
+    return result
+def alpha_beta_search(
+    board_size,
+    state,
+    turn_red,
+    job_id=None,
+    starting_rows=None
+):
+    '''
+    This is tree.alpha_beta_search with Lazy SMP. The search runs until the
+    time limit in tree.SearchTimeLimit, and it can be stopped by
+    tree.stop_all. The move from the deepest search that finished is picked.
+    starting_rows is passed to lazy_smp_search.
+    '''
+    tree.wait_for_stopped_searches()
+    start_time = time.perf_counter()
+    config = bitboard.get_config(board_size, starting_rows)
+    red, black = config.from_state(state)
+    moves = config.moves(red, black, turn_red)
+    if len(moves) == 1:
+        return job_id, config.to_move(moves[0])
+    stop = tree.SearchToken()
+    tree.stops.append(stop)
+    # The search is counted as working until its processes are done, so that
+    # tree.wait_for_stopped_searches waits for them.
+    stop.enter()
+    try:
+        results = lazy_smp_search(
+            board_size,
+            state,
+            turn_red,
+            time_limit=tree.SearchTimeLimit,
+            stop=stop,
+            starting_rows=starting_rows
+        )
+    finally:
+        stop.leave()
+        tree.stops.remove(stop)
+    if stop.is_set():
+        return job_id, None
+    if not results:
+        # Not even the first depth finished, so just make any move.
+        return job_id, config.to_move(moves[0])
+    best = max(results, key=lambda r: r.cutoff_depth)
+    print(
+        "Got {}'s move in {:>7.4f} seconds: {:>3} levels, {:>8} nodes in "
+        "the worker that got there: final utility value = {:>7.3f}".format(
+            "R" if turn_red else "B",
+            time.perf_counter() - start_time,
+            best.cutoff_depth,
+            best.nodes,
+            best.v
+        )
+    )
+    return job_id, config.to_move(best.move)
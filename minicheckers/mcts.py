@@ -0,0 +1,344 @@
+#!/usr/bin/env python3
+'''
+This module is a second search engine that uses Monte Carlo tree search
+instead of alpha-beta search. A tree of positions is grown one node at a time.
+Each new node is played out to the end of the game with random moves on
+bitboards (a rollout), and the result is added to the node and to every node
+above it. The next node to grow is picked with UCT (Upper Confidence bounds
+applied to Trees), which balances the moves that have won the most rollouts
+against the moves that have been tried the least. The move with the most
+rollouts is picked, so the search can be stopped at any time.
+
+With more than one process, a batch of nodes is picked at a time and their
+rollouts are run in a pool of processes, which is kept for the next searches
+with the same number of processes. While a node is waiting for its rollout, it
+counts as a lost rollout (a virtual loss), so that the other nodes of the batch
+are picked from other parts of the tree.
+'''
+import bitboard, tree
+import collections, math, multiprocessing, random, threading, time
+
+# The weight of the exploration term of UCT
+EXPLORATION = math.sqrt(2)
+# The number of lost rollouts that a node counts as while it is waiting for
+# its rollout
+VIRTUAL_LOSS = 1
+# The number of nodes to pick for each process in a batch
+BATCH_PER_PROCESS = 8
+# The reward of a rollout for the red player, by the end of the game. The
+# reward for the black player is one minus this.
+REWARDS_RED = {
+    tree.GameEnd.WIN_RED: 1.0,
+    tree.GameEnd.WIN_BLACK: 0.0,
+    tree.GameEnd.DRAW: 0.5
+}
+MCTSResult = collections.namedtuple(
+    "MCTSResult",
+    ("seconds", "move", "visits", "win_rate", "rollouts")
+)
+
+def rollout(config, red, black, turn_red, generator):
+    '''
+    Plays random moves until the game ends.
+    
+    Arguments:
+        config:
+            a bitboard.BitboardConfig
+        red, black, turn_red:
+            the position to play from
+        generator:
+            a random.Random
+    
+    Returns:
+        The reward for the red player
+    '''
+    while red and black:
+        moves = config.moves(red, black, turn_red)
+        if moves:
+            red, black = config.apply(red, black, generator.choice(moves))
+        elif not config.move_counts(red, black, not turn_red)[0]:
+            # Neither player can move, so whoever has more pieces wins.
+            return REWARDS_RED[config.game_ended(red, black)]
+        turn_red = not turn_red
+    return REWARDS_RED[
+        tree.GameEnd.WIN_RED if red else tree.GameEnd.WIN_BLACK
+    ]
+def _rollout(arguments):
+    # Runs one rollout in a worker process.
+    board_size, starting_rows, red, black, turn_red, seed = arguments
+    return rollout(
+        bitboard.get_config(board_size, starting_rows),
+        red,
+        black,
+        turn_red,
+        random.Random(seed)
+    )
+class Node:
+    '''
+    This class is one position in the search tree. The rewards are for the
+    player who made the move into this node, so that a parent can compare its
+    children directly.
+    '''
+    def __init__(self, config, red, black, turn_red, parent=None, move=None):
+        self.red = red
+        self.black = black
+        self.turn_red = turn_red
+        self.parent = parent
+        self.move = move
+        self.children = []
+        self.visits = 0
+        self.rewards = 0.0
+        self.ended = config.game_ended(red, black)
+        if self.ended != tree.GameEnd.NOT_ENDED:
+            self.untried = []
+        else:
+            # None is the move that forfeits the turn.
+            self.untried = list(config.moves(red, black, turn_red)) or [None]
+    def select(self):
+        '''
+        Returns the child with the highest UCT value.
+        '''
+        log_visits = math.log(self.visits)
+        return max(
+            self.children,
+            key=lambda child: child.rewards / child.visits +
+                EXPLORATION * math.sqrt(log_visits / child.visits)
+        )
+    def expand(self, config, generator):
+        '''
+        Adds the child for one of the moves that have not been tried, and
+        returns it.
+        '''
+        move = self.untried.pop(generator.randrange(len(self.untried)))
+        if move is None:
+            red, black = self.red, self.black
+        else:
+            red, black = config.apply(self.red, self.black, move)
+        child = Node(config, red, black, not self.turn_red, self, move)
+        self.children.append(child)
+        return child
+    def update(self, reward_red, visits=1, virtual=0):
+        '''
+        Adds rollouts to this node and the nodes above it.
+        
+        Arguments:
+            reward_red:
+                the total reward of the rollouts for the red player
+            visits:
+                the number of rollouts
+            virtual:
+                the number of virtual losses to take back
+        '''
+        node = self
+        while node is not None:
+            node.visits += visits - virtual
+            # The player who moved into this node is the other player.
+            if node.turn_red:
+                node.rewards += visits - reward_red
+            else:
+                node.rewards += reward_red
+            node = node.parent
+    def add_virtual_loss(self):
+        '''
+        Counts a lost rollout in this node and the nodes above it until the
+        real rollout is added.
+        '''
+        node = self
+        while node is not None:
+            node.visits += VIRTUAL_LOSS
+            node = node.parent
+
+# The pools of rollout processes by the number of processes. A pool is kept for
+# the following searches because starting the processes for every move takes
+# longer than many rollouts.
+pools = {}
+def get_pool(processes):
+    '''
+    Returns the pool with a number of processes, creating it the first time.
+    '''
+    try:
+        return pools[processes]
+    except KeyError:
+        result = pools[processes] = multiprocessing.Pool(processes)
+        return result
+def close_pools():
+    '''
+    Stops the processes of all the pools.
+    '''
+    while pools:
+        pool = pools.popitem()[1]
+        pool.terminate()
+        pool.join()
+def mcts_search(
+    board_size,
+    state,
+    turn_red,
+    processes=None,
+    time_limit=None,
+    rollouts=None,
+    stop=None,
+    seed=None,
+    starting_rows=None
+):
+    '''
+    Searches a position with Monte Carlo tree search.
+    
+    Arguments:
+        board_size:
+            the number of squares in a row or column on the board
+        state:
+            a tree.State from which the move should be made
+        turn_red:
+            True if it is the red player's turn
+        processes:
+            the number of processes to run the rollouts in (the number of CPUs
+            by default). With one process, the rollouts are run in this
+            process.
+        time_limit:
+            the number of seconds to search, or None for no limit
+        rollouts:
+            the number of rollouts to run, or None for no limit
+        stop:
+            a threading.Event that stops the search when it is set. The search
+            stops after the rollouts of the current batch.
+        seed:
+            the seed of the random moves, or None for a random seed
+        starting_rows:
+            the number of rows of each player's pieces at the start of the
+            game (see bitboard.BitboardConfig)
+    
+    Returns:
+        An MCTSResult for the move with the most rollouts
+    '''
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    if time_limit is None and rollouts is None and stop is None:
+        raise ValueError("The search needs a limit.")
+    if stop is None:
+        stop = threading.Event()
+    config = bitboard.get_config(board_size, starting_rows)
+    generator = random.Random(seed)
+    red, black = config.from_state(state)
+    root = Node(config, red, black, turn_red)
+    batch_size = 1 if processes == 1 else processes * BATCH_PER_PROCESS
+    start_time = time.perf_counter()
+    pool = None if processes == 1 else get_pool(processes)
+    try:
+        while not stop.is_set():
+            if time_limit is not None and \
+                time.perf_counter() - start_time >= time_limit:
+                break
+            if rollouts is not None:
+                if root.visits >= rollouts:
+                    break
+                batch_size = min(batch_size, rollouts - root.visits)
+            # Pick a batch of new nodes.
+            leaves = []
+            for i in range(batch_size):
+                node = root
+                while not node.untried and node.children:
+                    node = node.select()
+                if node.untried:
+                    node = node.expand(config, generator)
+                if node.ended != tree.GameEnd.NOT_ENDED:
+                    # There is nothing to play out.
+                    node.update(REWARDS_RED[node.ended])
+                    continue
+                node.add_virtual_loss()
+                leaves.append(node)
+            if not leaves:
+                continue
+            arguments = [
+                (
+                    board_size,
+                    starting_rows,
+                    node.red,
+                    node.black,
+                    node.turn_red,
+                    generator.getrandbits(64)
+                ) for node in leaves
+            ]
+            if pool is None:
+                rewards = map(_rollout, arguments)
+            else:
+                rewards = pool.map(
+                    _rollout,
+                    arguments,
+                    math.ceil(len(arguments) / processes)
+                )
+            for node, reward_red in zip(leaves, rewards):
+                node.update(reward_red, virtual=VIRTUAL_LOSS)
+    except BaseException:
+        # The pool may still be running rollouts that nobody will collect.
+        if pool is not None:
+            pools.pop(processes, None)
+            pool.terminate()
+            pool.join()
+        raise
+    seconds = time.perf_counter() - start_time
+    if not root.children:
+        return MCTSResult(seconds, None, 0, math.nan, root.visits)
+    best = max(root.children, key=lambda child: child.visits)
+    return MCTSResult(
+        seconds,
+        None if best.move is None else config.to_move(best.move),
+        best.visits,
+        best.rewards / best.visits,
+        root.visits
+    )
+def alpha_beta_search(
+    board_size,
+    state,
+    turn_red,
+    job_id=None,
+    starting_rows=None
+):
+    '''
+    This is tree.alpha_beta_search with Monte Carlo tree search. The search
+    runs until the time limit in tree.SearchTimeLimit in
+    alpha_beta_search.processes processes, and it can be stopped by
+    tree.stop_all. starting_rows is passed to mcts_search.
+    '''
+    tree.wait_for_stopped_searches()
+    config = bitboard.get_config(board_size, starting_rows)
+    red, black = config.from_state(state)
+    moves = config.moves(red, black, turn_red)
+    if len(moves) == 1:
+        return job_id, config.to_move(moves[0])
+    stop = tree.SearchToken()
+    tree.stops.append(stop)
+    # The search is counted as working until its processes are done, so that
+    # tree.wait_for_stopped_searches waits for them.
+    stop.enter()
+    try:
+        result = mcts_search(
+            board_size,
+            state,
+            turn_red,
+            alpha_beta_search.processes,
+            tree.SearchTimeLimit,
+            stop=stop,
+            starting_rows=starting_rows
+        )
+    finally:
+        stop.leave()
+        tree.stops.remove(stop)
+    if stop.is_set():
+        return job_id, None
+    if result.move is None:
+        # Not even one rollout finished, so just make any move.
+        return job_id, config.to_move(moves[0])
+    print(
+        "Got {}'s move in {:>7.4f} seconds: {:>8} rollouts, {:>8} for the "
+        "move: win rate = {:>5.3f}".format(
+            "R" if turn_red else "B",
+            result.seconds,
+            result.rollouts,
+            result.visits,
+            result.win_rate
+        )
+    )
+    return job_id, result.move
+
+# Run the rollouts of a game in this many processes.
+alpha_beta_search.processes = multiprocessing.cpu_count()
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+import record, tree
+
+def starting_state(board_size, starting_rows):
+    '''
+    Returns the tree.State at the start of a game.
+    
+    Arguments:
+        board_size:
+            the number of squares in a row or column on the board
+        starting_rows:
+            the number of rows that are filled with one player's pieces at the
+            start of the game
+    '''
+    if not 0 < starting_rows <= board_size // 2:
+        raise ValueError("Each player is limited to half the board.")
+    # The red pieces are at the top, and the black pieces are at the bottom.
+    return tree.State(
+        positions_red=frozenset(
+            tree.Place(row, column)
+            for row in range(starting_rows)
+            for column in range((row + 1) % 2, board_size, 2)
+        ),
+        positions_black=frozenset(
+            tree.Place(row, column)
+            for row in range(board_size - starting_rows, board_size)
+            for column in range((row + 1) % 2, board_size, 2)
+        )
+    )
+
+class GameModel:
+    '''
+    This class is the authoritative record of a game: the current tree.State,
+    whose turn it is, the moves so far, and the legal moves for the current
+    player. Everything is updated from the last move, so nothing has to be
+    read back from the game board. It does not depend on tkinter, so it can be
+    used without the GUI.
+    '''
+    def __init__(self, board_size, starting_rows=2, turn_red=False):
+        '''
+        Arguments:
+            board_size:
+                the number of squares in a row or column on the board
+            starting_rows:
+                the number of rows that are filled with one player's pieces at
+                the start of the game
+            turn_red:
+                True if the red player moves first
+        '''
+        self.board_size = board_size
+        self.reset(starting_rows, turn_red)
+    def reset(self, starting_rows, turn_red=None):
+        '''
+        Moves all pieces to their starting positions and forgets the moves.
+        
+        Arguments:
+            starting_rows:
+                the number of rows that are filled with one player's pieces at
+                the start of the game
+            turn_red:
+                True if the red player moves first, or None to keep the
+                current player
+        '''
+        self._state = starting_state(self.board_size, starting_rows)
+        self._moves = []
+        if turn_red is not None:
+            self._turn_red = bool(turn_red)
+        self.starting_rows = starting_rows
+        self.first_turn_red = self._turn_red
+        self._refresh()
+    def _refresh(self):
+        # The legal moves and whether the game is over only change when the
+        # state or the current player changes. They are found when they are
+        # first needed, so a move can be made without waiting for them.
+        self._legal_moves = None
+        self._game_ended = None
+    @property
+    def state(self):
+        return self._state
+    @property
+    def turn_red(self):
+        '''
+        Returns True if it is the red player's turn and False if it is the
+        black player's turn.
+        '''
+        return self._turn_red
+    @turn_red.setter
+    def turn_red(self, value):
+        value = bool(value)
+        if value != self._turn_red:
+            self._turn_red = value
+            self._refresh()
+    @property
+    def moves(self):
+        '''
+        Returns a tuple of the tree.Move objects that have been made so far.
+        '''
+        return tuple(self._moves)
+    @property
+    def last_move(self):
+        '''
+        Returns the last tree.Move that was made, or None if there is none.
+        '''
+        return self._moves[-1] if self._moves else None
+    @property
+    def legal_moves(self):
+        '''
+        Returns the legal moves for the current player, organized in the same
+        way as the return value of tree.legal_moves.
+        '''
+        if self._legal_moves is None:
+            self._legal_moves = \
+                tree.legal_moves(self.board_size, self._state, self._turn_red)
+        return self._legal_moves
+    def game_ended(self):
+        '''
+        Returns a member of the tree.GameEnd enum for the current state.
+        '''
+        if self._game_ended is None:
+            self._game_ended = tree.game_ended(self.board_size, self._state)
+        return self._game_ended
+    def apply_move(self, move):
+        '''
+        Makes a move for the current player, and then it becomes the other
+        player's turn. This function does not check whether the move is legal.
+        
+        Arguments:
+            move: a tree.Move
+        '''
+        if not isinstance(move, tree.Move):
+            raise ValueError("The move must be a tree.Move.")
+        self._state = tree.move_result(self._state, move)
+        self._moves.append(move)
+        self._turn_red = not self._turn_red
+        self._refresh()
+    def pass_turn(self):
+        '''
+        Makes it the other player's turn without moving any pieces.
+        '''
+        self.turn_red = not self._turn_red
+    def write_record(self, writer):
+        '''
+        Writes the moves so far to a record.RecordWriter.
+        '''
+        game_ended = self.game_ended()
+        writer.write_game(
+            self._moves,
+            self.board_size,
+            self.starting_rows,
+            self.first_turn_red,
+            None if game_ended == tree.GameEnd.NOT_ENDED else game_ended
+        )
+    def print_move_history(self):
+        if self._moves:
+            print("Moves so far:")
+            for i, move in enumerate(self._moves, start=1):
+                print("{:>3}.".format(i), move)
+        else:
+            print("Moves so far: none")
@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+'''
+This module reads and writes game records in a compact binary format.
+
+A file starts with MAGIC and a version byte. Then, each game is a header
+followed by its moves. The header is GAME_HEADER: the board size, the number of
+starting rows, flags (FLAG_RED_FIRST if the red player moved first), the
+result (the value of a tree.GameEnd member, or 0 if unknown), and the number of
+moves. Each move is the index of the square that it starts from
+(row * board_size + column) shifted left by two bits, plus the direction that
+the piece moved in. Whether the move was a capture is not stored because it
+can be seen from the board: a piece can only move onto an occupied square by
+jumping over it. Forfeited turns are not stored either because the color of the
+piece that moves shows whose turn it was. On boards with up to 64 squares, a
+move is one byte. On bigger boards, it is two.
+'''
+import bitboard, tree
+import collections, struct
+
+MAGIC = b"MCGR"
+VERSION = 1
+GAME_HEADER = struct.Struct(">BBBBH")
+FLAG_RED_FIRST = 1
+# The directions are up and left, up and right, down and left, and down and
+# right.
+DIRECTIONS = ((-1, -1), (-1, 1), (1, -1), (1, 1))
+GameRecord = collections.namedtuple(
+    "GameRecord",
+    ("board_size", "starting_rows", "turn_red", "result", "moves")
+)
+
+def move_size(board_size):
+    '''
+    Returns the number of bytes that one move takes up.
+    '''
+    return 1 if board_size * board_size <= 64 else 2
+def encode_moves(board_size, moves):
+    '''
+    Converts an iterable of tree.Move objects to bytes.
+    '''
+    result = bytearray()
+    size = move_size(board_size)
+    for move in moves:
+        delta_row = 1 if move.place_to.row > move.place_from.row else -1
+        delta_column = \
+            1 if move.place_to.column > move.place_from.column else -1
+        code = (
+            (move.place_from.row * board_size + move.place_from.column) << 2 |
+            DIRECTIONS.index((delta_row, delta_column))
+        )
+        result += code.to_bytes(size, "big")
+    return bytes(result)
+def iterate_codes(record):
+    '''
+    Generates the index of the origin and the direction of each move in a
+    GameRecord.
+    '''
+    if move_size(record.board_size) == 1:
+        codes = record.moves
+    else:
+        codes = (
+            code for code, in struct.iter_unpack(">H", record.moves)
+        )
+    for code in codes:
+        yield code >> 2, code & 3
+def decode_moves(record):
+    '''
+    Returns a list of the tree.Move objects in a GameRecord.
+    '''
+    config = bitboard.get_config(record.board_size, record.starting_rows)
+    result = []
+    for (red, black), (index_from, direction) in zip(
+        replay(record),
+        iterate_codes(record)
+    ):
+        delta_row, delta_column = DIRECTIONS[direction]
+        amount = delta_row * record.board_size + delta_column
+        index_to = index_from + amount
+        if (red | black) >> index_to & 1:
+            result.append(
+                config.to_move((index_from, index_to + amount, index_to))
+            )
+        else:
+            result.append(config.to_move((index_from, index_to, None)))
+    return result
+def replay(record):
+    '''
+    Returns a list of the positions in a GameRecord, from the starting position
+    to the position after the last move. Each position is a pair of red and
+    black ints, as in the bitboard module. No other objects are created for
+    the moves, so this is fast enough to replay many games.
+    '''
+    config = bitboard.get_config(record.board_size, record.starting_rows)
+    red, black = config.starting_position()
+    result = [(red, black)]
+    amounts = tuple(
+        delta_row * record.board_size + delta_column
+        for delta_row, delta_column in DIRECTIONS
+    )
+    for index_from, direction in iterate_codes(record):
+        amount = amounts[direction]
+        bit_from = 1 << index_from
+        bit_over = 1 << (index_from + amount)
+        if (red | black) & bit_over:
+            # The piece jumped over the occupied square.
+            bit_to = 1 << (index_from + 2 * amount)
+            if red & bit_from:
+                red = red ^ bit_from | bit_to
+                black &= ~bit_over
+            else:
+                black = black ^ bit_from | bit_to
+                red &= ~bit_over
+        elif red & bit_from:
+            red = red ^ bit_from | bit_over
+        else:
+            black = black ^ bit_from | bit_over
+        result.append((red, black))
+    return result
+def replay_states(record):
+    '''
+    This is like replay, but the positions are converted to tree.State
+    objects.
+    '''
+    config = bitboard.get_config(record.board_size, record.starting_rows)
+    return [config.to_state(red, black) for red, black in replay(record)]
+def bulk_replay(files):
+    '''
+    Generates a GameRecord and the result of replay for every game in every
+    file. The files are read one game at a time.
+    
+    Arguments:
+        files: an iterable of binary file objects that are open for reading
+    '''
+    for f in files:
+        for record in RecordReader(f):
+            yield record, replay(record)
+
+class RecordWriter:
+    '''
+    This class writes games to a binary file object. If the file is empty,
+    MAGIC and VERSION are written first. Otherwise, the games are appended.
+    '''
+    def __init__(self, f):
+        self._file = f
+        if f.tell() == 0:
+            f.write(MAGIC + bytes((VERSION,)))
+    def write_game(
+        self,
+        moves,
+        board_size=6,
+        starting_rows=2,
+        turn_red=False,
+        result=None
+    ):
+        '''
+        Writes one game.
+        
+        Arguments:
+            moves:
+                an iterable of tree.Move objects, starting from the starting
+                position
+            board_size:
+                the number of squares in a row or column on the board
+            starting_rows:
+                the number of rows that are filled with one player's pieces
+                at the start of the game
+            turn_red:
+                True if the red player moved first
+            result:
+                a member of the tree.GameEnd enum, or None if it is unknown
+        '''
+        data = encode_moves(board_size, moves)
+        self._file.write(GAME_HEADER.pack(
+            board_size,
+            starting_rows,
+            FLAG_RED_FIRST if turn_red else 0,
+            0 if result is None else result.value,
+            len(data) // move_size(board_size)
+        ))
+        self._file.write(data)
+class RecordReader:
+    '''
+    This class is an iterator of the GameRecord objects in a binary file
+    object. The games are read one at a time.
+    '''
+    def __init__(self, f):
+        self._file = f
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError("This is not a game record file.")
+        version = f.read(1)
+        if version != bytes((VERSION,)):
+            raise ValueError("Unknown game record version", version)
+    def __iter__(self):
+        return self
+    def __next__(self):
+        header = self._file.read(GAME_HEADER.size)
+        if not header:
+            raise StopIteration
+        if len(header) < GAME_HEADER.size:
+            raise ValueError("The game record file is truncated.")
+        board_size, starting_rows, flags, result, num_moves = \
+            GAME_HEADER.unpack(header)
+        length = num_moves * move_size(board_size)
+        moves = self._file.read(length)
+        if len(moves) < length:
+            raise ValueError("The game record file is truncated.")
+        return GameRecord(
+            board_size=board_size,
+            starting_rows=starting_rows,
+            turn_red=bool(flags & FLAG_RED_FIRST),
+            result=tree.GameEnd(result) if result else None,
+            moves=moves
+        )
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+'''
+This module writes the saved caches of tree.minimax_value and
+tree.alpha_beta_gradual_depth to a snapshot file that can be read without
+unpickling it. Every process that searches can map the same file with mmap,
+so the operating system keeps one copy of it in memory for all of them, and
+an entry is only read when it is looked up.
+
+The file starts with HEADER: MAGIC and the number of records for each cache.
+The records of minimax_value come first, and then the records of
+alpha_beta_gradual_depth. Each record is RECORD: a 16-byte digest of the
+cache key, the value, the deepest depth, the cutoff depth (0 for
+minimax_value), and the row and column of each Place in the move (NO_PLACE if
+there is none). The records of each cache are sorted by the digest, so a key
+is found with a binary search.
+
+After the records, at the next multiple of FILTER_ITEM.size bytes, comes the
+filter: the hash() of the key of each record of minimax_value, sorted. A key
+whose hash() is not in it is not in the snapshot, so most keys that are not
+there are never pickled or hashed with blake2b. hash() is the same in every
+process for the keys, which only have ints, floats, and tuples and frozensets
+of them.
+
+Run this file from the command line to write the snapshot from the saved
+caches.
+'''
+import common, tree
+import atexit, bisect, hashlib, mmap, os, pickle, struct
+
+MAGIC = b"MCSNAP02"
+HEADER = struct.Struct("<8sQQ")
+RECORD = struct.Struct("<16sdHH6B")
+FILTER_ITEM = struct.Struct("q")
+DIGEST_SIZE = 16
+# The keys are pickled with this protocol before they are hashed. It must not
+# change, or the snapshots that were written before will not be found.
+PICKLE_PROTOCOL = 4
+NO_PLACE = 0xFF
+SNAPSHOT_FILE = common.resource("tree.snapshot")
+
+def _canonical(key):
+    # Returns a copy of a cache key that pickles to the same bytes in every
+    # process: frozensets are sorted, and -0.0 becomes 0.0 because it is equal
+    # to 0.0 in a dictionary.
+    kind = type(key)
+    if kind is tuple:
+        return tuple([_canonical(item) for item in key])
+    if kind is float:
+        return key + 0.0
+    if kind is frozenset:
+        return tuple(sorted([_canonical(item) for item in key]))
+    return key
+def key_digest(key):
+    '''
+    Returns the digest of a cache key, which is the same in every process.
+    '''
+    return hashlib.blake2b(
+        pickle.dumps(_canonical(key), PICKLE_PROTOCOL),
+        digest_size=DIGEST_SIZE
+    ).digest()
+def _pack_record(key, cutoff_depth, result):
+    v, v_move, max_depth = result
+    places = ()
+    if v_move is not None:
+        places = tuple(
+            coordinate
+            for place in v_move
+            for coordinate in (
+                (NO_PLACE, NO_PLACE) if place is None else place
+            )
+        )
+    return RECORD.pack(
+        key_digest(key),
+        v,
+        max_depth,
+        cutoff_depth,
+        *(places or (NO_PLACE,) * 6)
+    )
+def write_snapshot(filename=SNAPSHOT_FILE):
+    '''
+    Writes the caches of tree.minimax_value and tree.alpha_beta_gradual_depth
+    to a snapshot file. The file is replaced at once, so the processes that
+    have the old file mapped keep reading the old file.
+    
+    Returns:
+        The number of records that were written
+    '''
+    minimax_items = list(tree.minimax_value._cache.items())
+    sections = (
+        sorted(_pack_record(key, 0, result) for key, result in minimax_items),
+        sorted(
+            _pack_record(key, cutoff_depth, result)
+            for key, (cutoff_depth, result) in
+                list(tree.alpha_beta_gradual_depth._cache.items())
+        )
+    )
+    temporary = filename + ".tmp"
+    with open(temporary, "wb") as f:
+        f.write(HEADER.pack(MAGIC, *map(len, sections)))
+        for records in sections:
+            f.writelines(records)
+        f.write(bytes(-f.tell() % FILTER_ITEM.size))
+        f.writelines(
+            FILTER_ITEM.pack(h)
+            for h in sorted(hash(key) for key, _ in minimax_items)
+        )
+    os.replace(temporary, filename)
+    return sum(map(len, sections))
+class _Digests:
+    # This is a sequence of the digests of one section of a snapshot, so
+    # that bisect can search it in place.
+    def __init__(self, buffer, offset, count):
+        self._buffer = buffer
+        self._offset = offset
+        self._count = count
+    def __len__(self):
+        return self._count
+    def __getitem__(self, index):
+        start = self._offset + index * RECORD.size
+        return self._buffer[start:start + DIGEST_SIZE]
+class Snapshot:
+    '''
+    This class is a snapshot file that is mapped into memory read-only.
+    '''
+    def __init__(self, filename=SNAPSHOT_FILE):
+        with open(filename, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, minimax_count, search_count = \
+            HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            self._map.close()
+            raise ValueError(repr(filename) + " is not a snapshot.")
+        self.filename = filename
+        self._minimax = _Digests(self._map, HEADER.size, minimax_count)
+        self._search = _Digests(
+            self._map,
+            HEADER.size + minimax_count * RECORD.size,
+            search_count
+        )
+        start = HEADER.size + (minimax_count + search_count) * RECORD.size
+        start += -start % FILTER_ITEM.size
+        self._filter = memoryview(self._map)[
+            start:start + minimax_count * FILTER_ITEM.size
+        ].cast(FILTER_ITEM.format)
+    def __len__(self):
+        return len(self._minimax) + len(self._search)
+    def _find(self, digests, key):
+        # Returns the fields of the record for the key, or None.
+        digest = key_digest(key)
+        index = bisect.bisect_left(digests, digest)
+        if index == len(digests) or digests[index] != digest:
+            return None
+        _, v, max_depth, cutoff_depth, *coordinates = RECORD.unpack_from(
+            self._map,
+            digests._offset + index * RECORD.size
+        )
+        if coordinates[0] == NO_PLACE:
+            v_move = None
+        else:
+            v_move = tree.Move(*(
+                None if row == NO_PLACE else tree.Place(row, column)
+                for row, column in zip(coordinates[::2], coordinates[1::2])
+            ))
+        return cutoff_depth, (v, v_move, max_depth)
+    def minimax_result(self, key):
+        '''
+        Returns the result of minimax_value that was cached under the key, or
+        None.
+        '''
+        if not self._filter:
+            return None
+        h = hash(key)
+        index = bisect.bisect_left(self._filter, h)
+        if index == len(self._filter) or self._filter[index] != h:
+            return None
+        record = self._find(self._minimax, key)
+        return None if record is None else record[1]
+    def search_result(self, key):
+        '''
+        Returns the entry of alpha_beta_gradual_depth that was cached under
+        the key, or None.
+        '''
+        return self._find(self._search, key)
+    def close(self):
+        self._filter.release()
+        self._map.close()
+def use_snapshot(filename=SNAPSHOT_FILE):
+    '''
+    Maps a snapshot file and makes tree look up the entries that are not in
+    its caches in the snapshot. The caches of tree.minimax_value and
+    tree.alpha_beta_gradual_depth are emptied, so that this process only keeps
+    its new results. Call this in worker processes. If the caches are saved
+    when this process exits, its new results are merged into the saved files.
+    
+    Returns:
+        The Snapshot, or None if the file does not exist
+    '''
+    try:
+        result = Snapshot(filename)
+    except (OSError, ValueError):
+        return None
+    tree.CacheSnapshot = result
+    tree.minimax_value._cache = tree.new_cache()
+    tree.alpha_beta_gradual_depth._cache = tree.new_cache()
+    return result
+
+if __name__ == "__main__":
+    atexit.unregister(tree._cache_save)
+    print(
+        "Wrote {} records to {}".format(write_snapshot(), SNAPSHOT_FILE)
+    )
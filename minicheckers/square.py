@@ -39,6 +39,10 @@ class Square(tkinter.Frame):
         # This button displays the actual image and responds to clicks.
         self._button = tkinter.Button(self, command=command)
         self._button.pack(expand="yes", fill="both")
+        # Remember what the button is showing so that tkinter is only called
+        # when something changes.
+        self._image = None
+        self._background = None
         # Shade the square.
         self._activity = SquareActivity.INACTIVE
         self.shaded = shaded
@@ -53,7 +57,9 @@ class Square(tkinter.Frame):
         except KeyError:
             raise ValueError("Unknown square state", state) from None
         else:
-            self._button.configure(image=image)
+            if image is not self._image:
+                self._button.configure(image=image)
+                self._image = image
             self._state = state
     @property
     def activity(self):
@@ -70,7 +76,9 @@ class Square(tkinter.Frame):
             background = "#f44"
         else:
             raise ValueError("Unknown square activity", activity)
-        self._button.configure(background=background)
+        if background != self._background:
+            self._button.configure(background=background)
+            self._background = background
         self._activity = activity
     @property
     def shaded(self):
@@ -0,0 +1,511 @@
+#!/usr/bin/env python3
+'''
+These are regression checks for the search engine and the modules around it.
+Run them from this directory with "python -m unittest test_regression" or with
+pytest.
+'''
+import benchmark, bitboard, host, model, record, snapshot, tree
+import atexit, io, math, multiprocessing.pool, os, random, tempfile, \
+    threading, time, unittest
+# Do not overwrite the saved caches with the results of the checks.
+atexit.unregister(tree._cache_save)
+
+def random_game(board_size, starting_rows, seed, max_moves=200):
+    '''
+    Plays random legal moves from the starting position until the game ends or
+    max_moves moves have been made.
+    
+    Returns:
+        A tuple of the list of States, from the starting position to the last
+        one, and the list of Moves
+    '''
+    generator = random.Random(seed)
+    state = model.starting_state(board_size, starting_rows)
+    turn_red = False
+    states = [state]
+    moves = []
+    while len(moves) < max_moves and tree.analyze_position(
+        board_size,
+        state
+    ).terminal == tree.GameEnd.NOT_ENDED:
+        choices = [
+            move
+            for moves_from_place in
+                tree.legal_moves(board_size, state, turn_red).values()
+            for move in moves_from_place
+        ]
+        if choices:
+            move = generator.choice(choices)
+            state = tree.move_result(state, move)
+            states.append(state)
+            moves.append(move)
+        turn_red = not turn_red
+    return states, moves
+def transform_state(board_size, state, mirror, flip):
+    '''
+    Mirrors a State from left to right and/or flips it upside down. Flipping
+    also swaps the colors of the pieces.
+    '''
+    def transform(positions):
+        return frozenset(
+            tree.transform_place(board_size, place, mirror, flip)
+            for place in positions
+        )
+    if flip:
+        return tree.State(
+            positions_red=transform(state.positions_black),
+            positions_black=transform(state.positions_red)
+        )
+    return tree.State(*map(transform, state))
+def quiet_value(board_size, state, turn_red):
+    '''
+    Returns the value of a position after all of the forced captures have
+    been made, found without any pruning.
+    '''
+    analysis = tree.analyze_position(board_size, state)
+    if analysis.terminal != tree.GameEnd.NOT_ENDED:
+        return tree.UTILITY_VALUES_TERMINAL[analysis.terminal]
+    if not (analysis.captures_red if turn_red else analysis.captures_black):
+        return tree.evaluate_state(board_size, state, turn_red, analysis)
+    values = [
+        quiet_value(board_size, tree.move_result(state, move), not turn_red)
+        for move in (analysis.moves_red if turn_red else analysis.moves_black)
+    ]
+    return max(values) if turn_red else min(values)
+def plain_value(cutoff_depth, board_size, state, turn_red, depth=0):
+    '''
+    Returns the minimax value of a position to a cutoff depth, found without
+    any pruning, caching, or reductions.
+    '''
+    if depth >= cutoff_depth:
+        return quiet_value(board_size, state, turn_red)
+    v = tree.cutoff_test(cutoff_depth, board_size, state, turn_red, depth)
+    if v is not None:
+        return v
+    analysis = tree.analyze_position(board_size, state)
+    moves = analysis.moves_red if turn_red else analysis.moves_black
+    if not moves:
+        # The turn is forfeited.
+        return plain_value(
+            cutoff_depth,
+            board_size,
+            state,
+            not turn_red,
+            depth + 1
+        )
+    values = [
+        plain_value(
+            cutoff_depth,
+            board_size,
+            tree.move_result(state, move),
+            not turn_red,
+            depth + 1
+        ) for move in moves
+    ]
+    return max(values) if turn_red else min(values)
+def search_value(cutoff_depth, stop, board_size, state, turn_red):
+    '''
+    Returns the return value of tree.minimax_value for a position with the
+    full window.
+    '''
+    return tree.minimax_value(
+        cutoff_depth,
+        stop,
+        turn_red,
+        0,
+        board_size,
+        state,
+        tree.UTILITY_VALUES_TERMINAL[tree.GameEnd.WIN_BLACK],
+        tree.UTILITY_VALUES_TERMINAL[tree.GameEnd.WIN_RED]
+    )
+def deepen(board_size, state, turn_red):
+    '''
+    Runs tree.alpha_beta_gradual_depth on a position until it stops.
+    
+    Returns:
+        A tuple of the last result that it appended and the number of nodes
+        that it searched
+    '''
+    results = []
+    stop = tree.SearchToken()
+    tree.alpha_beta_gradual_depth(
+        results,
+        threading.Condition(),
+        stop,
+        threading.Event(),
+        turn_red,
+        0,
+        board_size,
+        state,
+        tree.UTILITY_VALUES_TERMINAL[tree.GameEnd.WIN_BLACK],
+        tree.UTILITY_VALUES_TERMINAL[tree.GameEnd.WIN_RED]
+    )
+    return results[-1], stop.statistics().nodes
+
+class EngineTestCase(unittest.TestCase):
+    '''
+    This class starts each check with empty caches.
+    '''
+    def setUp(self):
+        tree.clear_caches()
+    def tearDown(self):
+        tree.clear_caches()
+class QuiescenceTest(EngineTestCase):
+    def test_captures_are_resolved_past_the_cutoff(self):
+        captures = 0
+        for seed in range(3):
+            states, _ = random_game(6, 2, seed)
+            for state in states:
+                if tree.analyze_position(6, state).terminal != \
+                    tree.GameEnd.NOT_ENDED:
+                    continue
+                for turn_red in (False, True):
+                    v, _, max_depth = search_value(
+                        0,
+                        tree.SearchToken(),
+                        6,
+                        state,
+                        turn_red
+                    )
+                    self.assertEqual(v, quiet_value(6, state, turn_red))
+                    analysis = tree.analyze_position(6, state)
+                    if analysis.captures_red if turn_red else \
+                        analysis.captures_black:
+                        captures += 1
+                        self.assertGreater(max_depth, 0)
+        self.assertTrue(captures)
+class MTDFTest(EngineTestCase):
+    def test_value_matches_alpha_beta(self):
+        for name, board_size, state, turn_red in \
+            benchmark.BENCHMARK_POSITIONS:
+            for cutoff_depth in (2, 4, 6):
+                tree.clear_caches()
+                v, _, _ = search_value(
+                    cutoff_depth,
+                    tree.SearchToken(),
+                    board_size,
+                    state,
+                    turn_red
+                )
+                tree.clear_caches()
+                v_mtdf, _, _ = tree.mtdf_value(
+                    cutoff_depth,
+                    tree.SearchToken(),
+                    turn_red,
+                    0,
+                    board_size,
+                    state
+                )
+                self.assertEqual(v_mtdf, v, (name, cutoff_depth))
+class BitboardTest(EngineTestCase):
+    def test_values_match_tree(self):
+        for name, board_size, state, turn_red in \
+            benchmark.BENCHMARK_POSITIONS:
+            config = bitboard.get_config(board_size)
+            red, black = config.from_state(state)
+            for cutoff_depth in (2, 4, 6):
+                tree.clear_caches()
+                v_tree, _, _ = search_value(
+                    cutoff_depth,
+                    tree.SearchToken(),
+                    board_size,
+                    state,
+                    turn_red
+                )
+                v_bitboard, _ = config.search(
+                    red,
+                    black,
+                    turn_red,
+                    0,
+                    cutoff_depth,
+                    -math.inf,
+                    math.inf,
+                    tree.evaluate_state.weights,
+                    [0]
+                )
+                self.assertEqual(v_bitboard, v_tree, (name, cutoff_depth))
+class SymmetryTest(EngineTestCase):
+    def test_variants_share_a_key(self):
+        states, _ = random_game(6, 2, 0)
+        alpha, beta = -1.0, 2.0
+        for state in states:
+            for turn_red in (False, True):
+                key, mirror, flip = \
+                    tree.symmetric_cache_key(turn_red, 6, state, alpha, beta)
+                for mirror_variant in (False, True):
+                    for flip_variant in (False, True):
+                        variant = transform_state(
+                            6,
+                            state,
+                            mirror_variant,
+                            flip_variant
+                        )
+                        if flip_variant:
+                            arguments = (not turn_red, variant, -beta, -alpha)
+                        else:
+                            arguments = (turn_red, variant, alpha, beta)
+                        self.assertEqual(
+                            tree.symmetric_cache_key(
+                                arguments[0],
+                                6,
+                                *arguments[1:]
+                            )[0],
+                            key
+                        )
+    def test_flipped_value_is_negated(self):
+        symmetry = tree.minimax_value.symmetry
+        tree.minimax_value.symmetry = False
+        try:
+            for name, board_size, state, turn_red in \
+                benchmark.BENCHMARK_POSITIONS:
+                v, _, _ = search_value(
+                    4,
+                    tree.SearchToken(),
+                    board_size,
+                    state,
+                    turn_red
+                )
+                v_flipped, _, _ = search_value(
+                    4,
+                    tree.SearchToken(),
+                    board_size,
+                    transform_state(board_size, state, True, True),
+                    not turn_red
+                )
+                self.assertAlmostEqual(v_flipped, -v, msg=name)
+        finally:
+            tree.minimax_value.symmetry = symmetry
+class RecordTest(EngineTestCase):
+    def test_round_trip(self):
+        # A 10x10 board has two bytes for each move.
+        games = [
+            (board_size, starting_rows) + random_game(
+                board_size,
+                starting_rows,
+                seed
+            )
+            for board_size, starting_rows in ((6, 2), (8, 3), (10, 4))
+            for seed in range(3)
+        ]
+        f = io.BytesIO()
+        writer = record.RecordWriter(f)
+        for board_size, starting_rows, states, moves in games:
+            writer.write_game(moves, board_size, starting_rows)
+        f.seek(0)
+        records = list(record.RecordReader(f))
+        self.assertEqual(len(records), len(games))
+        for game_record, (board_size, starting_rows, states, moves) in zip(
+            records,
+            games
+        ):
+            self.assertEqual(game_record.board_size, board_size)
+            self.assertEqual(game_record.starting_rows, starting_rows)
+            self.assertEqual(record.decode_moves(game_record), moves)
+            self.assertEqual(record.replay_states(game_record), states)
+class EngineHostTest(EngineTestCase):
+    def test_stopping_a_session_leaves_the_others(self):
+        engine_host = host.EngineHost(workers=2, time_limit=1.0)
+        try:
+            name, board_size, state, turn_red = \
+                benchmark.BENCHMARK_POSITIONS[0]
+            stopped = engine_host.open_session()
+            running = engine_host.open_session()
+            stopped_move = stopped.search(board_size, state, turn_red)
+            running_move = running.search(board_size, state, turn_red)
+            # Wait until both searches have started.
+            while not (stopped_move.running() and running_move.running()):
+                time.sleep(0.01)
+            stopped.stop()
+            self.assertIsNone(stopped_move.result(timeout=10))
+            self.assertFalse(running_move.done())
+            self.assertIsNotNone(running_move.result(timeout=10))
+            self.assertEqual(stopped.statistics.stopped, 1)
+            self.assertEqual(running.statistics.stopped, 0)
+            self.assertEqual(running.statistics.moves, 1)
+        finally:
+            engine_host.shutdown()
+class DeterministicTest(EngineTestCase):
+    def test_node_counts_repeat(self):
+        helpers = tree.younger_brothers_value.helpers
+        pool = tree.younger_brothers_value.pool
+        deterministic = tree.younger_brothers_value.deterministic
+        tree.younger_brothers_value.helpers = 2
+        tree.younger_brothers_value.pool = multiprocessing.pool.ThreadPool(2)
+        tree.younger_brothers_value.deterministic = True
+        try:
+            name, board_size, state, turn_red = \
+                benchmark.BENCHMARK_POSITIONS[0]
+            results = []
+            for i in range(3):
+                tree.clear_caches()
+                stop = tree.SearchToken()
+                v, v_move, _ = \
+                    search_value(6, stop, board_size, state, turn_red)
+                results.append((v, v_move, stop.statistics().nodes))
+            self.assertEqual(results[1:], results[:-1])
+        finally:
+            tree.younger_brothers_value.pool.terminate()
+            tree.younger_brothers_value.helpers = helpers
+            tree.younger_brothers_value.pool = pool
+            tree.younger_brothers_value.deterministic = deterministic
+class CancellationTest(EngineTestCase):
+    def test_wait_returns_when_the_search_is_idle(self):
+        name, board_size, state, turn_red = benchmark.BENCHMARK_POSITIONS[0]
+        time_limit = tree.SearchTimeLimit
+        tree.SearchTimeLimit = 60
+        try:
+            search = threading.Thread(
+                target=tree.alpha_beta_search,
+                args=(board_size, state, turn_red)
+            )
+            search.start()
+            while not tree.stops:
+                time.sleep(0.01)
+            stop = tree.stops[0]
+            # Let the search get going before it is stopped.
+            time.sleep(0.2)
+            tree.stop_all()
+            tree.wait_for_stopped_searches()
+            self.assertIsNotNone(stop.stop_latency)
+            self.assertTrue(stop.wait_idle(0))
+            search.join(10)
+            self.assertFalse(search.is_alive())
+        finally:
+            tree.SearchTimeLimit = time_limit
+class SnapshotTest(EngineTestCase):
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.filename = os.path.join(directory.name, "tree.snapshot")
+    def test_write_and_probe(self):
+        cutoff_depth_stop = tree.alpha_beta_gradual_depth.cutoff_depth_stop
+        tree.alpha_beta_gradual_depth.cutoff_depth_stop = 9
+        try:
+            for name, board_size, state, turn_red in \
+                benchmark.BENCHMARK_POSITIONS:
+                tree.alpha_beta_gradual_depth(
+                    [],
+                    threading.Condition(),
+                    tree.SearchToken(),
+                    threading.Event(),
+                    turn_red,
+                    0,
+                    board_size,
+                    state,
+                    tree.UTILITY_VALUES_TERMINAL[tree.GameEnd.WIN_BLACK],
+                    tree.UTILITY_VALUES_TERMINAL[tree.GameEnd.WIN_RED]
+                )
+        finally:
+            tree.alpha_beta_gradual_depth.cutoff_depth_stop = \
+                cutoff_depth_stop
+        minimax = dict(tree.minimax_value._cache.items())
+        search = dict(tree.alpha_beta_gradual_depth._cache.items())
+        self.assertTrue(minimax)
+        self.assertTrue(search)
+        self.assertEqual(
+            snapshot.write_snapshot(self.filename),
+            len(minimax) + len(search)
+        )
+        result = snapshot.Snapshot(self.filename)
+        try:
+            for key, value in minimax.items():
+                self.assertEqual(result.minimax_result(key), value)
+                self.assertIsNone(result.search_result(key))
+            for key, value in search.items():
+                self.assertEqual(result.search_result(key), value)
+            weights = tuple(-w for w in tree.evaluate_state.weights)
+            for key in minimax:
+                self.assertIsNone(result.minimax_result(key[:-1] + (weights,)))
+        finally:
+            result.close()
+class IterateSearchTest(EngineTestCase):
+    def test_depths_increase_until_closed(self):
+        name, board_size, state, turn_red = benchmark.BENCHMARK_POSITIONS[0]
+        stop = tree.SearchToken()
+        iterations = tree.iterate_search(board_size, state, turn_red, stop)
+        depths = []
+        for iteration in iterations:
+            depths.append(iteration.depth)
+            self.assertEqual(iteration.pv[:1], (iteration.move,))
+            if len(depths) == 2:
+                break
+        iterations.close()
+        self.assertEqual(
+            depths,
+            [
+                tree.alpha_beta_gradual_depth.cutoff_depth_start,
+                tree.alpha_beta_gradual_depth.cutoff_depth_start + 2
+            ]
+        )
+        self.assertTrue(stop.is_set())
+        self.assertIsNotNone(stop.stop_latency)
+class VariationReuseTest(EngineTestCase):
+    def test_reply_on_the_variation_is_resumed(self):
+        cutoff_depth_stop = tree.alpha_beta_gradual_depth.cutoff_depth_stop
+        reuse_variation = tree.alpha_beta_gradual_depth.reuse_variation
+        tree.alpha_beta_gradual_depth.cutoff_depth_stop = 11
+        try:
+            for name, board_size, state, turn_red in \
+                benchmark.BENCHMARK_POSITIONS:
+                results = []
+                for reuse in (True, False):
+                    tree.clear_caches()
+                    tree.alpha_beta_gradual_depth.reuse_variation = True
+                    (_, _, pv), _ = deepen(board_size, state, turn_red)
+                    if reuse:
+                        reply = state
+                        for move in pv[:2]:
+                            reply = tree.move_result(reply, move)
+                    else:
+                        # Search the move again without remembering the
+                        # results along its principal variation.
+                        tree.clear_caches()
+                        tree.alpha_beta_gradual_depth.reuse_variation = False
+                        deepen(board_size, state, turn_red)
+                    # Do not count the nodes of the principal variation of
+                    # the reply.
+                    tree.alpha_beta_gradual_depth.reuse_variation = False
+                    (cutoff_depth, (v, _, _), _), nodes = \
+                        deepen(board_size, reply, turn_red)
+                    results.append((cutoff_depth, v, nodes))
+                # The same depth is reached with the same value.
+                self.assertEqual(results[0][:2], results[1][:2], name)
+                self.assertLess(results[0][2], results[1][2], name)
+        finally:
+            tree.alpha_beta_gradual_depth.cutoff_depth_stop = \
+                cutoff_depth_stop
+            tree.alpha_beta_gradual_depth.reuse_variation = reuse_variation
+class SelectiveSearchTest(EngineTestCase):
+    def test_value_without_reductions_is_exact(self):
+        switches = (
+            tree.minimax_value.late_move_reductions,
+            tree.minimax_value.futility_pruning
+        )
+        tree.minimax_value.late_move_reductions = False
+        tree.minimax_value.futility_pruning = False
+        try:
+            for name, board_size, state, turn_red in \
+                benchmark.BENCHMARK_POSITIONS:
+                for cutoff_depth in (2, 4, 6):
+                    tree.clear_caches()
+                    v, _, _ = search_value(
+                        cutoff_depth,
+                        tree.SearchToken(),
+                        board_size,
+                        state,
+                        turn_red
+                    )
+                    self.assertEqual(
+                        v,
+                        plain_value(cutoff_depth, board_size, state, turn_red),
+                        (name, cutoff_depth)
+                    )
+        finally:
+            (
+                tree.minimax_value.late_move_reductions,
+                tree.minimax_value.futility_pruning
+            ) = switches
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,10 +1,23 @@
 #!/usr/bin/env python3
 import common
-import atexit, collections, enum, itertools, math, multiprocessing.pool, \
-    os.path, pickle, sys, threading, time
+import asyncio, atexit, collections, collections.abc, concurrent.futures, \
+    enum, itertools, math, multiprocessing.pool, os.path, pickle, sys, \
+    threading, time
 sys.setrecursionlimit(3200)
 # Limit searching to 14.7 seconds. The project directions impose a limit of 15.
 SearchTimeLimit = 14.7
+# Limit the search caches to about this many bytes in total. When they grow
+# past it, entries are evicted before the next cutoff depth is searched. None
+# means no limit.
+CacheMemoryLimit = 1 << 30
+# The snapshot.Snapshot of the saved caches in which the entries that are not
+# in the caches of minimax_value and alpha_beta_gradual_depth are looked up,
+# or None. See snapshot.use_snapshot.
+CacheSnapshot = None
+# The number of shards in each ShardedCache, or None to use dictionaries for
+# the caches. This is set when the module is loaded on a free-threaded build
+# of Python. Use set_cache_shards to change it.
+CacheShards = None
 
 GameEnd = enum.Enum("GameEnd", "NOT_ENDED WIN_RED WIN_BLACK DRAW")
 UTILITY_VALUES_TERMINAL = {
@@ -13,6 +26,12 @@ UTILITY_VALUES_TERMINAL = {
     GameEnd.DRAW: 0.0
 }
 AIDifficulty = enum.Enum("AIDifficulty", "EASY MEDIUM HARD")
+# ALPHA_BETA searches each cutoff depth once with a full window. MTDF converges
+# on the value with zero-window searches that share a transposition table.
+SearchDriver = enum.Enum("SearchDriver", "ALPHA_BETA MTDF")
+# OFF counts nothing. COUNTERS counts the nodes and the prunes of each search.
+# FULL also counts the nodes at each depth and the cache hits.
+StatisticsLevel = enum.Enum("StatisticsLevel", "OFF COUNTERS FULL")
 HEURISTIC_WEIGHTS = {
     # Generation 0 - set by exponentiating math.log(18) and dividing by 100
     AIDifficulty.EASY: (0.6979, 0.2415, 0.0835, 0.0289, 0.01, 0.0035),
@@ -25,6 +44,16 @@ HEURISTIC_WEIGHTS = {
     # Generation 4 - set by trial and error
     AIDifficulty.HARD: (0.4174, 0.8370, 0.0456, 0.1986, 0.1112, 0.3588)
 }
+# When futility pruning is on, a quiet move at a frontier node is assumed not
+# to improve the value for the player who makes it by more than this. In
+# random games, 90% of the quiet moves improved it by no more than these with
+# each difficulty's weights. Moves that make captures possible improve it by
+# much more, so larger margins prune almost nothing.
+FUTILITY_MARGINS = {
+    AIDifficulty.EASY: 1.5,
+    AIDifficulty.MEDIUM: 2.7,
+    AIDifficulty.HARD: 0.83
+}
 # Place is a pair of ints.
 Place = collections.namedtuple("Place", ("row", "column"))
 # Vector is a pair of ints.
@@ -36,6 +65,24 @@ Move = collections.namedtuple(
     "Move",
     ("place_from", "place_to", "place_capture")
 )
+# PositionAnalysis is what analyze_position finds out about a State: a tuple
+# of the legal Moves of each player, whether each player's moves are
+# captures, and a member of the GameEnd enum.
+PositionAnalysis = collections.namedtuple(
+    "PositionAnalysis",
+    (
+        "moves_red",
+        "moves_black",
+        "captures_red",
+        "captures_black",
+        "terminal"
+    )
+)
+# One completed cutoff depth of iterate_search
+SearchIteration = collections.namedtuple(
+    "SearchIteration",
+    ("depth", "value", "move", "pv", "statistics")
+)
 
 VECTORS_RED = (
     Vector(delta_row=1, delta_column=-1),
@@ -53,15 +100,27 @@ class Statistics:
     This class keeps track of the statistics that the project directions say to
     output every time that the alpha-beta search function is invoked.
     '''
-    def __init__(self, max_depth=0):
+    def __init__(self, max_depth=0, nodes=1):
         # The maximum depth of the tree that was seen
         self.max_depth = max_depth
         # The total number of nodes that were generated
-        self.nodes = 1
+        self.nodes = nodes
         # The number of times that pruning occurred in the max_value function
         self.prunes_in_max = 0
         # The number of times that pruning occurred in the min_value function
         self.prunes_in_min = 0
+        # The number of nodes at each depth (only for StatisticsLevel.FULL)
+        self.nodes_by_depth = collections.Counter()
+        # The number of nodes whose value was found in a cache (only for
+        # StatisticsLevel.FULL)
+        self.cache_hits = 0
+        # The number of moves that were searched with late move reductions,
+        # and how many of them were searched again to the full depth
+        self.reductions = 0
+        self.researches = 0
+        # The number of frontier nodes whose moves were skipped by futility
+        # pruning
+        self.futility_prunes = 0
     def accumulate(self, other):
         '''
         Combines another instance of Statistics with this one.
@@ -70,6 +129,181 @@ class Statistics:
         self.nodes += other.nodes
         self.prunes_in_max += other.prunes_in_max
         self.prunes_in_min += other.prunes_in_min
+        self.nodes_by_depth.update(other.nodes_by_depth)
+        self.cache_hits += other.cache_hits
+        self.reductions += other.reductions
+        self.researches += other.researches
+        self.futility_prunes += other.futility_prunes
+class SearchToken(threading.Event):
+    '''
+    This is the stop event of one search. It also holds the counters of the
+    search. Each thread that works on the search counts in its own Statistics,
+    so the counters do not have to be locked, and the counters are combined
+    when they are read.
+    
+    A token can have a parent token. It counts as set when its parent is set,
+    and it shares the counters of its parent. This is used to stop part of a
+    search without stopping the rest. Setting a token sets the stopped
+    attribute of its children too, so the search only has to read one
+    attribute at each node to find out whether to stop. Do not wait on a
+    token that has a parent.
+    
+    A token can carry the weights of evaluate_state for its search, so that
+    searches with different weights can run at the same time. The weights are
+    part of the cache keys, so the searches still share the caches. A child
+    token has the weights of its parent.
+    
+    A token for a task is a child token that keeps its own counters and its
+    own changes to the cache of minimax_value, so that the task can be
+    searched without affecting other tasks. Its changes can be merged into its
+    parent later with merge_task, or they can be thrown away. A task is only
+    searched by one thread at a time.
+    
+    The threads that work on a search call enter when they start and leave
+    when they are done, so that the root token knows when the search is idle.
+    After the search is stopped, stop_latency is the number of seconds that it
+    took for the last thread to leave.
+    '''
+    def __init__(self, parent=None, task=False, weights=None):
+        super().__init__()
+        self._parent = parent
+        self._children = set()
+        # This is True when this token or one of its parents is set.
+        self.stopped = False
+        # These are the values of time.perf_counter when the token was set and
+        # when the search last became idle.
+        self.stop_time = None
+        self.idle_time = None
+        if parent is None:
+            self._root = self
+            self._local = threading.local()
+            self._lock = threading.Lock()
+            self._idle = threading.Condition(self._lock)
+            self._active = 0
+            self._all = []
+            self._task = None
+            # The cache of minimax_value, or None for minimax_value._cache
+            self.cache = None
+            # The weights of evaluate_state, or None for
+            # evaluate_state.weights
+            self.weights = weights
+        else:
+            self._root = parent._root
+            self._local = parent._local
+            self._lock = parent._lock
+            self._all = parent._all
+            self.weights = parent.weights
+            with self._lock:
+                parent._children.add(self)
+                self.stopped = parent.stopped
+            if task:
+                self._task = Statistics(nodes=0)
+                self.cache = collections.ChainMap(
+                    {},
+                    *(
+                        (minimax_value._cache,) if parent.cache is None else
+                            parent.cache.maps
+                    )
+                )
+            else:
+                self._task = parent._task
+                self.cache = parent.cache
+    def set(self):
+        with self._lock:
+            if self.stop_time is None:
+                self.stop_time = time.perf_counter()
+            tokens = [self]
+            while tokens:
+                token = tokens.pop()
+                token.stopped = True
+                tokens.extend(token._children)
+        super().set()
+    def is_set(self):
+        return self.stopped
+    def detach(self):
+        '''
+        Removes this token from its parent once it is no longer used, so that
+        setting the parent does not have to visit it.
+        '''
+        if self._parent is not None:
+            with self._lock:
+                self._parent._children.discard(self)
+    def enter(self):
+        '''
+        Counts the current thread as working on the search.
+        '''
+        root = self._root
+        with self._lock:
+            root._active += 1
+    def leave(self):
+        '''
+        Stops counting the current thread as working on the search.
+        '''
+        root = self._root
+        with self._lock:
+            root._active -= 1
+            if not root._active:
+                root.idle_time = time.perf_counter()
+                root._idle.notify_all()
+    def wait_idle(self, timeout=None):
+        '''
+        Waits until no threads are working on the search.
+        
+        Returns:
+            True if the search is idle, or False if the timeout passed first
+        '''
+        root = self._root
+        with self._lock:
+            return root._idle.wait_for(lambda: not root._active, timeout)
+    @property
+    def stop_latency(self):
+        '''
+        Returns the number of seconds from when the search was stopped to when
+        it became idle, 0.0 if it was already idle, or None if it has not been
+        stopped or it is not idle yet.
+        '''
+        root = self._root
+        with self._lock:
+            if root.stop_time is None or root._active:
+                return None
+            if root.idle_time is None:
+                return 0.0
+            return max(0.0, root.idle_time - root.stop_time)
+    def merge_task(self, task):
+        '''
+        Adds the counters and the cache entries of a task to this token.
+        
+        Arguments:
+            task: a SearchToken that was created with task=True
+        '''
+        (
+            minimax_value._cache if self.cache is None else self.cache.maps[0]
+        ).update(task.cache.maps[0])
+        if minimax_value.statistics != StatisticsLevel.OFF:
+            self.counters().accumulate(task._task)
+    def counters(self):
+        '''
+        Returns the Statistics that the current thread counts in.
+        '''
+        if self._task is not None:
+            return self._task
+        try:
+            return self._local.statistics
+        except AttributeError:
+            statistics = self._local.statistics = Statistics(nodes=0)
+            with self._lock:
+                self._all.append(statistics)
+            return statistics
+    def statistics(self, max_depth=0):
+        '''
+        Returns a new Statistics with the counts from all threads so far.
+        '''
+        result = Statistics(max_depth, 0)
+        with self._lock:
+            for statistics in self._all:
+                result.accumulate(statistics)
+        result.max_depth = max_depth
+        return result
 
 def add_vector(place, vector):
     '''
@@ -181,6 +415,11 @@ def legal_moves(board_size, state, turn_red):
         return legal_moves._cache[cache_key]
     except KeyError:
         pass
+    result = _find_legal_moves(board_size, state, turn_red)
+    legal_moves._cache[cache_key] = result
+    return result
+def _find_legal_moves(board_size, state, turn_red):
+    # This is legal_moves without the cache.
     captures_all = False
     result = {}
     for place_from in (
@@ -212,7 +451,6 @@ def legal_moves(board_size, state, turn_red):
                 # Let's also remember that we are now only looking for
                 # captures.
                 captures_all = True
-    legal_moves._cache[cache_key] = result
     return result
 def legal_moves_as_tuple(*args, **kwargs):
     '''
@@ -230,24 +468,151 @@ def legal_moves_as_tuple(*args, **kwargs):
     )
     legal_moves_as_tuple._cache[cache_key] = result
     return result
-def game_ended(board_size, state):
+def analyze_position(board_size, state):
     '''
-    Checks whether the state is terminal (i.e. the game is over).
+    Finds everything about a state that the search needs at a node: the legal
+    moves of both players, whether they are captures, and whether the game has
+    ended. The result is cached, so a node costs one lookup however many of
+    these it uses.
+    
+    Returns:
+        A PositionAnalysis
     '''
+    cache_key = (board_size, state)
+    try:
+        return analyze_position._cache[cache_key]
+    except KeyError:
+        pass
+    moves_red = tuple(
+        itertools.chain.from_iterable(
+            _find_legal_moves(board_size, state, True).values()
+        )
+    )
+    moves_black = tuple(
+        itertools.chain.from_iterable(
+            _find_legal_moves(board_size, state, False).values()
+        )
+    )
     if not state.positions_black:
-        return GameEnd.WIN_RED
-    if not state.positions_red:
-        return GameEnd.WIN_BLACK
-    # Check for legal moves that either player can make.
-    if not legal_moves(board_size, state, False) and \
-        not legal_moves(board_size, state, True):
+        terminal = GameEnd.WIN_RED
+    elif not state.positions_red:
+        terminal = GameEnd.WIN_BLACK
+    elif not moves_red and not moves_black:
         # If there are no legal moves, whoever has more pieces wins.
         if len(state.positions_black) > len(state.positions_red):
-            return GameEnd.WIN_BLACK
-        if len(state.positions_black) < len(state.positions_red):
-            return GameEnd.WIN_RED
-        return GameEnd.DRAW
-    return GameEnd.NOT_ENDED
+            terminal = GameEnd.WIN_BLACK
+        elif len(state.positions_black) < len(state.positions_red):
+            terminal = GameEnd.WIN_RED
+        else:
+            terminal = GameEnd.DRAW
+    else:
+        terminal = GameEnd.NOT_ENDED
+    result = PositionAnalysis(
+        moves_red=moves_red,
+        moves_black=moves_black,
+        captures_red=bool(moves_red) and
+            moves_red[0].place_capture is not None,
+        captures_black=bool(moves_black) and
+            moves_black[0].place_capture is not None,
+        terminal=terminal
+    )
+    analyze_position._cache[cache_key] = result
+    return result
+def game_ended(board_size, state):
+    '''
+    Checks whether the state is terminal (i.e. the game is over).
+    '''
+    return analyze_position(board_size, state).terminal
+def symmetry_table(board_size):
+    '''
+    Returns a dictionary that maps each Place on the board to a tuple of four
+    ints, each with one bit set. The bits are for the Place itself, the Place
+    mirrored from left to right, the Place flipped upside down, and the Place
+    mirrored and flipped.
+    '''
+    try:
+        return symmetry_table._cache[board_size]
+    except KeyError:
+        pass
+    last = board_size - 1
+    result = {
+        Place(row, column): tuple(
+            1 << (row_new * board_size + column_new)
+            for row_new, column_new in (
+                (row, column),
+                (row, last - column),
+                (last - row, column),
+                (last - row, last - column)
+            )
+        )
+        for row in range(board_size)
+        for column in range(board_size)
+    }
+    symmetry_table._cache[board_size] = result
+    return result
+def symmetric_cache_key(turn_red, board_size, state, alpha, beta):
+    '''
+    A state is just as good for a player after the board is mirrored from left
+    to right. A state is also just as good for a player after the board is
+    flipped upside down and the colors of all pieces are swapped, if it becomes
+    the other player's turn. (The utility value is negated, and so are alpha
+    and beta, which also trade places.) This function returns a key that is the
+    same for all four of these variants of a state. The pieces are stored as
+    ints to keep the key small.
+    
+    Returns:
+        A tuple of the key, whether the state was mirrored to get the key, and
+        whether the state was flipped to get the key
+    '''
+    table = symmetry_table(board_size)
+    red_0 = red_1 = red_2 = red_3 = 0
+    for place in state.positions_red:
+        bit_0, bit_1, bit_2, bit_3 = table[place]
+        red_0 |= bit_0
+        red_1 |= bit_1
+        red_2 |= bit_2
+        red_3 |= bit_3
+    black_0 = black_1 = black_2 = black_3 = 0
+    for place in state.positions_black:
+        bit_0, bit_1, bit_2, bit_3 = table[place]
+        black_0 |= bit_0
+        black_1 |= bit_1
+        black_2 |= bit_2
+        black_3 |= bit_3
+    # When the board is flipped, the colors are swapped.
+    position, mirror, flip = min(
+        ((turn_red, red_0, black_0), False, False),
+        ((turn_red, red_1, black_1), True, False),
+        ((not turn_red, black_2, red_2), False, True),
+        ((not turn_red, black_3, red_3), True, True)
+    )
+    if flip:
+        return (position, board_size, -beta, -alpha), mirror, flip
+    return (position, board_size, alpha, beta), mirror, flip
+def transform_place(board_size, place, mirror, flip):
+    '''
+    Mirrors a Place from left to right and/or flips it upside down. Doing the
+    same thing twice returns the original Place.
+    '''
+    return Place(
+        row=board_size - 1 - place.row if flip else place.row,
+        column=board_size - 1 - place.column if mirror else place.column
+    )
+def transform_result(board_size, result, mirror, flip):
+    '''
+    Converts a return value of minimax_value between a state and the variant
+    of the state that symmetric_cache_key picked.
+    '''
+    v, v_move, max_depth = result
+    if not (mirror or flip):
+        return result
+    if v_move is not None:
+        v_move = Move(*(
+            None if place is None else
+                transform_place(board_size, place, mirror, flip)
+            for place in v_move
+        ))
+    return -v if flip else v, v_move, max_depth
 def log_fraction_safe(numerator, denominator, if_top_zero, if_bottom_zero):
     if numerator == denominator:
         return 0.0
@@ -256,24 +621,34 @@ def log_fraction_safe(numerator, denominator, if_top_zero, if_bottom_zero):
     if denominator == 0:
         return if_bottom_zero
     return math.log(numerator / denominator)
-def evaluate_state(board_size, state, turn_red):
+def state_features(board_size, state, analysis=None):
     '''
-    This is the heuristic evaluation function for cutting off the alpha-beta
-    search. It attempts to estimate the utility value of a state. Higher values
-    favor the red player, and lower values favor the black player.
+    Returns a tuple of the six heuristics of evaluate_state for a state, before
+    they are multiplied by the weights. They do not depend on the weights, so
+    they are cached for any difficulty. The cache keeps up to
+    state_features.cache_size states. When it is full, the oldest
+    state_features.evict_fraction of them are evicted.
+    
+    Arguments:
+        board_size: the number of squares in a row or column on the board
+        state: the State to evaluate
+        analysis: the PositionAnalysis of the state, if the caller has it
     '''
+    cache_key = (board_size, state)
+    try:
+        return state_features._cache[cache_key]
+    except KeyError:
+        pass
+    if analysis is None:
+        analysis = analyze_position(board_size, state)
     limit = (board_size // 2) ** 2 + math.ceil(board_size / 2) ** 2
     middle = (board_size - 1) / 2.0
     num_pieces_red = len(state.positions_red)
     num_pieces_black = len(state.positions_black)
-    moves_red = legal_moves_as_tuple(board_size, state, True)
-    moves_black = legal_moves_as_tuple(board_size, state, False)
-    num_moves_red = len(moves_red)
-    num_moves_black = len(moves_black)
-    num_captures_red = \
-        len(moves_red) if moves_red and moves_red[0].place_capture else 0
-    num_captures_black = \
-        len(moves_black) if moves_black and moves_black[0].place_capture else 0
+    num_moves_red = len(analysis.moves_red)
+    num_moves_black = len(analysis.moves_black)
+    num_captures_red = num_moves_red if analysis.captures_red else 0
+    num_captures_black = num_moves_black if analysis.captures_black else 0
     # For every red piece, check whether the two spots to the left and right in
     # the row above are occupied (or not even on the board). Then, do the same
     # for the black pieces.
@@ -292,9 +667,7 @@ def evaluate_state(board_size, state, turn_red):
             (state.positions_black, VECTORS_RED)
         )
     )
-    # Compute a float for the utility value.
-    weights = iter(evaluate_state.weights)
-    return (
+    result = (
         # The best heuristic is the difference in the number of pieces of each
         # player. If the red player has more pieces, the red player is winning,
         # so the utility value should be higher. The log of the ratio of the
@@ -302,20 +675,16 @@ def evaluate_state(board_size, state, turn_red):
         # the number of pieces as your opponent. A ratio of 1 results in a 0.
         # A ratio with more red pieces results in a positive number. A ratio
         # with more black pieces results in a negative number.
-        log_fraction_safe(num_pieces_red, num_pieces_black, -limit, limit) *
-        next(weights) +
+        log_fraction_safe(num_pieces_red, num_pieces_black, -limit, limit),
         # Consider the difference in the number of pieces that cannot be
         # captured either because the spaces behind them are occupied or
         # because they are on the edge of the board. If both spaces are blocked
         # or not on the board, the piece is counted twice.
-        log_fraction_safe(num_friends_red, num_friends_black, -limit, limit) *
-        next(weights) +
+        log_fraction_safe(num_friends_red, num_friends_black, -limit, limit),
         # Consider the number of moves where the player can capture.
-        log_fraction_safe(num_captures_red, num_captures_black, -limit, limit) *
-        next(weights) +
+        log_fraction_safe(num_captures_red, num_captures_black, -limit, limit),
         # Consider the number of moves in general.
-        log_fraction_safe(num_moves_red, num_moves_black, -limit, limit) *
-        next(weights) +
+        log_fraction_safe(num_moves_red, num_moves_black, -limit, limit),
         # Keep pieces near the player's home row.
         sum(
             middle - p.row
@@ -323,53 +692,349 @@ def evaluate_state(board_size, state, turn_red):
                 state.positions_red,
                 state.positions_black
             )
-        ) / middle * next(weights) +
+        ) / middle,
         # Control the middle columns of the board.
         (
             sum(middle - abs(p.column - middle) for p in state.positions_red) -
             sum(middle - abs(p.column - middle) for p in state.positions_black)
-        ) / middle * next(weights)
+        ) / middle
+    )
+    cache = state_features._cache
+    if len(cache) >= state_features.cache_size:
+        # Evict a batch of the oldest states at once. Evicting one state for
+        # each insert would skip over the deleted entries at the front of the
+        # dictionary every time. Another thread may have evicted the same
+        # states already.
+        count = len(cache) - int(
+            state_features.cache_size * (1.0 - state_features.evict_fraction)
+        ) + 1
+        for key in _oldest_keys(cache, count):
+            cache.pop(key, None)
+    cache[cache_key] = result
+    return result
+def evaluate_state(board_size, state, turn_red, analysis=None, weights=None):
+    '''
+    This is the heuristic evaluation function for cutting off the alpha-beta
+    search. It attempts to estimate the utility value of a state. Higher values
+    favor the red player, and lower values favor the black player. It is the
+    sum of the heuristics from state_features times the weights, which are
+    evaluate_state.weights by default. The PositionAnalysis of the state can
+    be passed if the caller has it.
+    '''
+    features = state_features(board_size, state, analysis)
+    if weights is None:
+        weights = evaluate_state.weights
+    return (
+        features[0] * weights[0] +
+        features[1] * weights[1] +
+        features[2] * weights[2] +
+        features[3] * weights[3] +
+        features[4] * weights[4] +
+        features[5] * weights[5]
     )
-def cutoff_test(cutoff_depth, board_size, state, turn_red, depth):
+def node_counters(stop, depth):
+    '''
+    Counts one node of a search at the given depth.
+    
+    Arguments:
+        stop: the SearchToken of the search
+        depth: the depth of the node
+    
+    Returns:
+        The Statistics of the current thread of the search, or None if
+        minimax_value.statistics is StatisticsLevel.OFF
+    '''
+    level = minimax_value.statistics
+    if level == StatisticsLevel.OFF:
+        return None
+    counters = stop.counters()
+    counters.nodes += 1
+    if level == StatisticsLevel.FULL:
+        counters.nodes_by_depth[depth] += 1
+    return counters
+def cutoff_test(
+    cutoff_depth,
+    board_size,
+    state,
+    turn_red,
+    depth,
+    analysis=None,
+    weights=None
+):
+    if analysis is None:
+        analysis = analyze_position(board_size, state)
     # Check whether the game has ended.
-    terminal = game_ended(board_size, state)
     try:
-        return UTILITY_VALUES_TERMINAL[terminal]
+        return UTILITY_VALUES_TERMINAL[analysis.terminal]
     except KeyError:
         pass
     # Limit the depth.
     if depth >= cutoff_depth:
-        return evaluate_state(board_size, state, turn_red)
+        return evaluate_state(board_size, state, turn_red, analysis, weights)
     return None
-def actions(
-    moves,
-    cutoff_depth,
-    stop,
-    turn_red,
-    depth,
-    board_size,
-    state,
-    alpha,
-    beta
-):
+def quiescence_value(stop, turn_red, depth, board_size, state, alpha, beta):
     '''
-    Generates the available moves and the utility value for each of them.
+    This function is called by minimax_value instead of evaluate_state once the
+    cutoff depth has been reached. If the current player is not forced to
+    capture, the state is quiet, and its heuristic value (the stand-pat value)
+    is returned. Otherwise, only the forced captures are expanded until a quiet
+    state is reached. This avoids evaluating a state in the middle of a capture
+    sequence, which is the horizon effect.
+    
+    Because captures are compulsory, the stand-pat value is not a bound on the
+    value of a state where a capture is pending. Instead, the captures are
+    searched with the ordinary alpha-beta bounds. Every capture removes a
+    piece, so the extension always ends.
+    
+    The arguments and the return value are the same as those of minimax_value,
+    except that there is no cutoff_depth.
     '''
+    if stop.stopped:
+        return 0.0, None, depth
+    counters = node_counters(stop, depth)
+    max_depth = depth
+    # Check whether the game has ended.
+    analysis = analyze_position(board_size, state)
+    try:
+        return UTILITY_VALUES_TERMINAL[analysis.terminal], None, max_depth
+    except KeyError:
+        pass
+    # If there are no captures to make, then the state is quiet, so stand pat.
+    if not (analysis.captures_red if turn_red else analysis.captures_black):
+        return (
+            evaluate_state(
+                board_size,
+                state,
+                turn_red,
+                analysis,
+                stop.weights
+            ),
+            None,
+            max_depth
+        )
+    moves = analysis.moves_red if turn_red else analysis.moves_black
+    # Expand the captures.
+    v = UTILITY_VALUES_TERMINAL[
+        GameEnd.WIN_BLACK if turn_red else GameEnd.WIN_RED
+    ]
+    v_move = None
     for v_move_new in moves:
-        v_new, _, statistics_new = minimax_value(
-            cutoff_depth,
+        v_new, _, max_depth_new = quiescence_value(
             stop,
-            turn_red,
-            depth,
+            not turn_red,
+            depth + 1,
             board_size,
             move_result(state, v_move_new),
             alpha,
             beta
         )
-        if stop.is_set():
+        if stop.stopped:
             break
-        yield v_new, v_move_new, statistics_new
-def iactions(
+        max_depth = max(max_depth, max_depth_new)
+        if turn_red:
+            if v_new >= v:
+                v = v_new
+                v_move = v_move_new
+            if v >= beta:
+                if counters is not None:
+                    counters.prunes_in_max += 1
+                break
+            alpha = max(alpha, v)
+        else:
+            if v_new <= v:
+                v = v_new
+                v_move = v_move_new
+            if v <= alpha:
+                if counters is not None:
+                    counters.prunes_in_min += 1
+                break
+            beta = min(beta, v)
+    return v, v_move, max_depth
+class SplitPoint:
+    '''
+    This class holds the younger brothers of a node that are being searched in
+    parallel, and the result of the node so far. Any thread can take the next
+    move, search it with the current bounds, and put the value back. When a
+    move causes a cutoff, the moves that are still being searched are stopped
+    because their values are no longer needed.
+    
+    If deterministic is True, the bounds are not shared. Every move is
+    searched with the bounds that the split point started with, as a task with
+    its own counters and cache entries (see SearchToken). When all of the
+    moves are done, the values are combined in the order of the moves, as the
+    serial search would, and the tasks up to the first cutoff are merged. The
+    result does not depend on which thread finished first.
+    '''
+    def __init__(
+        self,
+        moves,
+        cutoff_depth,
+        stop,
+        turn_red,
+        depth,
+        board_size,
+        state,
+        alpha,
+        beta,
+        v,
+        v_move,
+        max_depth,
+        deterministic=False
+    ):
+        self._moves = tuple(moves)
+        self._cutoff_depth = cutoff_depth
+        self._turn_red = turn_red
+        self._depth = depth
+        self._board_size = board_size
+        self._state = state
+        self._deterministic = deterministic
+        analysis = analyze_position(board_size, state)
+        self._captures = \
+            analysis.captures_red if turn_red else analysis.captures_black
+        self.alpha = alpha
+        self.beta = beta
+        self.v = v
+        self.v_move = v_move
+        self.max_depth = max_depth
+        # This is set when stop is set or when a move causes a cutoff.
+        self._node_stop = stop
+        self.stop = SearchToken(stop)
+        self._condition = threading.Condition()
+        # This is the index of the next move to search. No moves at or after
+        # self._limit are searched.
+        self._next = 0
+        self._limit = len(self._moves)
+        # These are the tasks and their results by the index of the move, if
+        # deterministic is True.
+        self._tasks = {}
+        self._results = {}
+        # This is the number of moves that are being searched.
+        self._searching = 0
+        self._error = None
+    def work(self):
+        '''
+        Searches moves until there are none left or there was a cutoff.
+        '''
+        while True:
+            with self._condition:
+                if self._next >= self._limit or self.stop.stopped:
+                    return
+                index = self._next
+                self._next += 1
+                if self._deterministic:
+                    stop = self._tasks[index] = SearchToken(self.stop, True)
+                else:
+                    stop = self.stop
+                alpha = self.alpha
+                beta = self.beta
+                self._searching += 1
+            try:
+                v_new, _, max_depth_new = reduced_value(
+                    # The eldest brother came before these moves.
+                    late_move_reduction(
+                        self._cutoff_depth,
+                        self._depth,
+                        index + 1,
+                        self._captures
+                    ),
+                    self._cutoff_depth,
+                    stop,
+                    self._turn_red,
+                    self._depth,
+                    self._board_size,
+                    self._state,
+                    self._moves[index],
+                    alpha,
+                    beta
+                )
+            except BaseException as e:
+                with self._condition:
+                    self._error = e
+                    self.stop.set()
+                    self._searching -= 1
+                    self._condition.notify_all()
+                return
+            with self._condition:
+                if not stop.stopped:
+                    if self._deterministic:
+                        self._results[index] = v_new, max_depth_new
+                        if (v_new >= beta) if self._turn_red else \
+                            (v_new <= alpha):
+                            # The moves after this one will not be used.
+                            self._limit = min(self._limit, index + 1)
+                            for i, task in self._tasks.items():
+                                if i > index:
+                                    task.set()
+                    else:
+                        self._put(v_new, self._moves[index], max_depth_new)
+                self._searching -= 1
+                self._condition.notify_all()
+    def help(self):
+        '''
+        Calls work from a helper thread, which counts as working on the search
+        while it runs.
+        '''
+        self.stop.enter()
+        try:
+            self.work()
+        finally:
+            self.stop.leave()
+    def _put(self, v_new, v_move_new, max_depth_new):
+        # The caller must hold self._condition.
+        self.max_depth = max(self.max_depth, max_depth_new)
+        if self._turn_red:
+            if v_new >= self.v:
+                self.v = v_new
+                self.v_move = v_move_new
+            if self.v >= self.beta:
+                self._cutoff(True)
+            else:
+                self.alpha = max(self.alpha, self.v)
+        else:
+            if v_new <= self.v:
+                self.v = v_new
+                self.v_move = v_move_new
+            if self.v <= self.alpha:
+                self._cutoff(False)
+            else:
+                self.beta = min(self.beta, self.v)
+    def _cutoff(self, in_max):
+        # The caller must hold self._condition.
+        if minimax_value.statistics != StatisticsLevel.OFF:
+            counters = self.stop.counters()
+            if in_max:
+                counters.prunes_in_max += 1
+            else:
+                counters.prunes_in_min += 1
+        self._limit = self._next
+        self.stop.set()
+    def join(self):
+        '''
+        Helps to search the moves and then waits for the other threads to
+        finish the moves that they took. Helpers that have not started yet do
+        not need to be waited for because they will find no moves left.
+        '''
+        self.work()
+        try:
+            with self._condition:
+                while self._searching:
+                    self._condition.wait()
+                if self._error is not None:
+                    raise self._error
+                if self._deterministic:
+                    # Combine the values in the order of the moves.
+                    for index in range(self._limit):
+                        if index not in self._results:
+                            # The search was stopped.
+                            break
+                        self._node_stop.merge_task(self._tasks[index])
+                        v_new, max_depth_new = self._results[index]
+                        self._put(v_new, self._moves[index], max_depth_new)
+                        if self.stop.stopped:
+                            break
+        finally:
+            self.stop.detach()
+def younger_brothers_value(
     moves,
     cutoff_depth,
     stop,
@@ -378,32 +1043,139 @@ def iactions(
     board_size,
     state,
     alpha,
+    beta,
+    v,
+    v_move,
+    max_depth
+):
+    '''
+    Searches the younger brothers of a node in parallel after the eldest
+    brother has been searched (the Young Brothers Wait Concept). The value of
+    the eldest brother narrows the window, so the younger brothers are
+    searched with better bounds, and each value that improves the bounds is
+    shared with the moves that start after it.
+    
+    Arguments:
+        moves:
+            the moves that have not been searched yet
+        cutoff_depth, stop, turn_red, depth, board_size, state, alpha, beta:
+            the arguments that minimax_value was called with for the node
+        v, v_move, max_depth:
+            the result of the node so far
+    
+    Returns:
+        The return value of minimax_value for the node
+    '''
+    split = SplitPoint(
+        moves,
+        cutoff_depth,
+        stop,
+        turn_red,
+        depth,
+        board_size,
+        state,
+        alpha,
+        beta,
+        v,
+        v_move,
+        max_depth,
+        younger_brothers_value.deterministic
+    )
+    # The current thread searches too, so one fewer helper is needed.
+    for i in range(min(len(moves), younger_brothers_value.helpers) - 1):
+        younger_brothers_value.pool.apply_async(split.help)
+    split.join()
+    return split.v, split.v_move, split.max_depth
+def late_move_reduction(cutoff_depth, depth, index, captures):
+    '''
+    Returns the number of plies by which to reduce the cutoff depth for a
+    move at a node (see reduced_value), or 0 to search it to the full cutoff
+    depth. Only quiet moves that are searched late and have enough plies left
+    are reduced, and only if minimax_value.late_move_reductions is True.
+    
+    Arguments:
+        cutoff_depth, depth:
+            the arguments that minimax_value was called with for the node
+        index:
+            the position of the move in the order that the moves are searched
+        captures:
+            True if the moves at the node are captures
+    '''
+    if not minimax_value.late_move_reductions or captures or \
+        index < late_move_reduction.moves or \
+        cutoff_depth - depth < late_move_reduction.plies_left:
+        return 0
+    return late_move_reduction.plies
+def reduced_value(
+    reduction,
+    cutoff_depth,
+    stop,
+    turn_red,
+    depth,
+    board_size,
+    state,
+    move,
+    alpha,
     beta
 ):
     '''
-    This is like actions, but a pool of workers is used to speed things up.
-    Also, there is no longer any guarantee that the moves will be yielded in
-    the order that they are in in the moves argument.
+    Searches the state after a move at a node, as minimax_value does for each
+    move. If reduction is more than 0, the move is first searched to a cutoff
+    depth that is that many plies shallower. If its value could still change
+    the bounds of the node, the move is searched again to the full cutoff
+    depth.
+    
+    A reduced search that reached its own cutoff depth did not search the move
+    completely, so its deepest depth is reported as at least cutoff_depth.
+    This keeps the nodes above it out of the cache of minimax_value.
+    
+    Arguments:
+        reduction:
+            the number of plies to reduce the cutoff depth by
+        cutoff_depth, stop, turn_red, depth, board_size, state, alpha, beta:
+            the arguments that minimax_value was called with for the node
+        move:
+            the Move to search
+    
+    Returns:
+        The return value of minimax_value for the state after the move
     '''
-    for v_move_new, (v_new, _, statistics_new) in iactions.pool.imap(
-        lambda v_move_new: (
-            v_move_new,
-            minimax_value(
-                cutoff_depth,
-                stop,
-                turn_red,
-                depth,
-                board_size,
-                move_result(state, v_move_new),
-                alpha,
-                beta
-            )
-        ),
-        moves
-    ):
-        if stop.is_set():
-            break
-        yield v_new, v_move_new, statistics_new
+    state = move_result(state, move)
+    if reduction > 0:
+        v_new, v_move_new, max_depth_new = minimax_value(
+            cutoff_depth - reduction,
+            stop,
+            not turn_red,
+            depth + 1,
+            board_size,
+            state,
+            alpha,
+            beta
+        )
+        if stop.stopped:
+            return v_new, v_move_new, max_depth_new
+        counters = None
+        if minimax_value.statistics != StatisticsLevel.OFF:
+            counters = stop.counters()
+            counters.reductions += 1
+        # Keep the value if the move does not improve on the bounds even at
+        # the reduced depth.
+        if (v_new <= alpha) if turn_red else (v_new >= beta):
+            if max_depth_new >= cutoff_depth - reduction:
+                max_depth_new = max(max_depth_new, cutoff_depth)
+            return v_new, v_move_new, max_depth_new
+        if counters is not None:
+            counters.researches += 1
+    return minimax_value(
+        cutoff_depth,
+        stop,
+        not turn_red,
+        depth + 1,
+        board_size,
+        state,
+        alpha,
+        beta
+    )
 def minimax_value(
     cutoff_depth,
     stop,
@@ -428,7 +1200,7 @@ def minimax_value(
             The depth of the search tree at which to stop expanding nodes and
             to use the evaluation function
         stop:
-            A threading.Event, which, when set, will cause the search to stop.
+            A SearchToken, which, when set, will cause the search to stop.
             After this is set, do not use the return values from this function.
         turn_red:
             True if it is the red player's turn
@@ -440,21 +1212,63 @@ def minimax_value(
             A State from which the move should be made
         alpha, beta:
             Used for alpha-beta pruning (should be -inf and inf for the root)
+    
+    Returns:
+        A tuple of the utility value, the best move (or None), and the deepest
+        depth that was reached. The nodes and the prunes are counted in the
+        SearchToken that is passed as stop.
     '''
-    statistics = Statistics(depth)
-    if stop.is_set():
-        return 0.0, None, statistics
-    # Check for a cached result.
-    cache_key = \
-        (turn_red, board_size, state, alpha, beta, evaluate_state.weights)
+    if stop.stopped:
+        return 0.0, None, depth
+    # Check for a cached result. Symmetric states share one entry.
+    weights = stop.weights or evaluate_state.weights
+    if minimax_value.symmetry:
+        cache_key, mirror, flip = \
+            symmetric_cache_key(turn_red, board_size, state, alpha, beta)
+        cache_key += (weights,)
+    else:
+        cache_key = (turn_red, board_size, state, alpha, beta, weights)
+        mirror = flip = False
+    cache = stop.cache
+    if cache is None:
+        cache = minimax_value._cache
     try:
-        return minimax_value._cache[cache_key]
+        result = cache[cache_key]
     except KeyError:
-        pass
+        result = None
+        if CacheSnapshot is not None:
+            result = CacheSnapshot.minimax_result(cache_key)
+    if result is not None:
+        counters = node_counters(stop, depth)
+        if minimax_value.statistics == StatisticsLevel.FULL:
+            counters.cache_hits += 1
+        return transform_result(board_size, result, mirror, flip)
+    # If we are too deep, only follow forced captures until the state is quiet.
+    if depth >= cutoff_depth and minimax_value.quiescence:
+        return quiescence_value(
+            stop,
+            turn_red,
+            depth,
+            board_size,
+            state,
+            alpha,
+            beta
+        )
+    counters = node_counters(stop, depth)
+    max_depth = depth
     # If we are too deep or we reached a terminal state, do not expand.
-    v = cutoff_test(cutoff_depth, board_size, state, turn_red, depth)
+    analysis = analyze_position(board_size, state)
+    v = cutoff_test(
+        cutoff_depth,
+        board_size,
+        state,
+        turn_red,
+        depth,
+        analysis,
+        weights
+    )
     if v is not None:
-        return v, None, statistics
+        return v, None, max_depth
     # If turn_red is True, find the action that results in the maximum utility
     # value. If turn_red is False, find the action the results in the minimum
     # utility value.
@@ -462,52 +1276,95 @@ def minimax_value(
         GameEnd.WIN_BLACK if turn_red else GameEnd.WIN_RED
     ]
     v_move = None
-    moves = legal_moves_as_tuple(board_size, state, turn_red)
+    moves = analysis.moves_red if turn_red else analysis.moves_black
     # If this is the root node and there is only one legal move, just do it.
     if depth == 0 and len(moves) == 1:
-        return 0.0, moves[0], statistics
-    # Evaluate each move.
-    for v_new, v_move_new, statistics_new in (
-        # If iactions does not guarantee order, it is not deterministic.
-        iactions if depth == 0 else actions
-    )(
-        moves,
-        cutoff_depth,
-        stop,
-        not turn_red,
-        depth + 1,
-        board_size,
-        state,
-        alpha,
-        beta
-    ):
-        # If turn_red is True, maximize the minimum utility value.
-        # If turn_red is False, minimize the maximum utility value.
-        statistics.accumulate(statistics_new)
+        return 0.0, moves[0], max_depth
+    captures = analysis.captures_red if turn_red else analysis.captures_black
+    # At a frontier node, the moves lead to states that are evaluated. If
+    # the player to move cannot capture, and even a gain of the futility
+    # margin would not reach the bounds, do not search the moves. The value is
+    # only a bound, so it is reported as reaching the cutoff depth, which
+    # keeps it out of the cache.
+    if minimax_value.futility_pruning and depth + 1 == cutoff_depth and \
+        not captures:
+        v_static = \
+            evaluate_state(board_size, state, turn_red, analysis, weights)
         if turn_red:
-            if v_new >= v:
-                v = v_new
-                v_move = v_move_new
-            # Check for the opportunity to prune.
-            if v >= beta:
-                statistics.prunes_in_max += 1
-                # Instead of returning like in the textbook, just break.
-                break
-            alpha = max(alpha, v)
+            v_static += minimax_value.futility_margin
+            futile = v_static <= alpha
+        else:
+            v_static -= minimax_value.futility_margin
+            futile = v_static >= beta
+        if futile:
+            if counters is not None:
+                counters.futility_prunes += 1
+            return v_static, None, cutoff_depth
+    # Near the root, search the eldest brother first, and then search the
+    # younger brothers in parallel.
+    split = depth < younger_brothers_value.split_depth and len(moves) > 1
+    # Evaluate each move with the bounds so far.
+    for index, v_move_new in enumerate(moves[:1] if split else moves):
+        v_new, _, max_depth_new = reduced_value(
+            late_move_reduction(cutoff_depth, depth, index, captures),
+            cutoff_depth,
+            stop,
+            turn_red,
+            depth,
+            board_size,
+            state,
+            v_move_new,
+            alpha,
+            beta
+        )
+        if stop.stopped:
+            break
+        # If turn_red is True, maximize the minimum utility value.
+        # If turn_red is False, minimize the maximum utility value.
+        max_depth = max(max_depth, max_depth_new)
+        if turn_red:
+            if v_new >= v:
+                v = v_new
+                v_move = v_move_new
+            # Check for the opportunity to prune.
+            if v >= beta:
+                if counters is not None:
+                    counters.prunes_in_max += 1
+                # Instead of returning like in the textbook, just break.
+                break
+            alpha = max(alpha, v)
         else:
             if v_new <= v:
                 v = v_new
                 v_move = v_move_new
             # Check for the opportunity to prune.
             if v <= alpha:
-                statistics.prunes_in_min += 1
+                if counters is not None:
+                    counters.prunes_in_min += 1
                 # Instead of returning like in the textbook, just break.
                 break
             beta = min(beta, v)
+    else:
+        # If the eldest brother did not cause a cutoff, search the rest.
+        if split and not stop.stopped:
+            v, v_move, max_depth = younger_brothers_value(
+                moves[1:],
+                cutoff_depth,
+                stop,
+                turn_red,
+                depth,
+                board_size,
+                state,
+                alpha,
+                beta,
+                v,
+                v_move,
+                max_depth
+            )
     # If no actions are possible, this turn is forfeited.
     if not v_move:
         # Don't move any pieces and just go to the other player's turn.
-        v_new, _, statistics_new = minimax_value(
+        v_new, _, max_depth_new = minimax_value(
             cutoff_depth,
             stop,
             not turn_red,
@@ -517,28 +1374,369 @@ def minimax_value(
             alpha,
             beta
         )
-        statistics.accumulate(statistics_new)
-        return v_new, None, statistics_new
+        return v_new, None, max_depth_new
     # Cache the result if the cutoff was not reached.
-    if statistics.max_depth < cutoff_depth and not stop.is_set():
-        minimax_value._cache[cache_key] = (v, v_move, statistics)
-    return v, v_move, statistics
+    if max_depth < cutoff_depth and not stop.stopped:
+        cache[cache_key] = transform_result(
+            board_size,
+            (v, v_move, max_depth),
+            mirror,
+            flip
+        )
+    return v, v_move, max_depth
 def max_value(cutoff_depth, stop, *args, **kwargs):
     return minimax_value(cutoff_depth, stop, True, *args, **kwargs)
 def min_value(cutoff_depth, stop, *args, **kwargs):
     return minimax_value(cutoff_depth, stop, False, *args, **kwargs)
+def memory_value(
+    cutoff_depth,
+    stop,
+    turn_red,
+    depth,
+    board_size,
+    state,
+    alpha,
+    beta
+):
+    '''
+    This is minimax_value with a transposition table that stores bounds
+    instead of exact values. It is meant to be called by mtdf_value with zero
+    windows, most of which fail high or low. Each entry in the table is a tuple
+    of the remaining depth that was searched (math.inf if the cutoff was never
+    reached), a lower bound, an upper bound, and the best move that was found.
+    The best move is tried first the next time that the state is searched.
+    
+    The arguments and the return value are the same as those of minimax_value.
+    '''
+    if stop.stopped:
+        return 0.0, None, depth
+    max_depth = depth
+    # Look for bounds from an earlier search that was at least as deep.
+    draft = cutoff_depth - depth
+    cache_key = (
+        turn_red,
+        board_size,
+        state,
+        stop.weights or evaluate_state.weights
+    )
+    entry = memory_value._cache.get(cache_key)
+    move_first = None
+    if entry is not None:
+        draft_entry, lower, upper, move_first = entry
+        if draft_entry >= draft:
+            if draft_entry != math.inf:
+                # This result depends on the cutoff.
+                max_depth = cutoff_depth
+            if lower >= beta or upper <= alpha:
+                counters = node_counters(stop, depth)
+                if minimax_value.statistics == StatisticsLevel.FULL:
+                    counters.cache_hits += 1
+                return (
+                    lower if lower >= beta else upper,
+                    move_first,
+                    max_depth
+                )
+            alpha = max(alpha, lower)
+            beta = min(beta, upper)
+        else:
+            lower = UTILITY_VALUES_TERMINAL[GameEnd.WIN_BLACK]
+            upper = UTILITY_VALUES_TERMINAL[GameEnd.WIN_RED]
+    # If we are too deep, only follow forced captures until the state is quiet.
+    if depth >= cutoff_depth and minimax_value.quiescence:
+        return quiescence_value(
+            stop,
+            turn_red,
+            depth,
+            board_size,
+            state,
+            alpha,
+            beta
+        )
+    counters = node_counters(stop, depth)
+    # If we are too deep or we reached a terminal state, do not expand.
+    analysis = analyze_position(board_size, state)
+    v = cutoff_test(
+        cutoff_depth,
+        board_size,
+        state,
+        turn_red,
+        depth,
+        analysis,
+        stop.weights
+    )
+    if v is not None:
+        return v, None, max_depth
+    v = UTILITY_VALUES_TERMINAL[
+        GameEnd.WIN_BLACK if turn_red else GameEnd.WIN_RED
+    ]
+    v_move = None
+    moves = analysis.moves_red if turn_red else analysis.moves_black
+    # If this is the root node and there is only one legal move, just do it.
+    if depth == 0 and len(moves) == 1:
+        return 0.0, moves[0], max_depth
+    # Try the best move from the last search first.
+    if move_first in moves:
+        moves = (move_first,) + tuple(m for m in moves if m != move_first)
+    a = alpha
+    b = beta
+    for v_move_new in moves:
+        v_new, _, max_depth_new = memory_value(
+            cutoff_depth,
+            stop,
+            not turn_red,
+            depth + 1,
+            board_size,
+            move_result(state, v_move_new),
+            a,
+            b
+        )
+        if stop.stopped:
+            break
+        max_depth = max(max_depth, max_depth_new)
+        if turn_red:
+            if v_new >= v:
+                v = v_new
+                v_move = v_move_new
+            if v >= b:
+                if counters is not None:
+                    counters.prunes_in_max += 1
+                break
+            a = max(a, v)
+        else:
+            if v_new <= v:
+                v = v_new
+                v_move = v_move_new
+            if v <= a:
+                if counters is not None:
+                    counters.prunes_in_min += 1
+                break
+            b = min(b, v)
+    # If no actions are possible, this turn is forfeited.
+    if not v_move:
+        v, _, max_depth_new = memory_value(
+            cutoff_depth,
+            stop,
+            not turn_red,
+            depth + 1,
+            board_size,
+            state,
+            alpha,
+            beta
+        )
+        max_depth = max(max_depth, max_depth_new)
+    if stop.stopped:
+        return v, v_move, max_depth
+    # Store the bound that this search established. It is combined with the
+    # bounds from an earlier search of the same depth and replaces the others.
+    if max_depth < cutoff_depth:
+        draft = math.inf
+    if entry is None or entry[0] != draft:
+        lower = UTILITY_VALUES_TERMINAL[GameEnd.WIN_BLACK]
+        upper = UTILITY_VALUES_TERMINAL[GameEnd.WIN_RED]
+    if v <= alpha:
+        upper = v
+    elif v >= beta:
+        lower = v
+    else:
+        lower = upper = v
+    memory_value._cache[cache_key] = (draft, lower, upper, v_move)
+    return v, v_move, max_depth
+def mtdf_value(
+    cutoff_depth,
+    stop,
+    turn_red,
+    depth,
+    board_size,
+    state,
+    first_guess=0.0
+):
+    '''
+    Finds the minimax value of a state with the MTD(f) algorithm. Instead of
+    searching once with a full window, memory_value is called repeatedly with
+    zero windows. Each call either raises the lower bound or lowers the upper
+    bound on the value until they meet. The closer that first_guess is to the
+    actual value, the fewer calls are needed.
+    
+    The other arguments and the return value are the same as those of
+    minimax_value.
+    '''
+    max_depth = depth
+    lower = UTILITY_VALUES_TERMINAL[GameEnd.WIN_BLACK]
+    upper = UTILITY_VALUES_TERMINAL[GameEnd.WIN_RED]
+    v = first_guess
+    v_move = None
+    v_move_last = None
+    while lower < upper and not stop.stopped:
+        # The window is (beta - the smallest possible step, beta).
+        beta = v if v > lower else math.nextafter(lower, math.inf)
+        v, v_move_last, max_depth_new = memory_value(
+            cutoff_depth,
+            stop,
+            turn_red,
+            depth,
+            board_size,
+            state,
+            math.nextafter(beta, -math.inf),
+            beta
+        )
+        max_depth = max(max_depth, max_depth_new)
+        if v < beta:
+            upper = v
+            # The minimizing player found a move that is at least this good.
+            if not turn_red:
+                v_move = v_move_last
+        else:
+            lower = v
+            # The maximizing player found a move that is at least this good.
+            if turn_red:
+                v_move = v_move_last
+    # The move from a search that failed in the other direction is only a
+    # guess, but it is better than nothing.
+    return v, v_move or v_move_last, max_depth
+def gradual_depth_cache_key(
+    turn_red,
+    depth,
+    board_size,
+    state,
+    alpha,
+    beta,
+    weights=None
+):
+    '''
+    Returns the key under which alpha_beta_gradual_depth caches its results
+    for the given arguments to minimax_value, as well as whether the state was
+    mirrored and whether it was flipped to get the key. The weights are those
+    of evaluate_state (evaluate_state.weights by default).
+    '''
+    if weights is None:
+        weights = evaluate_state.weights
+    if minimax_value.symmetry:
+        cache_key, mirror, flip = \
+            symmetric_cache_key(turn_red, board_size, state, alpha, beta)
+        return cache_key + (depth, weights), mirror, flip
+    return (
+        (turn_red, depth, board_size, state, alpha, beta),
+        weights
+    ), False, False
+def principal_variation(
+    cutoff_depth,
+    stop,
+    board_size,
+    state,
+    turn_red,
+    v,
+    v_move,
+    remember=False
+):
+    '''
+    Finds the moves that both players are expected to make if they play as
+    the search to a cutoff depth predicts. The search does not keep them, so
+    after the first move, each move is found by searching the next position
+    again with a narrow window around the value. Most of such a search is
+    pruned, so it costs much less than the search did.
+    
+    Each of those searches is also a search of the position after the moves
+    so far to a shallower cutoff depth. If remember is True, its result is
+    put in the cache of alpha_beta_gradual_depth unless a deeper one is
+    there, so that when the game reaches the position, deepening resumes
+    from the depth that was already searched. The depth is rounded down to
+    one that deepening from alpha_beta_gradual_depth.cutoff_depth_start
+    reaches.
+    
+    Arguments:
+        cutoff_depth:
+            the cutoff depth of the search
+        stop:
+            the SearchToken of the search, which counts the nodes
+        board_size, state, turn_red:
+            the position that was searched
+        v, v_move:
+            the value and the move that the search found
+        remember:
+            True to cache the result for each position after the first
+    
+    Returns:
+        A tuple of Moves that starts with v_move. It ends early if a player
+        would have to forfeit the turn, if the game would end, or if stop is
+        set.
+    '''
+    if v_move is None:
+        return ()
+    result = [v_move]
+    for depth in range(1, cutoff_depth):
+        state = move_result(state, v_move)
+        turn_red = not turn_red
+        if analyze_position(board_size, state).terminal != \
+            GameEnd.NOT_ENDED:
+            break
+        v_new, v_move, max_depth = minimax_value(
+            cutoff_depth,
+            stop,
+            turn_red,
+            depth,
+            board_size,
+            state,
+            math.nextafter(v, -math.inf),
+            math.nextafter(v, math.inf)
+        )
+        if stop.stopped or v_new != v or v_move is None:
+            break
+        result.append(v_move)
+        # Deepening steps by two plies from cutoff_depth_start, so round the
+        # depth of the result down to a depth that deepening reaches. Do not
+        # make a later search start shallower than it would have.
+        cutoff_depth_start = alpha_beta_gradual_depth.cutoff_depth_start
+        cutoff_depth_left = cutoff_depth - depth
+        cutoff_depth_left -= (cutoff_depth_left - cutoff_depth_start) % 2
+        if remember and cutoff_depth_left + 2 >= cutoff_depth_start:
+            cache_key, mirror, flip = gradual_depth_cache_key(
+                turn_red,
+                0,
+                board_size,
+                state,
+                UTILITY_VALUES_TERMINAL[GameEnd.WIN_BLACK],
+                UTILITY_VALUES_TERMINAL[GameEnd.WIN_RED],
+                stop.weights
+            )
+            cached = alpha_beta_gradual_depth._cache.get(cache_key)
+            if cached is None or cached[0] < cutoff_depth_left:
+                alpha_beta_gradual_depth._cache[cache_key] = (
+                    cutoff_depth_left,
+                    transform_result(
+                        board_size,
+                        (v, v_move, max_depth - depth),
+                        mirror,
+                        flip
+                    )
+                )
+    return tuple(result)
 def alpha_beta_gradual_depth(
     result_destination,
     result_protection,
     stop,
     stop_next,
-    *minimax_value_args
+    *minimax_value_args,
+    driver=SearchDriver.ALPHA_BETA,
+    keep_results=False
 ):
     '''
     Repeatedly runs minimax_value, increasing the cutoff depth each time. After
-    each run, a tuple of length 2 is appended to result_destination. The first
-    item in the tuple is the cutoff depth, and the second is the return value
-    of minimax_value when given that cutoff depth.
+    each run, a tuple of length 3 is appended to result_destination. The first
+    item in the tuple is the cutoff depth, the second is the return value of
+    minimax_value when given that cutoff depth, and the third is the principal
+    variation (see principal_variation). The earlier results are removed first
+    unless keep_results is True. The principal variation is found after the
+    tuple is appended, so it is None until the tuple is replaced by one with
+    the principal variation.
+    
+    If alpha_beta_gradual_depth.reuse_variation is True, the result of each
+    position along the principal variation is cached, so that the search of
+    the next move can resume from the depth that was reached for it.
+    Otherwise, or if stop or stop_next is set before it is found, the
+    principal variation is empty.
+    
+    If driver is SearchDriver.MTDF, mtdf_value is run instead of minimax_value.
+    The value from each cutoff depth is the first guess for the next one.
     
     Arguments:
         result_destination:
@@ -546,7 +1744,7 @@ def alpha_beta_gradual_depth(
         result_protection:
             a threading.Condition to protect result_destination
         stop:
-            a threading.Event, which, when set, will cause the search to stop
+            a SearchToken, which, when set, will cause the search to stop
             after a brief delay
         stop_next:
             a threading.Event, which, when set, will cause the search to stop
@@ -554,19 +1752,60 @@ def alpha_beta_gradual_depth(
         *minimax_value_args:
             a tuple of arguments, except cutoff_depth and stop, to pass to
             minimax_value (in other words, all the arguments after stop)
+        driver:
+            a member of the SearchDriver enum
+        keep_results:
+            True to leave the earlier results in result_destination
     '''
-    cache_key = (minimax_value_args, evaluate_state.weights)
-    try:
-        result = alpha_beta_gradual_depth._cache[cache_key]
-    except KeyError:
+    turn_red, _, board_size, state = minimax_value_args[:4]
+    def publish(cutoff_depth, result):
+        # Put the result in before its principal variation is found, so that
+        # it is there if time runs out while the principal variation is found.
+        entry = (cutoff_depth, result, None)
+        with result_protection:
+            if not keep_results:
+                result_destination.clear()
+            result_destination.append(entry)
+            result_protection.notify()
+        pv = ()
+        if alpha_beta_gradual_depth.reuse_variation and \
+            not stop.stopped and not stop_next.is_set():
+            pv = principal_variation(
+                cutoff_depth,
+                stop,
+                board_size,
+                state,
+                turn_red,
+                result[0],
+                result[1],
+                remember=True
+            )
+        # Replace the entry unless it was taken out already.
+        with result_protection:
+            for i in range(len(result_destination) - 1, -1, -1):
+                if result_destination[i] is entry:
+                    result_destination[i] = (cutoff_depth, result, pv)
+                    result_protection.notify()
+                    break
+    cache_key, mirror, flip = \
+        gradual_depth_cache_key(*minimax_value_args, stop.weights)
+    # MTD(f) does not take alpha and beta.
+    mtdf_value_args = minimax_value_args[:4]
+    guess = 0.0
+    result = alpha_beta_gradual_depth._cache.get(cache_key)
+    if result is None and CacheSnapshot is not None:
+        result = CacheSnapshot.search_result(cache_key)
+    if result is None:
         # Use the default starting cutoff depth.
         starting = alpha_beta_gradual_depth.cutoff_depth_start
     else:
+        result = (
+            result[0],
+            transform_result(board_size, result[1], mirror, flip)
+        )
+        guess = result[1][0]
         # Put this result in.
-        with result_protection:
-            result_destination.clear()
-            result_destination.append(result)
-            result_protection.notify()
+        publish(*result)
         # Set the starting cutoff depth to the next level.
         starting = result[0] + 2
     # Gradually increase the depth limit.
@@ -575,35 +1814,52 @@ def alpha_beta_gradual_depth(
         alpha_beta_gradual_depth.cutoff_depth_stop,
         2
     ):
-        if stop.is_set():
+        if stop.stopped:
             break
+        # Make room in the caches before they grow during the next search.
+        enforce_cache_memory_limit()
         # Run minimax_value.
-        result = (
-            cutoff_depth,
-            minimax_value(cutoff_depth, stop, *minimax_value_args)
-        )
+        if driver == SearchDriver.MTDF:
+            result = (
+                cutoff_depth,
+                mtdf_value(cutoff_depth, stop, *mtdf_value_args, guess)
+            )
+            guess = result[1][0]
+        else:
+            result = (
+                cutoff_depth,
+                minimax_value(cutoff_depth, stop, *minimax_value_args)
+            )
         # If stop is set, then the result may be invalid. Break now and do not
         # add this result to the queue or save it in the cache.
-        if stop.is_set():
+        if stop.stopped:
             break
         # Save the result in the cache.
-        alpha_beta_gradual_depth._cache[cache_key] = result
+        alpha_beta_gradual_depth._cache[cache_key] = (
+            cutoff_depth,
+            transform_result(board_size, result[1], mirror, flip)
+        )
         # Put this result in the queue.
-        with result_protection:
-            result_destination.clear()
-            result_destination.append(result)
-            result_protection.notify()
+        publish(*result)
         # If the cutoff was not reached, there is no need to continue.
-        if result[1][2].max_depth < cutoff_depth:
+        if result[1][2] < cutoff_depth:
             break
         # If we have been asked to stop after the last result, then stop.
         if stop_next.is_set():
             break
-def alpha_beta_search(board_size, state, turn_red, job_id=None):
+def search_result(
+    board_size,
+    state,
+    turn_red,
+    stop,
+    name="",
+    driver=SearchDriver.ALPHA_BETA,
+    time_limit=None,
+    verbose=False
+):
     '''
-    Finds the best move for the current player to make. Use game_ended to check
-    whether the game has ended before calling this function. It is assumed that
-    the current player has legal moves.
+    Runs alpha_beta_gradual_depth in another thread until the time limit and
+    returns the deepest result.
     
     Arguments:
         board_size:
@@ -612,25 +1868,42 @@ def alpha_beta_search(board_size, state, turn_red, job_id=None):
             A State from which the move should be made
         turn_red:
             True if it is the red player's turn
-        job_id:
-            This value is not used by this function. It is only put in the
-            return value.
+        stop:
+            A SearchToken, which, when set, will cause the search to stop
+            without a result. The threads of the search check it at every
+            node, and this function returns only after they are idle, so
+            stop.stop_latency is known when it returns.
+        name:
+            A string to add to the name of the thread
+        driver:
+            A member of the SearchDriver enum
+        time_limit:
+            The number of seconds to search (SearchTimeLimit by default)
+        verbose:
+            True to print what is happening
     
     Returns:
-        A tuple of length 2 where the first element is job_id and the second
-        element is the Move that the AI picked
+        A tuple of length 2 where the first element is the cutoff depth and
+        the second element is the return value of minimax_value, except that
+        the maximum depth is replaced by the Statistics of the whole search, or
+        None if stop was set before a result was found
     '''
-    start_time = time.perf_counter()
+    if time_limit is None:
+        time_limit = SearchTimeLimit
     # Set the maximum length of the result queue because we only care about the
     # last result (the result where the cutoff depth is the deepest).
     result_destination = []
     result_protection = threading.Condition()
     # Do the gradual deepening in another thread.
-    stop = threading.Event()
     stop_next = threading.Event()
+    def search(*args, **kwargs):
+        try:
+            alpha_beta_gradual_depth(*args, **kwargs)
+        finally:
+            stop.leave()
     p = threading.Thread(
-        name="Alpha-Beta Gradual Deepening #" + str(job_id),
-        target=alpha_beta_gradual_depth,
+        name="Alpha-Beta Gradual Deepening " + name,
+        target=search,
         args=(
             result_destination,
             result_protection,
@@ -642,49 +1915,298 @@ def alpha_beta_search(board_size, state, turn_red, job_id=None):
             state,
             UTILITY_VALUES_TERMINAL[GameEnd.WIN_BLACK],
             UTILITY_VALUES_TERMINAL[GameEnd.WIN_RED]
-        )
+        ),
+        kwargs={"driver": driver}
     )
     # Wait up to the time limit.
-    stops.append(stop)
+    stop.enter()
+    p.start()
+    try:
+        if verbose:
+            print("Thinking until the time limit...\r", end="")
+        p.join(time_limit)
+        if stop.is_set():
+            return None
+        stop_next.set()
+        # Make sure that one result is found. If the search is stopped first,
+        # the thread ends without a result.
+        if verbose:
+            print("Waiting for at least one result...\r", end="")
+        with result_protection:
+            while not result_destination:
+                if not p.is_alive() or stop.is_set():
+                    return None
+                result_protection.wait(0.1)
+            cutoff_depth, (v, v_move, max_depth), _ = result_destination[-1]
+    finally:
+        # If the thread is still running, tell it to stop. Do not return until
+        # every thread of the search is idle so that the next search does not
+        # have to compete with this one.
+        if p.is_alive():
+            stop.set()
+        stop.wait_idle()
+    return cutoff_depth, (v, v_move, stop.statistics(max_depth))
+def iterate_search(
+    board_size,
+    state,
+    turn_red,
+    stop=None,
+    name="",
+    driver=SearchDriver.ALPHA_BETA
+):
+    '''
+    Runs alpha_beta_gradual_depth in another thread and yields a
+    SearchIteration as each cutoff depth is completed, so that the caller can
+    show the results as they come and decide when to stop. The search stops
+    when this generator is closed, for example by breaking out of a for loop
+    over it; the generator waits for the threads of the search to become idle
+    before it is closed. Otherwise, the generator ends when deepening would
+    not change the result or when alpha_beta_gradual_depth.cutoff_depth_stop
+    is reached.
+    
+    Arguments:
+        board_size:
+            The number of squares in a row or column on the board
+        state:
+            A State from which the move should be made
+        turn_red:
+            True if it is the red player's turn
+        stop:
+            A SearchToken, which, when set, will cause the search to stop after
+            the result that is being yielded (a new one by default)
+        name:
+            A string to add to the name of the thread
+        driver:
+            A member of the SearchDriver enum
+    
+    Yields:
+        A SearchIteration with the cutoff depth, the utility value, the best
+        move, the principal variation (see principal_variation), and the
+        Statistics of the whole search so far
+    '''
+    if stop is None:
+        stop = SearchToken()
+    result_destination = []
+    result_protection = threading.Condition()
+    finished = threading.Event()
+    def search(*args, **kwargs):
+        try:
+            alpha_beta_gradual_depth(*args, **kwargs)
+        finally:
+            with result_protection:
+                finished.set()
+                result_protection.notify()
+            stop.leave()
+    p = threading.Thread(
+        name="Alpha-Beta Iterations " + name,
+        target=search,
+        args=(
+            result_destination,
+            result_protection,
+            stop,
+            # The search stops after the last result only when it is stopped.
+            threading.Event(),
+            turn_red,
+            0,
+            board_size,
+            state,
+            UTILITY_VALUES_TERMINAL[GameEnd.WIN_BLACK],
+            UTILITY_VALUES_TERMINAL[GameEnd.WIN_RED]
+        ),
+        kwargs={"driver": driver, "keep_results": True}
+    )
+    stop.enter()
     p.start()
-    print("Thinking until the time limit...\r", end="")
-    p.join(SearchTimeLimit)
-    stops.remove(stop)
-    if stop.is_set():
+    try:
+        while not stop.stopped:
+            with result_protection:
+                # Wait for the principal variation of the first result.
+                result_protection.wait_for(
+                    lambda: finished.is_set() or result_destination and
+                        result_destination[0][2] is not None
+                )
+                ready = len(result_destination)
+                if ready and result_destination[-1][2] is None and \
+                    not finished.is_set():
+                    ready -= 1
+                results = result_destination[:ready]
+                del result_destination[:ready]
+            if not results:
+                break
+            for cutoff_depth, (v, v_move, max_depth), pv in results:
+                if pv is None:
+                    pv = ()
+                statistics = stop.statistics(max_depth)
+                if not alpha_beta_gradual_depth.reuse_variation:
+                    stop.enter()
+                    try:
+                        pv = principal_variation(
+                            cutoff_depth,
+                            stop,
+                            board_size,
+                            state,
+                            turn_red,
+                            v,
+                            v_move
+                        )
+                    finally:
+                        stop.leave()
+                yield SearchIteration(cutoff_depth, v, v_move, pv, statistics)
+    finally:
+        # Stop the search if the caller stopped iterating before it ended.
+        if p.is_alive():
+            stop.set()
+        stop.wait_idle()
+async def iterate_search_async(
+    board_size,
+    state,
+    turn_red,
+    stop=None,
+    name="",
+    driver=SearchDriver.ALPHA_BETA
+):
+    '''
+    This is iterate_search as an asynchronous iterator. The search runs in
+    other threads, so the event loop is not blocked while it waits for the
+    next cutoff depth. The search stops when the iterator is closed or the
+    task that uses it is cancelled. The arguments are the same as the
+    arguments of iterate_search.
+    '''
+    if stop is None:
+        stop = SearchToken()
+    iterations = \
+        iterate_search(board_size, state, turn_red, stop, name, driver)
+    # The generator must only be resumed by one thread at a time, so one
+    # thread resumes it and then closes it.
+    executor = concurrent.futures.ThreadPoolExecutor(1)
+    loop = asyncio.get_running_loop()
+    ended = False
+    try:
+        while True:
+            iteration = await loop.run_in_executor(
+                executor,
+                next,
+                iterations,
+                None
+            )
+            if iteration is None:
+                ended = True
+                break
+            yield iteration
+    finally:
+        # The thread may still be waiting for the next cutoff depth, so stop
+        # the search before the generator is closed after it.
+        if not ended:
+            stop.set()
+        await loop.run_in_executor(executor, iterations.close)
+        executor.shutdown(wait=False)
+def alpha_beta_search(
+    board_size,
+    state,
+    turn_red,
+    job_id=None,
+    driver=SearchDriver.ALPHA_BETA
+):
+    '''
+    Finds the best move for the current player to make. Use game_ended to check
+    whether the game has ended before calling this function. It is assumed that
+    the current player has legal moves. The search can be stopped by stop_all.
+    
+    Arguments:
+        board_size:
+            The number of squares in a row or column on the board
+        state:
+            A State from which the move should be made
+        turn_red:
+            True if it is the red player's turn
+        job_id:
+            This value is not used by this function. It is only put in the
+            return value.
+        driver:
+            A member of the SearchDriver enum
+    
+    Returns:
+        A tuple of length 2 where the first element is job_id and the second
+        element is the Move that the AI picked
+    '''
+    wait_for_stopped_searches()
+    start_time = time.perf_counter()
+    stop = SearchToken()
+    stops.append(stop)
+    try:
+        result = search_result(
+            board_size,
+            state,
+            turn_red,
+            stop,
+            "#" + str(job_id),
+            driver,
+            verbose=True
+        )
+    finally:
+        stops.remove(stop)
+    if result is None:
+        if stop.stop_latency is not None:
+            print(
+                "Stopped search #{}: idle {:>7.4f} seconds after the "
+                "stop".format(job_id, stop.stop_latency)
+            )
         return job_id, None
-    stop_next.set()
-    # Make sure that one result is found.
-    print("Waiting for at least one result...\r", end="")
-    with result_protection:
-        result_protection.wait_for(lambda: result_destination)
-        cutoff_depth, (v, v_move, statistics) = result_destination[-1]
-    # If the thread is still running, tell it to stop.
-    if p.is_alive():
-        stop.set()
+    cutoff_depth, (v, v_move, statistics) = result
     # Return the results.
+    if minimax_value.statistics == StatisticsLevel.OFF:
+        counts = ""
+    else:
+        counts = "{:>8} nodes, {:>5} prunes in MAX-VALUE, {:>5} prunes in " \
+            "MIN-VALUE: ".format(
+                statistics.nodes,
+                statistics.prunes_in_max,
+                statistics.prunes_in_min
+            )
     print(
-        "Got {}'s move in {:>7.4f} seconds: {:>3} of {:>3} levels, "
-        "{:>8} nodes, {:>5} prunes in MAX-VALUE, {:>5} prunes in MIN-VALUE: "
-        "final utility value = {:>7.3f}".format(
+        "Got {}'s move in {:>7.4f} seconds: {:>3} of {:>3} levels, {}"
+        "final utility value = {:>7.3f}, "
+        "cache memory = {:>7.1f} MiB".format(
             "R" if turn_red else "B",
             time.perf_counter() - start_time,
             statistics.max_depth,
             cutoff_depth,
-            statistics.nodes,
-            statistics.prunes_in_max,
-            statistics.prunes_in_min,
-            v
+            counts,
+            v,
+            sum(cache_memory_usage().values()) / (1 << 20)
         )
     )
+    if minimax_value.statistics == StatisticsLevel.FULL:
+        print(
+            "{:>8} cache hits; nodes at each depth: {}".format(
+                statistics.cache_hits,
+                ", ".join(
+                    "{}: {}".format(depth, nodes)
+                    for depth, nodes in sorted(
+                        statistics.nodes_by_depth.items()
+                    )
+                )
+            )
+        )
     return job_id, v_move
 def stop_all():
     '''
     Stops all ongoing alpha-beta searches. Each will return a move if one has
     already been found; otherwise, it will return None. In either case, the
-    return value should not be used. Start a new alpha-beta search if needed.
+    return value should not be used. Start a new alpha-beta search if needed;
+    it will wait for the stopped searches to become idle before it starts.
     '''
     for stop in stops:
         stop.set()
+def wait_for_stopped_searches():
+    '''
+    Waits until the threads of the searches that were stopped by stop_all are
+    idle. Call this before starting a search so that it does not compete with
+    them.
+    '''
+    for stop in tuple(stops):
+        if stop.is_set():
+            stop.wait_idle()
 def set_difficulty(difficulty):
     '''
     Sets the difficulty of the AI player.
@@ -693,35 +2215,352 @@ def set_difficulty(difficulty):
         difficulty: a member of the AIDifficulty enum
     '''
     evaluate_state.weights = HEURISTIC_WEIGHTS[difficulty]
+    minimax_value.futility_margin = FUTILITY_MARGINS[difficulty]
+class ShardedCache(collections.abc.MutableMapping):
+    '''
+    This is a dictionary that is split into shards by the hashes of the keys.
+    Each shard has its own lock, which is held while the shard is changed or
+    read as a whole, so threads that use different shards do not wait for
+    each other. Looking up a key does not take a lock. It is pickled as a
+    dictionary.
+    '''
+    def __init__(self, shards, contents=()):
+        # The number of shards is rounded up to a power of 2.
+        self._mask = (1 << (shards - 1).bit_length()) - 1
+        self._shards = tuple({} for i in range(self._mask + 1))
+        self._locks = tuple(threading.Lock() for i in range(self._mask + 1))
+        # oldest_keys starts at this shard.
+        self._next_oldest = 0
+        self.update(contents)
+    def __getitem__(self, key):
+        return self._shards[hash(key) & self._mask][key]
+    def get(self, key, default=None):
+        return self._shards[hash(key) & self._mask].get(key, default)
+    def __contains__(self, key):
+        return key in self._shards[hash(key) & self._mask]
+    def __setitem__(self, key, value):
+        index = hash(key) & self._mask
+        with self._locks[index]:
+            self._shards[index][key] = value
+    def __delitem__(self, key):
+        index = hash(key) & self._mask
+        with self._locks[index]:
+            del self._shards[index][key]
+    def pop(self, key, *default):
+        index = hash(key) & self._mask
+        with self._locks[index]:
+            return self._shards[index].pop(key, *default)
+    def __len__(self):
+        return sum(map(len, self._shards))
+    def __iter__(self):
+        for shard, lock in zip(self._shards, self._locks):
+            with lock:
+                keys = list(shard)
+            yield from keys
+    def items(self):
+        '''
+        Returns a list of the keys and the values.
+        '''
+        result = []
+        for shard, lock in zip(self._shards, self._locks):
+            with lock:
+                result.extend(shard.items())
+        return result
+    def clear(self):
+        for shard, lock in zip(self._shards, self._locks):
+            with lock:
+                shard.clear()
+    def oldest_keys(self, count):
+        '''
+        Returns a list of up to count keys that were put in the cache first.
+        The oldest keys of each shard are taken, starting with the shard
+        after the one where the last call stopped.
+        '''
+        per_shard = -(-count // len(self._shards))
+        result = []
+        for i in range(len(self._shards)):
+            index = (self._next_oldest + i) & self._mask
+            with self._locks[index]:
+                result.extend(
+                    itertools.islice(self._shards[index], per_shard)
+                )
+            if len(result) >= count:
+                self._next_oldest = (index + 1) & self._mask
+                break
+        return result[:count]
+    def __reduce__(self):
+        return dict, (self.items(),)
+def free_threaded():
+    '''
+    Returns True if the threads of this Python can run at the same time
+    because its global interpreter lock is disabled.
+    '''
+    is_gil_enabled = getattr(sys, "_is_gil_enabled", None)
+    return is_gil_enabled is not None and not is_gil_enabled()
+def new_cache(contents=None):
+    '''
+    Returns a cache for a function: a ShardedCache if CacheShards is set, or
+    else a dictionary. The cache has the entries of the dictionary contents,
+    which is returned itself if a dictionary is needed.
+    '''
+    if CacheShards:
+        return ShardedCache(CacheShards, contents or ())
+    return {} if contents is None else contents
+def set_cache_shards(shards):
+    '''
+    Sets CacheShards and moves the entries of each cache in CachesByValue to
+    a new cache of that kind.
+    
+    Arguments:
+        shards: the number of shards, or None for dictionaries
+    '''
+    global CacheShards
+    CacheShards = shards
+    for function in CachesByValue:
+        function._cache = new_cache(dict(function._cache.items()))
 
-iactions.pool = multiprocessing.pool.ThreadPool()
+# Search the younger brothers of the nodes above this depth in parallel, with
+# up to this many threads from this pool for each node.
+younger_brothers_value.split_depth = 3
+# Set this to True to make parallel searches give the same moves, values, and
+# counts every time, at the cost of sharing fewer bounds.
+younger_brothers_value.deterministic = False
+younger_brothers_value.helpers = os.cpu_count() or 1
+younger_brothers_value.pool = multiprocessing.pool.ThreadPool(
+    younger_brothers_value.helpers
+)
+# Extend forced captures past the cutoff depth before evaluating states.
+minimax_value.quiescence = True
+# Count the nodes and the prunes for the output after each move.
+minimax_value.statistics = StatisticsLevel.COUNTERS
+# Let symmetric states share entries in the caches of minimax_value and
+# alpha_beta_gradual_depth.
+minimax_value.symmetry = True
+# Search quiet moves that come late at a node to a shallower cutoff depth
+# first, and skip the quiet moves at frontier nodes that cannot reach the
+# bounds. Both make the search selective, so they are off by default.
+minimax_value.late_move_reductions = False
+minimax_value.futility_pruning = False
+# Reduce the cutoff depth by this many plies for the moves from this index
+# on, at nodes with at least this many plies left before the cutoff depth.
+late_move_reduction.plies = 2
+late_move_reduction.moves = 3
+late_move_reduction.plies_left = 4
 # Set the default difficulty.
 set_difficulty(AIDifficulty.HARD)
 # Set the minimum and maximum cutoff depths.
 alpha_beta_gradual_depth.cutoff_depth_start = 6
 alpha_beta_gradual_depth.cutoff_depth_stop = 3064
+# Cache the results along the principal variation of each cutoff depth, so
+# that the search of the next move can resume where this one left off.
+alpha_beta_gradual_depth.reuse_variation = True
+# On a free-threaded build, the threads of a search look up and add entries
+# at the same time, so split the caches into shards with their own locks.
+if free_threaded():
+    CacheShards = 64
 # These caches do not need to be saved to a file.
-legal_moves._cache = {}
-move_result._cache = {}
-legal_moves_as_tuple._cache = {}
+legal_moves._cache = new_cache()
+move_result._cache = new_cache()
+legal_moves_as_tuple._cache = new_cache()
+memory_value._cache = new_cache()
+symmetry_table._cache = {}
+state_features._cache = new_cache()
+analyze_position._cache = new_cache()
+# Keep the heuristics of up to this many states.
+state_features.cache_size = 1 << 18
+# When the cache is full, evict this fraction of the states in it.
+state_features.evict_fraction = 0.25
+# When the caches use more than CacheMemoryLimit, evict entries from these
+# caches in this order. The first ones are the cheapest to compute again.
+CachesByValue = (
+    move_result,
+    legal_moves_as_tuple,
+    legal_moves,
+    analyze_position,
+    state_features,
+    memory_value,
+    minimax_value,
+    alpha_beta_gradual_depth
+)
 # Load and save these caches.
 CachesToPersist = (
     (minimax_value, common.resource("tree.minimax.pickle")),
     (alpha_beta_gradual_depth, common.resource("tree.search.pickle"))
 )
 def _cache_load():
+    # A process that multiprocessing started maps the snapshot of the caches,
+    # if there is one, instead of unpickling its own copy of them.
+    if multiprocessing.current_process().name != "MainProcess":
+        import snapshot
+        if snapshot.use_snapshot() is not None:
+            return
     for function, filename in CachesToPersist:
         try:
             with open(filename, "rb") as f:
-                function._cache = pickle.load(f)
+                function._cache = new_cache(pickle.load(f))
         except (EOFError, OSError):
-            function._cache = {}
+            function._cache = new_cache()
+def _cache_upgrade():
+    # Older versions stored a Statistics object in each result instead of the
+    # maximum depth. Convert them so that old cache files can still be used.
+    # A file has results of one version only, so a cache is only converted if
+    # its first result is old.
+    def upgrade(result):
+        v, v_move, max_depth = result
+        return v, v_move, getattr(max_depth, "max_depth", max_depth)
+    def is_old(cache, get_result):
+        for key in cache:
+            return isinstance(get_result(cache[key])[2], Statistics)
+        return False
+    cache = minimax_value._cache
+    if is_old(cache, lambda result: result):
+        for key, result in cache.items():
+            cache[key] = upgrade(result)
+    cache = alpha_beta_gradual_depth._cache
+    if is_old(cache, lambda entry: entry[1]):
+        for key, (cutoff_depth, result) in cache.items():
+            cache[key] = cutoff_depth, upgrade(result)
+def _cache_merge(function, filename):
+    # Returns the results in a saved cache file with the results of the cache
+    # of function added. A result of alpha_beta_gradual_depth only replaces a
+    # saved one if it is deeper.
+    try:
+        with open(filename, "rb") as f:
+            result = pickle.load(f)
+    except (EOFError, OSError):
+        return function._cache
+    if function is alpha_beta_gradual_depth:
+        for key, entry in function._cache.items():
+            saved = result.get(key)
+            if saved is None or saved[0] < entry[0]:
+                result[key] = entry
+    else:
+        result.update(function._cache)
+    print(
+        "Merging", len(function._cache), "new results into", repr(filename)
+    )
+    return result
 def _cache_save():
     for function, filename in CachesToPersist:
+        cache = function._cache
+        if CacheSnapshot is not None:
+            # The cache only has the results that were not in the snapshot, so
+            # add them to the saved results instead of replacing them.
+            cache = _cache_merge(function, filename)
         try:
             with open(filename, "wb") as f:
-                pickle.dump(function._cache, f)
+                pickle.dump(cache, f)
         except OSError as e:
             print("Warning: unable to save", repr(filename), "-", e)
+def clear_caches():
+    '''
+    Empties every cache, including the ones that are saved to files.
+    '''
+    for function in (
+        legal_moves,
+        move_result,
+        legal_moves_as_tuple,
+        analyze_position,
+        state_features,
+        memory_value,
+        minimax_value,
+        alpha_beta_gradual_depth
+    ):
+        function._cache.clear()
+def _deep_size(obj, seen):
+    # Returns the number of bytes in obj and everything that it contains,
+    # except the objects in seen. Objects that are shared are counted once.
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        for key, value in obj.items():
+            size += _deep_size(key, seen) + _deep_size(value, seen)
+    elif isinstance(obj, (tuple, list, frozenset, set)):
+        for item in obj:
+            size += _deep_size(item, seen)
+    elif isinstance(obj, Statistics):
+        size += _deep_size(vars(obj), seen)
+    return size
+def _oldest_keys(cache, count):
+    # Returns a list of the keys that were put in the cache first. Another
+    # thread may add to the cache while we are reading it, so try again if
+    # that happens.
+    if isinstance(cache, ShardedCache):
+        return cache.oldest_keys(count)
+    while True:
+        try:
+            return list(itertools.islice(cache, count))
+        except RuntimeError:
+            pass
+def cache_entry_size(function, seen=None):
+    '''
+    Estimates the average number of bytes in one entry of a function's cache
+    by measuring a sample of the entries.
+    
+    Arguments:
+        function: a function that has a cache
+        seen: a set of the ids of objects that have already been counted
+    '''
+    cache = function._cache
+    if seen is None:
+        seen = set()
+    sample = _oldest_keys(cache, cache_entry_size.sample_size)
+    size = 0
+    for key in sample:
+        try:
+            value = cache[key]
+        except KeyError:
+            continue
+        size += _deep_size(key, seen) + _deep_size(value, seen)
+    return size / len(sample) if sample else 0.0
+cache_entry_size.sample_size = 32
+def cache_memory_usage():
+    '''
+    Returns a dictionary that maps the name of each cache in CachesByValue to
+    the approximate number of bytes that it uses. The caches share many
+    states and moves, which are only counted for the first cache that has
+    them.
+    '''
+    seen = set()
+    return {
+        function.__name__: sys.getsizeof(function._cache) +
+            len(function._cache) * cache_entry_size(function, seen)
+        for function in CachesByValue
+    }
+def enforce_cache_memory_limit(limit=None):
+    '''
+    Evicts the oldest entries of the caches in CachesByValue, starting with the
+    first cache, until the caches use about limit bytes in total.
+    alpha_beta_gradual_depth calls this before each cutoff depth.
+    
+    Arguments:
+        limit: the number of bytes (CacheMemoryLimit by default)
+    
+    Returns:
+        The number of entries that were evicted
+    '''
+    if limit is None:
+        limit = CacheMemoryLimit
+        if limit is None:
+            return 0
+    usage = cache_memory_usage()
+    excess = sum(usage.values()) - limit
+    evicted = 0
+    for function in CachesByValue:
+        if excess <= 0:
+            break
+        cache = function._cache
+        if not cache:
+            continue
+        entry_size = usage[function.__name__] / len(cache)
+        count = min(len(cache), math.ceil(excess / entry_size))
+        for key in _oldest_keys(cache, count):
+            cache.pop(key, None)
+        evicted += count
+        excess -= count * entry_size
+    return evicted
 _cache_load()
+_cache_upgrade()
 atexit.register(_cache_save)
@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+'''
+Fills the saved search cache ahead of time. Every position that can be reached
+from the starting position within a number of plies is searched by
+alpha_beta_gradual_depth on a pool of processes, and the results are merged
+into tree.search.pickle, which is then written to the snapshot that the
+worker processes share (see snapshot.py). Run this file from the command
+line with --help for the options.
+'''
+import model, snapshot, tree
+import argparse, atexit, multiprocessing, multiprocessing.pool, os
+
+def reachable_positions(board_size, starting_rows, plies):
+    '''
+    Returns a list of the positions that can be reached from the starting
+    position in at most the given number of plies, with either player moving
+    first. Each position is a tuple of the board size, a tree.State, and
+    whether it is the red player's turn. Positions that alpha_beta_gradual_depth
+    would cache under the same key, such as symmetric positions, are only
+    listed once. Positions where the game has ended are left out.
+    '''
+    alpha = tree.UTILITY_VALUES_TERMINAL[tree.GameEnd.WIN_BLACK]
+    beta = tree.UTILITY_VALUES_TERMINAL[tree.GameEnd.WIN_RED]
+    start = model.starting_state(board_size, starting_rows)
+    frontier = [(start, False), (start, True)]
+    seen = set()
+    result = []
+    for ply in range(plies + 1):
+        next_frontier = []
+        for state, turn_red in frontier:
+            cache_key, _, _ = tree.gradual_depth_cache_key(
+                turn_red,
+                0,
+                board_size,
+                state,
+                alpha,
+                beta
+            )
+            if cache_key in seen:
+                continue
+            seen.add(cache_key)
+            if tree.game_ended(board_size, state) != tree.GameEnd.NOT_ENDED:
+                continue
+            result.append((board_size, state, turn_red))
+            moves = tree.legal_moves(board_size, state, turn_red)
+            if moves:
+                for moves_from_place in moves.values():
+                    for move in moves_from_place:
+                        next_frontier.append(
+                            (tree.move_result(state, move), not turn_red)
+                        )
+            else:
+                # The player forfeits the turn.
+                next_frontier.append((state, not turn_red))
+        frontier = next_frontier
+    return result
+def _initialize_worker(difficulty, cutoff_depth_stop):
+    # Only the parent process saves the caches.
+    atexit.unregister(tree._cache_save)
+    # A forked process does not have the threads of the parent's pool.
+    tree.younger_brothers_value.pool = multiprocessing.pool.ThreadPool(
+        tree.younger_brothers_value.helpers
+    )
+    tree.set_difficulty(difficulty)
+    if cutoff_depth_stop is not None:
+        tree.alpha_beta_gradual_depth.cutoff_depth_stop = cutoff_depth_stop
+def _search_position(arguments):
+    # Searches one position and returns the key and the entry that
+    # alpha_beta_gradual_depth cached for it, or None if there is none.
+    board_size, state, turn_red, time_limit = arguments
+    tree.search_result(
+        board_size,
+        state,
+        turn_red,
+        tree.SearchToken(),
+        time_limit=time_limit
+    )
+    cache_key, _, _ = tree.gradual_depth_cache_key(
+        turn_red,
+        0,
+        board_size,
+        state,
+        tree.UTILITY_VALUES_TERMINAL[tree.GameEnd.WIN_BLACK],
+        tree.UTILITY_VALUES_TERMINAL[tree.GameEnd.WIN_RED]
+    )
+    try:
+        return cache_key, tree.alpha_beta_gradual_depth._cache[cache_key]
+    except KeyError:
+        return None
+def merge_result(cache_key, entry):
+    '''
+    Puts an entry into the cache of alpha_beta_gradual_depth unless the cache
+    already has a result for the same key that is at least as deep.
+    
+    Returns:
+        True if the entry was put into the cache
+    '''
+    cache = tree.alpha_beta_gradual_depth._cache
+    if cache_key in cache and cache[cache_key][0] >= entry[0]:
+        return False
+    cache[cache_key] = entry
+    return True
+def warm_up(
+    board_size,
+    starting_rows,
+    plies,
+    processes=None,
+    time_limit=5.0,
+    cutoff_depth_stop=None,
+    difficulty=tree.AIDifficulty.HARD
+):
+    '''
+    Searches every position that is reachable within the given number of plies
+    and merges the results into the cache of alpha_beta_gradual_depth. The
+    cache is not saved; call tree._cache_save for that.
+    
+    Arguments:
+        board_size:
+            the number of squares in a row or column on the board
+        starting_rows:
+            the number of rows that are filled with one player's pieces at the
+            start of the game
+        plies:
+            the number of moves from the starting position to search
+        processes:
+            the number of processes to search in (the number of CPUs by
+            default)
+        time_limit:
+            the number of seconds to search each position
+        cutoff_depth_stop:
+            the cutoff depth at which to stop searching a position early, or
+            None to keep tree.alpha_beta_gradual_depth.cutoff_depth_stop
+        difficulty:
+            a member of the tree.AIDifficulty enum whose weights to search with
+    
+    Returns:
+        A tuple of the number of positions searched and the number of cache
+        entries that were added or deepened
+    '''
+    tree.set_difficulty(difficulty)
+    positions = reachable_positions(board_size, starting_rows, plies)
+    merged = 0
+    with multiprocessing.Pool(
+        processes,
+        initializer=_initialize_worker,
+        initargs=(difficulty, cutoff_depth_stop)
+    ) as pool:
+        for i, result in enumerate(
+            pool.imap_unordered(
+                _search_position,
+                [position + (time_limit,) for position in positions]
+            ),
+            start=1
+        ):
+            if result is not None and merge_result(*result):
+                merged += 1
+            print(
+                "\rSearched {} of {} positions".format(i, len(positions)),
+                end="",
+                flush=True
+            )
+    print()
+    return len(positions), merged
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--board-size",
+        type=int,
+        default=6,
+        help="the number of squares in a row or column (default: 6)"
+    )
+    parser.add_argument(
+        "--starting-rows",
+        type=int,
+        default=2,
+        help="the number of rows of pieces for each player (default: 2)"
+    )
+    parser.add_argument(
+        "--plies",
+        type=int,
+        default=4,
+        help="the number of moves from the start to search (default: 4)"
+    )
+    parser.add_argument(
+        "--processes",
+        type=int,
+        default=os.cpu_count(),
+        help="the number of processes to search in (default: the number of "
+            "CPUs)"
+    )
+    parser.add_argument(
+        "--time-limit",
+        type=float,
+        default=5.0,
+        help="the number of seconds to search each position (default: 5)"
+    )
+    parser.add_argument(
+        "--max-depth",
+        type=int,
+        help="the deepest cutoff depth to search each position to"
+    )
+    parser.add_argument(
+        "--difficulty",
+        choices=[difficulty.name for difficulty in tree.AIDifficulty],
+        default=tree.AIDifficulty.HARD.name,
+        help="the difficulty whose weights to search with (default: HARD)"
+    )
+    arguments = parser.parse_args()
+    # Save the caches once at the end instead of when the program exits.
+    atexit.unregister(tree._cache_save)
+    positions, merged = warm_up(
+        arguments.board_size,
+        arguments.starting_rows,
+        arguments.plies,
+        arguments.processes,
+        arguments.time_limit,
+        None if arguments.max_depth is None else arguments.max_depth + 1,
+        tree.AIDifficulty[arguments.difficulty]
+    )
+    tree._cache_save()
+    snapshot.write_snapshot()
+    print(
+        "Searched {} positions; added or deepened {} of the {} saved "
+        "results".format(
+            positions,
+            merged,
+            len(tree.alpha_beta_gradual_depth._cache)
+        )
+    )